@@ -0,0 +1,307 @@
+##################################################################################
+# Description
+##################################################################################
+# This module provides a minimal, in-process client for anonymous access to
+# public S3 buckets such as the NOAA open data buckets hosted by AWS.  Requests
+# are made directly against the S3 REST API without signing, so that no AWS
+# account or AWS Command Line Interface installation is required.
+#
+# Connections are persistent and kept per thread, so that a single client can
+# be shared by a pool of download threads.  The endpoint URL is configurable so
+# that the client can be pointed at a local S3 stand-in for testing, e.g.,
+#
+#     client = S3Client('noaa-gefs-pds', endpoint_url='http://localhost:9000')
+#
+# Buckets are addressed path-style as ENDPOINT_URL/BUCKET/KEY.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, ssl
+import time
+import threading
+import http.client
+import xml.etree.ElementTree as ET
+from urllib.parse import urlsplit, quote, urlencode
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# default public endpoint for anonymous S3 requests
+S3_URL = 'https://s3.amazonaws.com'
+
+# xml namespace of S3 API responses
+S3_NS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+# size of blocks streamed from the socket to disk
+CHUNK = 1024 * 1024
+
+class S3Error(Exception):
+    """ Error response from an S3 request, storing the HTTP status code """
+
+    def __init__(self, status, reason, key):
+        self.status = status
+        self.reason = reason
+        self.key = key
+        super().__init__('%s %s for key %s'%(status, reason, key))
+
+class S3Client:
+    """ Anonymous client for listing and getting objects from a public bucket
+
+    bucket is the bucket name, endpoint_url is the base URL of the S3 service
+    with scheme, e.g., 'https://s3.amazonaws.com' or 'http://localhost:9000'.
+    Connections are kept open per thread and reopened with up to retries
+    attempts on connection errors or server side errors."""
+
+    def __init__(self, bucket, endpoint_url=S3_URL, timeout=60, retries=3):
+        url = urlsplit(endpoint_url)
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url.rstrip('/')
+        self.name = self.endpoint_url + '/' + bucket
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base = url.path.rstrip('/') + '/' + bucket
+        self.timeout = timeout
+        self.retries = retries
+        self._local = threading.local()
+
+    def _conn(self, reset=False):
+        # return the persistent connection of the calling thread
+        conn = getattr(self._local, 'conn', None)
+        if reset and conn is not None:
+            conn.close()
+            conn = None
+
+        if conn is None:
+            if self.scheme == 'https':
+                conn = http.client.HTTPSConnection(self.host, self.port,
+                        timeout=self.timeout,
+                        context=ssl.create_default_context())
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port,
+                        timeout=self.timeout)
+
+            self._local.conn = conn
+
+        return conn
+
+    def _request(self, method, path, headers=None, ok=(200,)):
+        """ Makes a request on the thread connection, returning the response
+
+        The response body must be read fully by the caller before the next
+        request on the same thread.  Connection errors and 5xx responses are
+        retried with a short backoff, other status codes not in ok raise an
+        S3Error."""
+
+        for attempt in range(self.retries + 1):
+            try:
+                conn = self._conn(reset=(attempt > 0))
+                conn.request(method, path, headers=headers or {})
+                res = conn.getresponse()
+                if res.status >= 500 and attempt < self.retries:
+                    res.read()
+                    time.sleep(2 ** attempt)
+                    continue
+
+                if res.status not in ok:
+                    res.read()
+                    raise S3Error(res.status, res.reason, path)
+
+                return res
+
+            except (http.client.HTTPException, ConnectionError, TimeoutError):
+                if attempt == self.retries:
+                    raise
+
+                time.sleep(2 ** attempt)
+
+    def url(self, key):
+        # full path-style URL of an object
+        return self.endpoint_url + '/' + self.bucket + '/' + quote(key)
+
+    def list_objects(self, prefix):
+        """ Lists all objects under prefix
+
+        Returns a list of dictionaries with entries 'key', 'size' and 'etag',
+        following continuation tokens until the listing is complete."""
+
+        objs = []
+        token = None
+        while True:
+            query = {'list-type': '2', 'prefix': prefix}
+            if token:
+                query['continuation-token'] = token
+
+            res = self._request('GET', self.base + '?' + urlencode(query))
+            root = ET.fromstring(res.read())
+            for c in root.iter(S3_NS + 'Contents'):
+                objs.append({
+                             'key' : c.find(S3_NS + 'Key').text,
+                             'size': int(c.find(S3_NS + 'Size').text),
+                             'etag': c.find(S3_NS + 'ETag').text.strip('"'),
+                            })
+
+            truncated = root.find(S3_NS + 'IsTruncated')
+            if truncated is None or truncated.text != 'true':
+                break
+
+            token = root.find(S3_NS + 'NextContinuationToken').text
+
+        return objs
+
+    def read_object(self, key):
+        # returns the full contents of a small object, e.g., an inventory
+        return self._request('GET', self.base + '/' + quote(key)).read()
+
+    def get_object(self, key, path, meta=None):
+        """ Streams the object at key to the local file path
+
+        If meta is a dictionary, its 'size' and 'etag' entries are set from the
+        response headers.  Returns the number of bytes written."""
+
+        res = self._request('GET', self.base + '/' + quote(key))
+        if meta is not None:
+            meta['size'] = int(res.getheader('Content-Length'))
+            meta['etag'] = res.getheader('ETag', '').strip('"')
+
+        with open(path, 'wb') as f:
+            return _stream(res, f)
+
+    def head_object(self, key):
+        # returns the 'size' and 'etag' of an object without its contents
+        res = self._request('HEAD', self.base + '/' + quote(key))
+        res.read()
+        return {
+                'size': int(res.getheader('Content-Length')),
+                'etag': res.getheader('ETag', '').strip('"'),
+               }
+
+    def resume_object(self, key, path, meta):
+        """ Streams the object at key to path, resuming a partial file
+
+        meta is a dictionary with the expected 'size' and 'etag' of the object,
+        which may be None if unknown, in which case they are read with a HEAD
+        request before resuming.  If path exists, only the remaining bytes are
+        requested with a Range request conditional on the ETag, and the file
+        is restarted if the object has changed.  The 'size' and 'etag' entries
+        of meta are updated from the response.  Returns the number of bytes
+        written."""
+
+        offset = os.path.getsize(path) if os.path.isfile(path) else 0
+        if offset and not meta.get('etag'):
+            meta.update(self.head_object(key))
+
+        if offset and offset == meta['size']:
+            # transfer completed before the file was renamed
+            return 0
+
+        if offset and offset > meta['size']:
+            offset = 0
+
+        res, resumed = self.open_object(key, offset, meta)
+        with open(path, 'ab' if resumed else 'wb') as f:
+            return _stream(res, f)
+
+    def open_object(self, key, offset=0, meta=None):
+        """ Opens the object at key for streaming from byte offset
+
+        The remaining bytes are requested with a Range request conditional on
+        the 'etag' of meta if offset is non-zero, else the full object.  The
+        'size' and 'etag' entries of meta are set from the response if meta is
+        a dictionary.  Returns the response, to be read fully or abandoned with
+        reset, and True if it starts at offset, False if it is the full
+        object."""
+
+        meta = {} if meta is None else meta
+        headers = {}
+        if offset:
+            headers = {'Range': 'bytes=%s-'%offset}
+            if meta.get('etag'):
+                headers['If-Range'] = '"%s"'%meta['etag']
+
+        res = self._request('GET', self.base + '/' + quote(key),
+                            headers=headers, ok=(200, 206))
+        if res.status == 206:
+            meta['size'] = int(res.getheader('Content-Range').split('/')[-1])
+        else:
+            meta['size'] = int(res.getheader('Content-Length'))
+
+        meta['etag'] = res.getheader('ETag', '').strip('"')
+        return res, res.status == 206
+
+    def reset(self):
+        # closes the connection of the calling thread, e.g., after abandoning a
+        # response part way
+        self._conn(reset=True)
+
+    def get_ranges(self, key, path, ranges):
+        """ Streams byte ranges of the object at key into the local file path
+
+        ranges is a list of [start, end] inclusive byte offsets, where end may
+        be None to read to the end of the object.  The ranges are written
+        consecutively in the order given.  Returns the number of bytes written."""
+
+        size = 0
+        with open(path, 'wb') as f:
+            for start, end in ranges:
+                rng = 'bytes=%s-%s'%(start, '' if end is None else end)
+                res = self._request('GET', self.base + '/' + quote(key),
+                                    headers={'Range': rng}, ok=(206,))
+                size += _stream(res, f)
+
+        return size
+
+def _stream(res, f):
+    # copy a response body to an open file in blocks, returning the size
+    size = 0
+    while True:
+        buf = res.read(CHUNK)
+        if not buf:
+            break
+
+        f.write(buf)
+        size += len(buf)
+
+    return size
+
+##################################################################################
+# end
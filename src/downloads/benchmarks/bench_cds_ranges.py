@@ -0,0 +1,137 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks the download of a CDS result over concurrent byte
+# range connections in cds_api.py, against the local stand-in of fake_cds.py
+# with the bandwidth of each connection limited to --rate MB/s.
+#
+# A single completed task is downloaded with an increasing number of
+# connections.  The retry of interrupted ranges is timed with connections cut
+# half way through their range, and the fallback to a single stream with a
+# server which ignores Range requests.  The downloads are checked byte for
+# byte in tests/test_cds_api.py.  Run as
+#
+#     python bench_cds_ranges.py [--size-mb N] [--rate MB/S] [--conns 1 2 4 8]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import contextlib
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from cds_api import CDSClient
+from fake_cds import start_server
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def result(server):
+    # submit a task and return the client and its completed reply
+    client = CDSClient('1000:secret', url=server.api)
+    return client, client.wait(client.submit('reanalysis-era5-complete', {}))
+
+def fetch(server, path, n_conns, range_size):
+    """ Downloads a result over n_conns connections
+
+    Returns the wall time of the download and the statistics of the server."""
+
+    client, reply = result(server)
+    server.reset()
+    strt = time.perf_counter()
+    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+        client.download(reply['location'], path, n_conns=n_conns,
+                        range_size=range_size)
+
+    return time.perf_counter() - strt, dict(server.stats)
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=64,
+                        help='size of the result in MB')
+    parser.add_argument('--rate', type=float, default=16,
+                        help='bandwidth of each connection in MB/s')
+    parser.add_argument('--range-mb', type=int, default=4,
+                        help='size of the byte ranges in MB')
+    parser.add_argument('--conns', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='numbers of connections to compare')
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    kwargs = {'queue_s': 0, 'run_s': 0, 'result_size': args.size_mb * mb,
+              'rate': args.rate * mb}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'result.grib')
+        server = start_server(**kwargs)
+        print('%-8s %10s %12s'%('conns', 'time (s)', 'MB/s'))
+        walls = {}
+        for n_conns in args.conns:
+            wall, stats = fetch(server, path, n_conns, args.range_mb * mb)
+            walls[n_conns] = wall
+            print('%-8s %10.2f %12.1f'%(n_conns, wall, args.size_mb / wall))
+
+        server.shutdown()
+
+        # interrupted ranges are retried from the last byte written
+        server = start_server(drops=3, **kwargs)
+        wall, stats = fetch(server, path, max(args.conns), args.range_mb * mb)
+        server.shutdown()
+        print('Retried %s interrupted ranges, %.2f s'%(stats['dropped'], wall))
+
+        # servers without range support are read over a single stream
+        server = start_server(ranges=False, **kwargs)
+        wall, stats = fetch(server, path, max(args.conns), args.range_mb * mb)
+        server.shutdown()
+        print('Single stream fallback without ranges, %.2f s'%wall)
+
+    print('Speedup %.1fx with %s connections'%(
+          walls[min(walls)] / walls[max(walls)], max(walls)))
+
+##################################################################################
+# end
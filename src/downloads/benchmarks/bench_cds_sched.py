@@ -0,0 +1,186 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks the multi-account scheduling of ERA5 requests in
+# download_ERA5.py against the previous submission loop, with the CDS task API
+# served by the local stand-in in fake_cds.py.
+#
+# The previous loop is reproduced with its fixed pool of four threads, a fixed
+# sleep before each submission and a flat sleep when no account has fewer than
+# five active tasks, with all sleeps scaled by --scale.  Jobs submitted outside
+# the scheduler are placed on the first account, so that the live count of
+# active tasks must be respected.  The requests are checked to be downloaded
+# in both modes and the makespan, the largest number of active tasks of an
+# account and the number of throttled submissions are reported.  Run as
+#
+#     python bench_cds_sched.py [--accounts N] [--requests N] [--external N]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import concurrent.futures
+import contextlib
+import random
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import download_ERA5 as era5
+import cds_sched
+from cds_api import CDSClient, CDSError
+from fake_cds import start_server
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def legacy(server, auths, reqs, scale):
+    """ Previous submission loop with a pool of four threads, scaled sleeps """
+
+    def get_creds_to_use():
+        random.shuffle(auths)
+        for auth in auths:
+            if CDSClient(auth, url=server.api).active() < 5:
+                return auth
+
+        return None
+
+    def get_file(client, req, call):
+        # retry throttled submissions as cdsapi after its maximum sleep
+        while True:
+            try:
+                return era5.get_file(client, req, call)
+
+            except CDSError as err:
+                if not err.throttled:
+                    raise
+
+                time.sleep(120 * scale)
+
+    futures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as e:
+        for req in reqs:
+            time.sleep(15 * scale)
+            auth = None
+            while auth is None:
+                auth = get_creds_to_use()
+                if auth is None:
+                    time.sleep(60 * 60 * scale)
+
+            futures.append(e.submit(get_file, CDSClient(auth, url=server.api),
+                                    req, era5.CALL))
+
+    for future in futures:
+        future.result()
+
+def run(server, auths, down_dir, n_reqs, n_ext, scale, sched):
+    # download n_reqs daily requests, returning the makespan and statistics
+    era5.CALL = 'surf_levels'
+    era5.DATA_ROOT = down_dir + '/'
+    os.makedirs(down_dir)
+    reqs = era5.get_reqs(date(2019, 2, 1), date(2019, 2, n_reqs), 1, '00:00:00')
+
+    server.reset()
+    ext = CDSClient(auths[0], url=server.api)
+    for i in range(n_ext):
+        ext.submit('external', {})
+
+    strt = time.perf_counter()
+    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+        if sched:
+            cds_sched.run_jobs(auths, reqs, lambda client, req:
+                               era5.get_file(client, req, era5.CALL),
+                               url=server.api, poll_int=1,
+                               backoff_min=30 * scale)
+        else:
+            legacy(server, auths, reqs, scale)
+
+    wall = time.perf_counter() - strt
+    n_done = len([req for req in reqs if os.path.isfile(req[4])])
+    assert n_done == n_reqs, '%s of %s requests downloaded'%(n_done, n_reqs)
+    return wall, dict(server.stats)
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=2,
+                        help='number of CDS accounts')
+    parser.add_argument('--requests', type=int, default=16,
+                        help='number of daily requests')
+    parser.add_argument('--external', type=int, default=3,
+                        help='active jobs of the first account at the start')
+    parser.add_argument('--run-s', type=float, default=2.0,
+                        help='seconds each job is running at CDS')
+    parser.add_argument('--scale', type=float, default=0.002,
+                        help='scale of the sleeps of the previous loop')
+    args = parser.parse_args()
+
+    auths = [('%s:secret-%s'%(1000 + i, i)).encode('ascii')
+             for i in range(args.accounts)]
+    server = start_server(queue_s=0.5, run_s=args.run_s,
+                          result_size=1024 * 1024)
+
+    res = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, sched in [('legacy', False), ('sched', True)]:
+            res[name] = run(server, auths, os.path.join(tmp, name),
+                            args.requests, args.external, args.scale, sched)
+
+    server.shutdown()
+
+    print('%-8s %12s %12s %12s %12s'%('mode', 'makespan (s)', 'submitted',
+                                      'max active', 'throttled'))
+    for name in ['legacy', 'sched']:
+        wall, stats = res[name]
+        print('%-8s %12.2f %12s %12s %12s'%(name, wall, stats['submit'],
+              stats['max_active'], stats['throttled']))
+
+    print('Speedup %.1fx with %s slots over %s accounts'%(
+          res['legacy'][0] / res['sched'][0], 5 * args.accounts, args.accounts))
+
+##################################################################################
+# end
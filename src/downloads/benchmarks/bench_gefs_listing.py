@@ -0,0 +1,129 @@
+##################################################################################
+# Description
+##################################################################################
+# This script compares the number of S3 API calls made by download_GEFS_AWS.py
+# when listing the base path of each zero hour (IF_LIST = True) against
+# resolving the keys directly with gefs_keys.py (IF_LIST = False).
+#
+# For a zero hour on each side of every era boundary of the bucket layout, a
+# synthetic bucket in the layout of the era is served by fake_s3.py and the
+# zero hour is downloaded in both modes, reporting the listing / get requests
+# per cycle.  The resolver is checked in tests/test_gefs_keys.py.  Run as
+#
+#     python bench_gefs_listing.py [--fcst-max HH]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import contextlib
+import concurrent.futures
+import tempfile
+from datetime import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import download_GEFS_AWS as gefs
+import gefs_keys
+from aws_s3 import S3Client
+from fake_s3 import start_server, make_gefs_bucket
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# zero hours on each side of the era boundaries with the resolution of the
+# bucket, resolved with the default GEFS_RES
+BOUNDARIES = [
+    (dt(2018, 7, 26, 18), '1p00'),
+    (dt(2018, 7, 27, 0), '0p50'),
+    (dt(2020, 9, 22, 18), '0p50'),
+    (dt(2020, 9, 23, 0), '0p50'),
+]
+
+def run(server, down_dir, date, fcsts, if_list):
+    # download one zero hour, returning the requests and downloaded keys
+    server.reset()
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+    manifest = {}
+    os.makedirs(down_dir)
+    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+        gefs.get_cycle(client, pool, date, fcsts, down_dir, manifest,
+                       if_clob=True, if_ctrl=True, if_pert=True,
+                       if_list=if_list)
+
+    pool.shutdown()
+    return dict(server.stats), set(manifest)
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fcst-max', type=int, default=120,
+                        help='max forecast hour at 3 hour intervals')
+    args = parser.parse_args()
+
+    fcsts = [str(h) for h in range(0, args.fcst_max + 3, 3)]
+
+    print('%-14s %5s %8s %10s %10s %10s %10s'%('zero hour', 'res', 'objects',
+          'list/list', 'list/res', 'get/list', 'get/res'))
+    for date, res in BOUNDARIES:
+        gefs.GEFS_RES = None
+        n_pert = gefs_keys.gefs_layout(date)['n_pert']
+        with tempfile.TemporaryDirectory() as tmp:
+            make_gefs_bucket(os.path.join(tmp, 'bucket'), [date],
+                             [int(h) for h in fcsts], n_pert=n_pert,
+                             msg_size=24, res=res)
+            server = start_server(os.path.join(tmp, 'bucket'))
+            lst, keys_lst = run(server, os.path.join(tmp, 'list') + '/', date,
+                                fcsts, True)
+            rsv, keys_rsv = run(server, os.path.join(tmp, 'resolve') + '/',
+                                date, fcsts, False)
+            server.shutdown()
+
+        print('%-14s %5s %8s %10s %10s %10s %10s'%(date.strftime('%Y-%m-%dT%H'),
+              res, len(keys_rsv), lst.get('list', 0), rsv.get('list', 0),
+              lst.get('get', 0), rsv.get('get', 0)))
+
+##################################################################################
+# end
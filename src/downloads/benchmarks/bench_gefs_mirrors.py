@@ -0,0 +1,165 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks the hedged reads of gefs_mirrors.py through
+# download_GEFS_AWS.py.  A synthetic GEFS bucket is served by two S3 stand-ins
+# of fake_s3.py, the primary with low latency but a fraction of its object
+# requests stalled, as stragglers of a busy service, and a mirror with higher
+# but steady latency, and is also read as a local archive.  The zero hours are
+# downloaded from the primary alone, then with the mirror and with the mirror
+# and the archive after a first run collecting the transfer stats of the
+# sources, and the wall time, hedged transfers and wins of each source are
+# reported.  The downloaded trees, failover and resume are checked in
+# tests/test_gefs_mirrors.py.  Run as
+#
+#     python bench_gefs_mirrors.py [--cycles N] [--stall FRACTION SECONDS]
+#
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import collections
+import json
+import tempfile
+from datetime import datetime as dt
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import download_GEFS_AWS as gefs
+from bench_suite import data_files, quiet
+import fake_s3
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def mirror_events(root):
+    # mirror events of the last run logged under root
+    with open(os.path.join(root, gefs.TELEMETRY)) as f:
+        recs = [json.loads(line) for line in f]
+
+    strt = max([i for i, rec in enumerate(recs) if rec['event'] == 'summary'
+                and i < len(recs) - 1] + [-1]) + 1
+    return [rec for rec in recs[strt:] if rec['event'] == 'mirror']
+
+def label(name, primary):
+    # short name of a source
+    if name.startswith('file:'):
+        return 'archive'
+
+    return 'primary' if name.startswith(primary.url + '/') else 'mirror'
+
+def run(tmp, name, primary, strt, stop, workers, mirrors):
+    # download the zero hours into a fresh root, returning wall and events
+    root = os.path.join(tmp, name)
+    args = ['--start', strt.isoformat(), '--stop', stop.isoformat(),
+            '--data-root', root, '--endpoint-url', primary.url,
+            '--workers', str(workers)]
+    for spec in mirrors:
+        args += ['--mirror', spec]
+
+    status, wall = quiet(gefs.main, args)
+    assert status == 0, name + ' download failed'
+    return root, wall, mirror_events(root) if mirrors else []
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cycles', type=int, default=2,
+                        help='number of zero hours every 6 hours')
+    parser.add_argument('--fcst-max', type=int, default=12,
+                        help='max forecast hour at 3 hour intervals')
+    parser.add_argument('--members', type=int, default=4,
+                        help='number of perturbation members')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='number of GEFS download threads')
+    parser.add_argument('--stall', type=float, nargs=2, default=[0.05, 2.0],
+                        metavar=('FRACTION', 'SECONDS'),
+                        help='object requests of the primary stalled')
+    args = parser.parse_args()
+
+    strt = dt(2021, 1, 26, 0)
+    stop = strt + timedelta(hours=6 * (args.cycles - 1))
+    gefs.FCST_MAX = args.fcst_max
+    with tempfile.TemporaryDirectory() as tmp:
+        dates = [strt + timedelta(hours=6 * i) for i in range(args.cycles)]
+        fake_s3.make_gefs_bucket(os.path.join(tmp, 'bucket'), dates,
+                                 list(range(0, args.fcst_max + 3, 3)),
+                                 n_pert=args.members)
+        bucket = os.path.join(tmp, 'bucket', 'noaa-gefs-pds')
+        primary = fake_s3.start_server(os.path.join(tmp, 'bucket'),
+                                       latency=0.01, stall=args.stall)
+        mirror = fake_s3.start_server(os.path.join(tmp, 'bucket'),
+                                      latency=0.05)
+        mirror_url = mirror.url + '/noaa-gefs-pds'
+
+        # transfer stats shared by the runs, collected by a first run
+        gefs.MIRROR_STATS = os.path.join(tmp, 'mirrors.json')
+        run(tmp, 'warmup', primary, strt, stop, args.workers, [mirror_url])
+
+        print('%-20s %8s %10s %8s %8s %8s  %s'%('sources', 'files',
+              'wall (s)', 'MB/s', 'stalled', 'hedged', 'wins'))
+        walls = {}
+        stalled = {}
+        for name, mirrors in [('primary', []),
+                              ('primary+mirror', [mirror_url]),
+                              ('primary+mirror+dir', [mirror_url, bucket])]:
+            primary.reset()
+            root, walls[name], events = run(tmp, name, primary, strt, stop,
+                                            args.workers, mirrors)
+            sizes = data_files(root)
+            wins = collections.Counter([label(rec['source'], primary)
+                                        for rec in events])
+            n_hedged = sum([rec['hedged'] for rec in events])
+            stalled[name] = primary.stats.get('stalled', 0)
+            print('%-20s %8s %10.2f %8.1f %8s %8s  %s'%(name, len(sizes),
+                  walls[name], sum(sizes.values()) / walls[name] / 1e6,
+                  stalled[name], n_hedged, ' '.join(['%s=%s'%(src, n) for
+                                                     src, n in sorted(
+                                                     wins.items())])))
+
+##################################################################################
+# end
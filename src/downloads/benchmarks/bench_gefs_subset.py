@@ -0,0 +1,175 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks byte range subsetting of GEFS objects against full file
+# downloads in download_GEFS_AWS.py.  A synthetic GEFS bucket is served by the
+# local S3 stand-in in fake_s3.py and a single zero hour is downloaded in both
+# modes, reporting the bytes moved over the wire, the bytes written to scratch
+# and the wall time.  The subset files are checked to be a sequence of whole
+# GRIB2 messages.  Run as
+#
+#     python bench_gefs_subset.py [--members N] [--fcst-max HH] [--msg-kb KB]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import contextlib
+import concurrent.futures
+import tempfile
+import time
+from datetime import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import download_GEFS_AWS as gefs
+import grib_idx
+from aws_s3 import S3Client
+from fake_s3 import start_server, make_gefs_bucket
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def check_grib2(path):
+    """ Verifies that a file is a sequence of whole GRIB2 messages
+
+    Returns the number of messages, raises ValueError for a malformed file."""
+
+    n_msg = 0
+    with open(path, 'rb') as f:
+        while True:
+            head = f.read(16)
+            if not head:
+                return n_msg
+
+            if head[:4] != b'GRIB' or head[7] != 2:
+                raise ValueError('bad GRIB2 indicator in ' + path)
+
+            size = int.from_bytes(head[8:16], 'big')
+            f.seek(size - 20, 1)
+            if f.read(4) != b'7777':
+                raise ValueError('bad GRIB2 end section in ' + path)
+
+            n_msg += 1
+
+def run(server, down_dir, date, fcsts, n_workers, fields):
+    # download one zero hour, returning wall time, transfer and scratch bytes
+    server.reset()
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+    strt = time.perf_counter()
+    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+        os.makedirs(down_dir)
+        n_obj, _ = gefs.get_cycle(client, pool, date, fcsts, down_dir, {},
+                                  if_clob=True, if_ctrl=True, if_pert=True,
+                                  fields=fields)
+
+    wall = time.perf_counter() - strt
+    pool.shutdown()
+
+    disk = 0
+    paths = []
+    for root, dirs, files in os.walk(down_dir):
+        for fname in files:
+            if fname.startswith('.'):
+                # manifest of the download directory
+                continue
+
+            paths.append(os.path.join(root, fname))
+            disk += os.path.getsize(paths[-1])
+
+    return {
+            'objects': n_obj,
+            'wall_s' : wall,
+            'wire'   : server.stats['bytes'],
+            'disk'   : disk,
+            'paths'  : paths,
+           }
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=4,
+                        help='number of perturbation members')
+    parser.add_argument('--fcst-max', type=int, default=12,
+                        help='max forecast hour at 3 hour intervals')
+    parser.add_argument('--msg-kb', type=int, default=64,
+                        help='size of each synthetic GRIB2 message in KiB')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='number of download threads')
+    args = parser.parse_args()
+
+    date = dt(2021, 1, 26, 0)
+    fcsts = [str(h) for h in range(0, args.fcst_max + 3, 3)]
+    fields = grib_idx.vtable_fields(gefs.VTABLE)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print('Generating synthetic bucket in ' + tmp)
+        make_gefs_bucket(os.path.join(tmp, 'bucket'), [date],
+                         [int(h) for h in fcsts], n_pert=args.members,
+                         msg_size=args.msg_kb * 1024)
+        server = start_server(os.path.join(tmp, 'bucket'))
+
+        full = run(server, os.path.join(tmp, 'full') + '/', date, fcsts,
+                   args.workers, None)
+        sub = run(server, os.path.join(tmp, 'subset') + '/', date, fcsts,
+                  args.workers, fields)
+        server.shutdown()
+
+        n_msg = sum([check_grib2(path) for path in sub['paths']])
+        print('Subset files verified: %s GRIB2 messages in %s files'%(
+              n_msg, len(sub['paths'])))
+
+    print('%-8s %8s %10s %12s %12s'%('mode', 'objects', 'wall (s)',
+                                     'wire (MiB)', 'disk (MiB)'))
+    for name, res in [('full', full), ('subset', sub)]:
+        print('%-8s %8s %10.2f %12.1f %12.1f'%(name, res['objects'],
+              res['wall_s'], res['wire'] / 2**20, res['disk'] / 2**20))
+
+    print('Reduction: %.1fx bytes moved, %.1fx scratch, %.1fx wall time'%(
+          full['wire'] / sub['wire'], full['disk'] / sub['disk'],
+          full['wall_s'] / sub['wall_s']))
+
+##################################################################################
+# end
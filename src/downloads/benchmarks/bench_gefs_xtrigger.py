@@ -0,0 +1,189 @@
+##################################################################################
+# Description
+##################################################################################
+# This script runs the gefs_ready xtrigger in a stub ensemble suite and
+# compares the time to the first forecast when the GEFS data is staged for all
+# cycles before the suite starts, against running the downloader in the
+# background while the suite polls the xtrigger.
+#
+# A synthetic bucket with latency is served by fake_s3.py, and a stub flow.cylc
+# of the lagged ensemble background workflow is planned with cycle_plan.py.
+# Each ungrib task of the stub suite waits for the xtrigger of its cycle point
+# and member, then sleeps for the duration of the WPS / real tasks.  The
+# xtrigger is checked in tests/test_gefs_ready.py.  Run as
+#
+#     python bench_gefs_xtrigger.py [--cycles N] [--members N] [--task-s S]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import contextlib
+import concurrent.futures
+import tempfile
+import threading
+import time
+from datetime import datetime as dt
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import download_GEFS_AWS as gefs
+import cycle_plan
+from gefs_ready import gefs_ready
+from aws_s3 import S3Client
+from fake_s3 import start_server, make_gefs_bucket
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# stub of the ensemble background workflow settings
+FLOW = """{%% set LAG = '06' %%}
+{%% set CYC_STRT = '%s' %%}
+{%% set CYC_STOP = '%s' %%}
+{%% set CYC_INC = 6 %%}
+{%% set ENS_SIZE = %s %%}
+{%% set ENS_BKG_DATA = 'GEFS' %%}
+{%% set ENS_BKG_INT = '03' %%}
+        {%% for mem in range(1,ENS_SIZE) %%}
+"""
+
+def fetch(server, groups, data_root, n_workers):
+    # download the plan groups in cycle order
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+    gefs.get_plan(client, pool, groups, data_root)
+    pool.shutdown()
+
+def task(point, member, data_root, task_s, poll, strt, starts):
+    # stub ungrib task waiting on the xtrigger of its cycle point / member
+    while not gefs_ready(point, member, data_root, lag=6, fcst_hrs=12,
+                         bkg_int=3)[0]:
+        time.sleep(poll)
+
+    starts.append(time.perf_counter() - strt)
+    time.sleep(task_s)
+
+def run_suite(server, groups, data_root, cycles, members, task_s, staged,
+              n_workers, poll=0.05):
+    """ Runs the stub suite, returning the first task start and the makespan
+
+    With staged True, all groups are downloaded before the suite starts,
+    otherwise the downloader runs in a background thread."""
+
+    starts = []
+    strt = time.perf_counter()
+    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+        fetcher = threading.Thread(target=fetch, args=(server, groups,
+                                                       data_root, n_workers))
+        fetcher.start()
+        if staged:
+            fetcher.join()
+
+        tasks = []
+        for cycle in cycles:
+            point = cycle.strftime('%Y%m%dT%H%MZ')
+            for mem in range(1, members + 1):
+                tasks.append(threading.Thread(target=task, args=(point, mem,
+                             data_root, task_s, poll, strt, starts)))
+                tasks[-1].start()
+
+        for thread in tasks:
+            thread.join()
+
+        fetcher.join()
+
+    return min(starts), time.perf_counter() - strt
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cycles', type=int, default=4,
+                        help='number of cycle points of the stub suite')
+    parser.add_argument('--members', type=int, default=4,
+                        help='number of perturbation members')
+    parser.add_argument('--task-s', type=float, default=1.0,
+                        help='duration of the stub WPS / real tasks in seconds')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='latency of the fake bucket in seconds')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of download threads')
+    args = parser.parse_args()
+
+    cyc_strt = dt(2021, 1, 26, 6)
+    cycles = [cyc_strt + timedelta(hours=6 * i) for i in range(args.cycles)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flow = os.path.join(tmp, 'flow.cylc')
+        with open(flow, 'w') as f:
+            f.write(FLOW%(cycles[0].strftime('%Y-%m-%dT%H'),
+                          cycles[-1].strftime('%Y-%m-%dT%H'), args.members + 1))
+
+        plan, stats = cycle_plan.cycle_plan([flow])
+        groups = cycle_plan.plan_groups(plan)
+        make_gefs_bucket(os.path.join(tmp, 'bucket'),
+                         [cycle - timedelta(hours=6) for cycle in cycles],
+                         list(range(0, 13, 3)), n_pert=args.members,
+                         msg_size=16 * 1024)
+        server = start_server(os.path.join(tmp, 'bucket'),
+                              latency=args.latency)
+
+        res = {}
+        for name, staged in [('staged', True), ('overlap', False)]:
+            res[name] = run_suite(server, groups, os.path.join(tmp, name),
+                                  cycles, args.members, args.task_s, staged,
+                                  args.workers)
+
+        server.shutdown()
+
+    print('%-8s %18s %14s'%('mode', 'first task (s)', 'makespan (s)'))
+    for name in ['staged', 'overlap']:
+        print('%-8s %18.2f %14.2f'%(name, res[name][0], res[name][1]))
+
+    print('Time to first forecast reduced %.1fx, makespan %.1fx'%(
+          res['staged'][0] / res['overlap'][0],
+          res['staged'][1] / res['overlap'][1]))
+
+##################################################################################
+# end
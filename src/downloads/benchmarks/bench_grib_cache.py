@@ -0,0 +1,169 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks the GRIB cache of grib_cache.py shared by experiments
+# downloading the same GEFS objects into different DATA_ROOT trees.  A
+# synthetic GEFS bucket is served by the local S3 stand-in in fake_s3.py and
+# the same zero hour is downloaded by a number of experiments, with and without
+# a cache shared between them, reporting the bytes moved over the wire, the
+# distinct bytes on disk and the wall time, and the cache is then evicted to
+# half of its size.  The cached files and the download of files linked to
+# evicted entries are checked in tests/test_grib_cache.py.  Run as
+#
+#     python bench_grib_cache.py [--exps N] [--members N] [--fcst-max HH]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import contextlib
+import concurrent.futures
+import tempfile
+import time
+from datetime import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import download_GEFS_AWS as gefs
+from aws_s3 import S3Client
+from grib_cache import Cache
+from fake_s3 import start_server, make_gefs_bucket
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def data_files(root):
+    # relative paths of the data files under root, without manifests
+    paths = []
+    for head, dirs, files in os.walk(root):
+        for fname in files:
+            if not fname.startswith('.'):
+                paths.append(os.path.relpath(os.path.join(head, fname), root))
+
+    return sorted(paths)
+
+def disk_use(roots):
+    # bytes of the distinct inodes of the data files under roots
+    inodes = {}
+    for root in roots:
+        for path in data_files(root):
+            st = os.stat(os.path.join(root, path))
+            inodes[(st.st_dev, st.st_ino)] = st.st_size
+
+    return sum(inodes.values())
+
+def run(server, tmp, name, date, fcsts, n_exps, n_workers, cache):
+    # download the zero hour into n_exps experiment roots
+    server.reset()
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+    roots = []
+    strt = time.perf_counter()
+    for i in range(n_exps):
+        roots.append(os.path.join(tmp, name, 'exp%s'%i) + '/')
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            os.makedirs(roots[-1])
+            gefs.get_cycle(client, pool, date, fcsts, roots[-1], {},
+                           if_clob=True, if_ctrl=True, if_pert=True,
+                           cache=cache)
+
+    wall = time.perf_counter() - strt
+    pool.shutdown()
+
+    return {
+            'files'  : len(data_files(roots[0])) * n_exps,
+            'wall_s' : wall,
+            'wire'   : server.stats['bytes'],
+            'disk'   : disk_use(roots),
+           }
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exps', type=int, default=3,
+                        help='number of experiments downloading the same data')
+    parser.add_argument('--members', type=int, default=4,
+                        help='number of perturbation members')
+    parser.add_argument('--fcst-max', type=int, default=12,
+                        help='max forecast hour at 3 hour intervals')
+    parser.add_argument('--msg-kb', type=int, default=64,
+                        help='size of each synthetic GRIB2 message in KiB')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='number of download threads')
+    args = parser.parse_args()
+
+    date = dt(2021, 1, 26, 0)
+    fcsts = [str(h) for h in range(0, args.fcst_max + 3, 3)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print('Generating synthetic bucket in ' + tmp)
+        make_gefs_bucket(os.path.join(tmp, 'bucket'), [date],
+                         [int(h) for h in fcsts], n_pert=args.members,
+                         msg_size=args.msg_kb * 1024)
+        server = start_server(os.path.join(tmp, 'bucket'))
+
+        cache = Cache(os.path.join(tmp, 'cache'))
+        plain = run(server, tmp, 'plain', date, fcsts, args.exps,
+                    args.workers, None)
+        cached = run(server, tmp, 'cached', date, fcsts, args.exps,
+                     args.workers, cache)
+        server.shutdown()
+
+        n_entries, size = cache.usage()
+        n_evict, freed = cache.evict(size / 2)
+        print('Cache: %s entries, %.1f MiB, evicted %s entries, %.1f MiB to '
+              'half'%(n_entries, size / 2**20, n_evict, freed / 2**20))
+
+    print('%-8s %8s %10s %12s %12s'%('mode', 'files', 'wall (s)',
+                                     'wire (MiB)', 'disk (MiB)'))
+    for name, res in [('plain', plain), ('cached', cached)]:
+        print('%-8s %8s %10.2f %12.1f %12.1f'%(name, res['files'],
+              res['wall_s'], res['wire'] / 2**20, res['disk'] / 2**20))
+
+    print('Reduction: %.1fx bytes moved, %.1fx scratch, %.1fx wall time'%(
+          plain['wire'] / cached['wire'], plain['disk'] / cached['disk'],
+          plain['wall_s'] / cached['wall_s']))
+
+##################################################################################
+# end
@@ -0,0 +1,167 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks the catalog of grib_catalog.py against checking the
+# holdings of a DATA_ROOT tree with globs and isfile calls.  A synthetic tree
+# of GEFS files is written in the layout of download_GEFS_AWS.py, with GRIB2
+# messages carrying the reference and forecast times of each file, and the
+# catalog is built by crawling the tree with one and with several threads.
+# Every cycle is then checked for completeness over all members, forecast
+# hours and streams, with the catalog and over the file system, after
+# removing one file.  The catalog is checked in tests/test_grib_catalog.py.
+# Run as
+#
+#     python bench_grib_catalog.py [--days N] [--members N] [--fcst-max HH]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import glob
+import tempfile
+import time
+from datetime import datetime as dt
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import gefs_keys
+from grib_catalog import Catalog
+from fake_s3 import grib2_message
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def write_tree(data_root, cycles, members, fhrs, n_msgs, msg_size):
+    # GEFS files of each cycle flat in date stamped directories of data_root
+    paths = []
+    for cycle in cycles:
+        down_dir = os.path.join(data_root, cycle.strftime('%Y%m%d'))
+        os.makedirs(down_dir, exist_ok=True)
+        for mem in members:
+            for fhr in fhrs:
+                for stream in ['a', 'b']:
+                    key = gefs_keys.gefs_key(cycle, mem, fhr, stream)
+                    paths.append(os.path.join(down_dir, key.split('/')[-1]))
+                    with open(paths[-1], 'wb') as f:
+                        for i in range(n_msgs):
+                            f.write(grib2_message(msg_size, ref=cycle,
+                                                  fhr=fhr))
+
+    return paths
+
+def fs_missing(data_root, cycle, members, fhrs):
+    # missing files of a cycle from a glob of its directory and isfile checks
+    down_dir = os.path.join(data_root, cycle.strftime('%Y%m%d'))
+    found = set(glob.glob(os.path.join(down_dir, '*.f???')))
+    missing = []
+    for mem in members:
+        for fhr in fhrs:
+            for stream in ['a', 'b']:
+                path = os.path.join(down_dir, gefs_keys.gefs_key(cycle, mem,
+                                    fhr, stream).split('/')[-1])
+                if path not in found or not os.path.isfile(path):
+                    missing.append((mem, fhr, stream))
+
+    return missing
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=4,
+                        help='number of days of zero hours every 6 hours')
+    parser.add_argument('--members', type=int, default=30,
+                        help='number of perturbation members')
+    parser.add_argument('--fcst-max', type=int, default=6,
+                        help='max forecast hour at 3 hour intervals')
+    parser.add_argument('--msgs', type=int, default=20,
+                        help='number of messages per file')
+    parser.add_argument('--workers', type=int, default=16,
+                        help='number of threads crawling the tree')
+    args = parser.parse_args()
+
+    strt = dt(2021, 1, 26, 0)
+    cycles = [strt + timedelta(hours=6 * i) for i in range(4 * args.days)]
+    members = list(range(1, args.members + 1))
+    fhrs = list(range(0, args.fcst_max + 3, 3))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_root = os.path.join(tmp, 'GEFS')
+        paths = write_tree(data_root, cycles, members, fhrs, args.msgs, 4096)
+        print('Synthetic tree of %s files in %s'%(len(paths), data_root))
+
+        print('%-10s %8s %10s'%('crawl', 'threads', 'wall (s)'))
+        for n_workers in [1, args.workers]:
+            catalog = Catalog(os.path.join(tmp, 'catalog%s.sqlite'%n_workers))
+            t0 = time.perf_counter()
+            n_read, n_same, n_gone = catalog.rebuild(data_root, n_workers)
+            print('%-10s %8s %10.2f'%('rebuild', n_workers,
+                                      time.perf_counter() - t0))
+
+        t0 = time.perf_counter()
+        catalog.rebuild(data_root, args.workers)
+        print('%-10s %8s %10.2f'%('refresh', args.workers,
+                                  time.perf_counter() - t0))
+
+        # one file removed, picked up by the crawl of the tree
+        os.remove(paths[len(paths) // 2])
+        catalog.rebuild(data_root, args.workers)
+
+        t0 = time.perf_counter()
+        cat = [catalog.missing(cycle.strftime('%Y%m%d%H'), members, fhrs)
+               for cycle in cycles]
+        cat_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        fs = [fs_missing(data_root, cycle, members, fhrs) for cycle in cycles]
+        fs_s = time.perf_counter() - t0
+        catalog.close()
+
+    print('Completeness of %s cycles x %s members x %s forecast hours x 2 '
+          'streams'%(len(cycles), len(members), len(fhrs)))
+    print('%-10s %14s'%('check', 'per cycle (ms)'))
+    print('%-10s %14.2f'%('catalog', 1e3 * cat_s / len(cycles)))
+    print('%-10s %14.2f'%('glob', 1e3 * fs_s / len(cycles)))
+
+##################################################################################
+# end
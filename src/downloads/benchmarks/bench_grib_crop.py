@@ -0,0 +1,220 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks the regional crop of grib_crop.py run as a stage of
+# grib_stages.py.  Synthetic global fields on regular lat-lon grids with
+# simple packing are written as GRIB2 files at 0.5 degrees, as the GEFS
+# files after the to_simple stage, and as GRIB1 files at 0.25 degrees, as the
+# ERA5 files after to_grib1, with random values of 12 and 16 bits and north to
+# south and south to north scanning.  The files are cropped on a process pool
+# to a West Coast box plus a margin and to a box across the Greenwich
+# meridian, keeping the originals, and the bytes saved and the wall time are
+# reported.  The cropped values are checked in tests/test_grib_crop.py.  Run as
+#
+#     python bench_grib_crop.py [--files N] [--msgs N] [--procs N]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import random
+import tempfile
+import time
+from datetime import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from grib_crop import crop_spec
+from grib_stages import StagePool
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# West Coast box and margin in degrees, and a box across the seam of the grids
+BOXES = [
+         ((25, 55, -150, -110), 2),
+         ((35, 60, -15, 20), 0),
+        ]
+
+def packed(n_pts, nbits):
+    # random packed values of nbits for n_pts points, padded to whole octets
+    vals = random.getrandbits(n_pts * nbits)
+    pad = -n_pts * nbits % 8
+    return (vals << pad).to_bytes((n_pts * nbits + pad) // 8, 'big')
+
+def grib2_field(ref, ni, nj, step, nbits, scan, bitmap=False):
+    """ Generates a GRIB2 message of a global regular lat-lon field
+
+    The grid of template 3.0 in microdegrees starts at the north pole for
+    scanning mode 0 or the south pole for scanning mode 0x40, the data is
+    simple packed with template 5.0, with a random bitmap of the points
+    present if bitmap is True."""
+
+    la1 = -90000000 if scan & 0x40 else 90000000
+    sec1 = (21).to_bytes(4, 'big') + bytes([1, 0, 7, 0, 0, 2, 0, 1]) +\
+           ref.year.to_bytes(2, 'big') + bytes([ref.month, ref.day, ref.hour,
+                                                0, 0, 0, 1])
+    sec3 = (72).to_bytes(4, 'big') + bytes([3, 0]) +\
+           (ni * nj).to_bytes(4, 'big') + bytes([0, 0, 0, 0, 6]) +\
+           bytes(15) + ni.to_bytes(4, 'big') + nj.to_bytes(4, 'big') +\
+           bytes(4) + (0xffffffff).to_bytes(4, 'big') +\
+           ((1 << 31) | 90000000 if la1 < 0 else la1).to_bytes(4, 'big') +\
+           bytes(4) + bytes([48]) +\
+           ((1 << 31) | 90000000 if la1 > 0 else 90000000).to_bytes(4, 'big') +\
+           (360000000 - step).to_bytes(4, 'big') +\
+           step.to_bytes(4, 'big') + step.to_bytes(4, 'big') + bytes([scan])
+    sec4 = (34).to_bytes(4, 'big') + bytes([4, 0, 0, 0, 0, 0, 0, 2, 0, 0, 0,
+                                            0, 0, 1]) +\
+           bytes(4) + bytes([100, 0]) + (50000).to_bytes(4, 'big') + bytes(6)
+    n_vals = ni * nj
+    sec6 = (6).to_bytes(4, 'big') + bytes([6, 255])
+    if bitmap:
+        bits = packed(ni * nj, 1)
+        n_vals = int.from_bytes(bits, 'big').bit_count()
+        sec6 = (6 + len(bits)).to_bytes(4, 'big') + bytes([6, 0]) + bits
+
+    sec5 = (21).to_bytes(4, 'big') + bytes([5]) +\
+           n_vals.to_bytes(4, 'big') + bytes([0, 0]) +\
+           bytes.fromhex('43a00000') + bytes([0x80, 2, 0, 1, nbits, 0])
+    data = packed(n_vals, nbits)
+    sec7 = (5 + len(data)).to_bytes(4, 'big') + bytes([7]) + data
+    body = sec1 + sec3 + sec4 + sec5 + sec6 + sec7
+    return b'GRIB\x00\x00\x00\x02' + (16 + len(body) + 4).to_bytes(8, 'big') +\
+           body + b'7777'
+
+def grib1_field(ref, ni, nj, step, nbits, scan, bitmap=False):
+    # GRIB1 message of a global regular lat-lon field with simple packing,
+    # with a random bitmap of the points present if bitmap is True
+    la1 = -90000 if scan & 0x40 else 90000
+    pds = (28).to_bytes(3, 'big') + bytes([128, 98, 0, 255,
+                                           192 if bitmap else 128, 130, 109]) +\
+          (1).to_bytes(2, 'big') + bytes([(ref.year - 1) % 100 + 1, ref.month,
+                                          ref.day, ref.hour, 0, 1, 0, 0, 0, 0,
+                                          0, 0, (ref.year - 1) // 100 + 1, 0,
+                                          0x80, 1])
+    s24 = lambda val: ((1 << 23) | -val if val < 0 else val).to_bytes(3, 'big')
+    gds = (32).to_bytes(3, 'big') + bytes([0, 255, 0]) +\
+          ni.to_bytes(2, 'big') + nj.to_bytes(2, 'big') + s24(la1) + s24(0) +\
+          bytes([128]) + s24(-la1) + s24(360000 - step) +\
+          step.to_bytes(2, 'big') + step.to_bytes(2, 'big') + bytes([scan]) +\
+          bytes(4)
+    n_vals = ni * nj
+    bms = b''
+    if bitmap:
+        bits = packed(ni * nj, 1)
+        n_vals = int.from_bytes(bits, 'big').bit_count()
+        if (6 + len(bits)) % 2:
+            bits += b'\x00'
+
+        bms = (6 + len(bits)).to_bytes(3, 'big') +\
+              bytes([8 * len(bits) - ni * nj, 0, 0]) + bits
+
+    data = packed(n_vals, nbits)
+    if (11 + len(data)) % 2:
+        data += b'\x00'
+
+    unused = 8 * len(data) - n_vals * nbits
+    bds = (11 + len(data)).to_bytes(3, 'big') + bytes([unused, 0x80, 2]) +\
+          bytes.fromhex('43a00000') + bytes([nbits]) + data
+    body = pds + gds + bms + bds
+    return b'GRIB' + (8 + len(body) + 4).to_bytes(3, 'big') + b'\x01' + body +\
+           b'7777'
+
+def write_file(path, edition, n_msgs, nbits, scan):
+    # file of n_msgs global fields, 0.5 degree GRIB2 or 0.25 degree GRIB1,
+    # every other field with a bitmap as the sea / land fields
+    with open(path, 'wb') as f:
+        for i in range(n_msgs):
+            if edition == 2:
+                f.write(grib2_field(dt(2021, 1, 26), 720, 361, 500000, nbits,
+                                    scan, bitmap=i % 2 == 1))
+            else:
+                f.write(grib1_field(dt(2019, 2, 8), 1440, 721, 250, nbits,
+                                    scan, bitmap=i % 2 == 1))
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=4,
+                        help='number of files of each kind')
+    parser.add_argument('--msgs', type=int, default=4,
+                        help='number of messages per file')
+    parser.add_argument('--procs', type=int, default=4,
+                        help='number of processes running the crop')
+    args = parser.parse_args()
+
+    random.seed(1)
+    kinds = [(2, 16, 0x00), (2, 12, 0x40), (1, 16, 0x00), (1, 12, 0x40)]
+    print('%-26s %8s %12s %12s %8s %10s'%('box', 'files', 'full (MB)',
+          'crop (MB)', 'saved', 'wall (s)'))
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for edition, nbits, scan in kinds:
+            for i in range(args.files):
+                paths.append(os.path.join(tmp, 'ed%s_%sbit_%s_%s.grib'%(
+                             edition, nbits, scan, i)))
+                write_file(paths[-1], edition, args.msgs, nbits, scan)
+
+        for box, margin in BOXES:
+            spec = crop_spec(box, margin)
+            t0 = time.perf_counter()
+            pool = StagePool([spec], n_procs=args.procs, keep=True)
+            with open(os.devnull, 'w') as f:
+                stdout, sys.stdout = sys.stdout, f
+                for path in paths:
+                    pool.submit(path)
+
+                failed = pool.close()
+                sys.stdout = stdout
+
+            wall = time.perf_counter() - t0
+            assert not failed, 'crop failed: %s'%failed
+
+            full = sum([os.path.getsize(path) for path in paths])
+            crop = sum([os.path.getsize(path + '.1') for path in paths])
+            print('%-26s %8s %12.1f %12.1f %7.1f%% %10.2f'%(spec, len(paths),
+                  full / 1e6, crop / 1e6, 100 * (1 - crop / full), wall))
+
+##################################################################################
+# end
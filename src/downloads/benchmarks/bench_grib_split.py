@@ -0,0 +1,157 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks the per-cycle reads of multi-day ERA5 GRIB files with
+# and without the cycle split of grib_split.py.
+#
+# Synthetic GRIB1 and GRIB2 files are written with hourly messages over a
+# number of days, carrying reference / forecast times in the sections read by
+# the scanner.  The files are indexed and split into six hourly cycle windows,
+# and the bytes and time to read the data of every cycle are compared between
+# reading the full multi-day file for each cycle, as with linking the
+# downloads directly, and reading the cycle files.  The cycle files are
+# checked in tests/test_grib_split.py.  Run as
+#
+#     python bench_grib_split.py [--days N] [--msgs N] [--msg-kb N]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import tempfile
+import time
+from datetime import datetime as dt
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import grib_split
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def grib2_timed(size, ref, fhr):
+    """ Generates a GRIB2 message of size bytes with reference time / forecast
+
+    The message has the indicator, identification section 1, product
+    definition section 4 of template 4.0 in hours, a data section 7 padding to
+    size and the end section."""
+
+    sec1 = (21).to_bytes(4, 'big') + bytes([1, 0, 98, 0, 0, 2, 0, 1]) +\
+           ref.year.to_bytes(2, 'big') + bytes([ref.month, ref.day, ref.hour,
+                                                ref.minute, 0, 0, 0])
+    sec4 = (34).to_bytes(4, 'big') + bytes([4, 0, 0, 0, 0, 0, 0, 2, 0, 0, 0,
+                                            0, 0, 1]) +\
+           fhr.to_bytes(4, 'big') + bytes(12)
+    body = size - 16 - len(sec1) - len(sec4) - 4
+    sec7 = body.to_bytes(4, 'big') + bytes([7]) + bytes(body - 5)
+    return b'GRIB\x00\x00\x00\x02' + size.to_bytes(8, 'big') + sec1 + sec4 +\
+           sec7 + b'7777'
+
+def grib1_timed(size, ref, fhr):
+    # GRIB1 message of size bytes with a product definition section in hours
+    pds = (28).to_bytes(3, 'big') + bytes([128, 98, 0, 255, 128, 130, 109]) +\
+          (1).to_bytes(2, 'big') + bytes([(ref.year - 1) % 100 + 1, ref.month,
+                                          ref.day, ref.hour, ref.minute, 1,
+                                          fhr, 0, 0, 0, 0, 0,
+                                          (ref.year - 1) // 100 + 1, 0, 0, 0])
+    return b'GRIB' + size.to_bytes(3, 'big') + b'\x01' + pds +\
+           bytes(size - 8 - len(pds) - 4) + b'7777'
+
+def write_file(path, strt, days, n_msgs, msg_size, edition):
+    # hourly analysis messages over days from strt, n_msgs per valid time
+    message = grib2_timed if edition == 2 else grib1_timed
+    with open(path, 'wb') as f:
+        for hr in range(24 * days):
+            for i in range(n_msgs):
+                f.write(message(msg_size, strt + timedelta(hours=hr), 0))
+
+def read_all(paths):
+    # read files in full as ungrib scanning them, returning the bytes read
+    nbytes = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            for buf in iter(lambda: f.read(1024 * 1024), b''):
+                nbytes += len(buf)
+
+    return nbytes
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=4,
+                        help='number of days of each file')
+    parser.add_argument('--msgs', type=int, default=20,
+                        help='number of messages per valid time')
+    parser.add_argument('--msg-kb', type=int, default=64,
+                        help='size of each message in kB')
+    args = parser.parse_args()
+
+    strt = dt(2019, 2, 8)
+    stop = strt + timedelta(days=args.days - 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        print('%-8s %8s %10s %14s %14s %12s'%('edition', 'cycles', 'split (s)',
+              'full read (MB)', 'cycle read (MB)', 'speedup'))
+        for edition in [1, 2]:
+            path = os.path.join(tmp, '%s--%s_ed%s.grib'%(strt.date(),
+                                stop.date(), edition))
+            write_file(path, strt, args.days, args.msgs, args.msg_kb * 1024,
+                       edition)
+
+            out_root = os.path.join(tmp, 'cycles%s'%edition)
+            t0 = time.perf_counter()
+            outs = grib_split.split_file(path, out_root, 6)
+            split_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            full = sum([read_all([path]) for out in outs])
+            full_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            cyc = sum([read_all([out]) for out in outs])
+            cyc_s = time.perf_counter() - t0
+            print('%-8s %8s %10.2f %14.1f %14.1f %11.1fx'%(edition, len(outs),
+                  split_s, full / 1024**2, cyc / 1024**2, full_s / cyc_s))
+
+##################################################################################
+# end
@@ -0,0 +1,422 @@
+##################################################################################
+# Description
+##################################################################################
+# This script runs the download scripts end to end against the local S3 and
+# CDS stand-ins in fake_s3.py and fake_cds.py, through the main functions of
+# download_GEFS_AWS.py and download_ERA5.py as from the command line, and
+# saves the results as JSON so that versions can be compared.  It measures
+#
+#     plan   -- the time to plan multi-year ranges with fcst_dt_hr of the
+#               GEFS script and get_reqs / plan_reqs of the ERA5 script
+#     gefs   -- objects / s and MB / s downloading the zero hours of a
+#               synthetic GEFS bucket with a number of worker threads
+#     era5   -- requests / s and MB / s of daily ERA5 requests over two
+#               accounts with a number of jobs per account
+#     resume -- the bytes, requests and wall time of a rerun after an
+#               interruption, with half the GEFS files left as partial
+#               downloads and half the ERA5 jobs left at CDS in the ledger
+#     preflight -- the time of the pre-flight estimate of the GEFS zero hours,
+#               and its projected against the measured wall time of a rerun
+#               after a third of the files are removed
+#
+# The results are written to --out, and with --compare the ratio of each
+# timing to a previous result file is printed.  The resume and the pre-flight
+# estimates are checked in the tests of both scripts under tests/.  Run as
+#
+#     python bench_suite.py [--out FILE] [--compare OLD_FILE] [--quick]
+#
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import date
+from datetime import datetime as dt
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import download_ERA5 as era5
+import download_GEFS_AWS as gefs
+import preflight
+from aws_s3 import S3Client
+from cds_api import CDSClient
+from era5_ledger import Ledger
+import fake_cds
+import fake_s3
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def version():
+    # git revision of the scripts, None outside of a repository
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True).stdout.decode().strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def data_files(root):
+    # sizes of the data files under root, without hidden files
+    sizes = {}
+    for head, dirs, files in os.walk(root):
+        for fname in files:
+            if not fname.startswith('.'):
+                path = os.path.join(head, fname)
+                sizes[path] = os.path.getsize(path)
+
+    return sizes
+
+def quiet(func, *args):
+    # call func without its messages, returning its result and wall time
+    strt = time.perf_counter()
+    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+        res = func(*args)
+
+    return res, time.perf_counter() - strt
+
+def rates(n_obj, nbytes, wall):
+    # throughput of n_obj objects of nbytes in wall seconds
+    return {
+            'objects'      : n_obj,
+            'bytes'        : nbytes,
+            'wall_s'       : round(wall, 4),
+            'objects_per_s': round(n_obj / wall, 2),
+            'mb_per_s'     : round(nbytes / wall / 1e6, 2),
+           }
+
+def bench_plan(years):
+    # planning times of multi-year ranges in ms
+    res = {}
+    strt = dt(2000, 1, 1)
+    stop = strt + timedelta(days=365 * years)
+    (dates, fcsts), wall = quiet(gefs.fcst_dt_hr, strt, stop, 6, 0, 240, 3)
+    res['fcst_dt_hr_ms'] = round(1e3 * wall, 3)
+    res['gefs_zero_hours'] = len(dates)
+
+    era5.CALL = 'model_levels'
+    era5.DATA_ROOT = '/tmp/'
+    hours = era5.get_hours()
+    reqs, wall = quiet(era5.get_reqs, strt.date(), stop.date(), 1, hours)
+    res['get_reqs_ms'] = round(1e3 * wall, 3)
+    res['era5_daily_reqs'] = len(reqs)
+    (reqs, sizes), wall = quiet(era5.plan_reqs, strt.date(), stop.date(),
+                                hours, 10)
+    res['plan_reqs_ms'] = round(1e3 * wall, 3)
+    res['era5_planned_reqs'] = len(reqs)
+    return res
+
+def gefs_args(server, root, strt, stop, workers, *extra):
+    # command line of the GEFS script against the stand-in
+    return ['--start', strt.isoformat(), '--stop', stop.isoformat(),
+            '--data-root', root, '--endpoint-url', server.url,
+            '--workers', str(workers)] + list(extra)
+
+def bench_gefs(server, tmp, strt, stop, workers):
+    # objects / s and MB / s of the GEFS script for each number of workers
+    res = {}
+    for n_workers in workers:
+        root = os.path.join(tmp, 'gefs%s'%n_workers)
+        server.reset()
+        status, wall = quiet(gefs.main, gefs_args(server, root, strt, stop,
+                                                  n_workers))
+        sizes = data_files(root)
+        assert status == 0 and sizes, 'GEFS download failed'
+        res['workers_%s'%n_workers] = rates(len(sizes), sum(sizes.values()),
+                                            wall)
+
+    return res, root
+
+def resume_gefs(server, root, strt, stop, n_workers):
+    """ Reruns the GEFS script after an interruption in root
+
+    Every other file is truncated to half its size and left as the partial
+    download of an interrupted transfer.  Returns the statistics of the rerun,
+    which resumes the partial files."""
+
+    sizes = data_files(root)
+    paths = sorted(sizes)[::2]
+    cut = 0
+    for path in paths:
+        os.replace(path, gefs.part_path(path))
+        with open(gefs.part_path(path), 'r+b') as f:
+            f.truncate(sizes[path] // 2)
+
+        cut += sizes[path] - sizes[path] // 2
+
+    server.reset()
+    status, wall = quiet(gefs.main, gefs_args(server, root, strt, stop,
+                                              n_workers, '--no-clob'))
+    assert status == 0 and data_files(root) == sizes, 'GEFS resume failed'
+    res = rates(len(paths), server.stats['bytes'], wall)
+    res['full_bytes'] = sum(sizes.values())
+    return res
+
+def preflight_gefs(server, tmp, root, strt, stop, n_workers):
+    """ Times the pre-flight estimate of the GEFS script against root
+
+    The estimate is made for an empty root, and with a third of the files
+    removed from root with the wall time projected from the earlier runs in
+    root.  Returns the time of the estimate and the projected and measured
+    wall time of the rerun."""
+
+    client = S3Client(gefs.BUCKET, endpoint_url=server.url)
+    dates, fcsts = gefs.fcst_dt_hr(strt, stop, gefs.INIT_INT, gefs.FCST_MIN,
+                                   gefs.FCST_MAX, gefs.FCST_INT)
+    groups = [(date, fcsts, None) for date in dates]
+    sizes = data_files(root)
+    with concurrent.futures.ThreadPoolExecutor(n_workers) as pool:
+        plan, plan_s = quiet(gefs.get_preflight, client, pool, groups,
+                             os.path.join(tmp, 'empty'), False)
+        paths = sorted(sizes)[::3]
+        for path in paths:
+            os.remove(path)
+
+        plan = quiet(gefs.get_preflight, client, pool, groups, root, False)[0]
+
+    cut = plan['transfer_bytes']
+    rate, n_runs = preflight.past_rate(os.path.join(root, gefs.TELEMETRY),
+                                       'object')
+    status, wall = quiet(gefs.main, gefs_args(server, root, strt, stop,
+                                              n_workers, '--no-clob'))
+    assert status == 0 and data_files(root) == sizes, 'GEFS rerun failed'
+    return {
+            'plan_s'     : round(plan_s, 4),
+            'objects'    : len(paths),
+            'bytes'      : cut,
+            'projected_s': round(cut / rate, 4),
+            'wall_s'     : round(wall, 4),
+           }
+
+def era5_args(server, root, n_days):
+    # command line of the ERA5 script for n_days daily requests
+    return ['surf_levels', '--start', '2019-02-01', '--stop',
+            '2019-02-%02d'%n_days, '--data-root', root, '--url', server.api]
+
+def bench_era5(server, tmp, n_days, jobs):
+    # requests / s and MB / s of the ERA5 script for each number of jobs
+    res = {}
+    for max_jobs in jobs:
+        era5.MAX_JOBS = max_jobs
+        root = os.path.join(tmp, 'era5_%s'%max_jobs)
+        server.reset()
+        status, wall = quiet(era5.main, era5_args(server, root, n_days))
+        sizes = data_files(root)
+        assert status == 0 and len(sizes) == n_days, 'ERA5 download failed'
+        res['jobs_%s'%max_jobs] = rates(len(sizes), sum(sizes.values()), wall)
+        res['jobs_%s'%max_jobs]['submitted'] = server.stats['submit']
+
+    return res
+
+def resume_era5(server, tmp, n_days):
+    """ Reruns the ERA5 script after an interruption
+
+    Half the requests are submitted to CDS and recorded in the ledger as by
+    a run interrupted while they are queued.  Returns the statistics of the
+    rerun, which reattaches to these jobs rather than submit them again."""
+
+    root = os.path.join(tmp, 'era5_resume')
+    era5.CALL = 'surf_levels'
+    era5.DATA_ROOT = root + '/'
+    os.makedirs(root)
+    strt = date(2019, 2, 1)
+    reqs, sizes = era5.plan_reqs(strt, strt + timedelta(days=n_days - 1),
+                                 era5.get_hours(),
+                                 len(era5.AUTHS) * era5.MAX_JOBS)
+    ledger = Ledger(os.path.join(root, era5.LEDGER))
+    ledger.plan(era5.CALL, reqs, sizes)
+    client = CDSClient(era5.AUTHS[0], url=server.api)
+    server.reset()
+    for req in reqs[::2]:
+        call = era5.get_call(era5.CALL, req[1], req[2], req[3])
+        name = [*call][0]
+        reply = client.submit(name, call[name])
+        ledger.update(req[4], state='submitted', request_id=reply['request_id'],
+                      account=client.uid)
+
+    ledger.close()
+    n_left = server.stats['submit']
+    server.reset()
+    status, wall = quiet(era5.main, era5_args(server, root, n_days))
+    assert status == 0 and len(data_files(root)) == n_days,\
+            'ERA5 resume failed'
+    res = rates(len(reqs), server.stats['bytes'], wall)
+    res['reattached'] = n_left
+    res['submitted'] = server.stats['submit']
+    return res
+
+def compare(old, new, prefix=''):
+    # print the ratio new / old of the timings of two result dictionaries
+    for key in sorted(new):
+        if key == 'args':
+            continue
+
+        name = prefix + key
+        if isinstance(new[key], dict) and isinstance(old.get(key), dict):
+            compare(old[key], new[key], name + '.')
+        elif key.endswith(('_s', '_ms', '_per_s')) and old.get(key):
+            print('%-40s %12s %12s %8.2f'%(name, old[key], new[key],
+                                           new[key] / old[key]))
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--out', default='bench_suite.json',
+                        help='JSON file of the results')
+    parser.add_argument('--compare', metavar='OLD_FILE',
+                        help='JSON results of a previous version to compare')
+    parser.add_argument('--years', type=int, default=30,
+                        help='years of the planned ranges')
+    parser.add_argument('--cycles', type=int, default=2,
+                        help='number of GEFS zero hours every 6 hours')
+    parser.add_argument('--members', type=int, default=4,
+                        help='number of GEFS perturbation members')
+    parser.add_argument('--fcst-max', type=int, default=12,
+                        help='max GEFS forecast hour at 3 hour intervals')
+    parser.add_argument('--msg-kb', type=int, default=64,
+                        help='size of each synthetic GRIB2 message in KiB')
+    parser.add_argument('--latency-ms', type=float, default=10,
+                        help='latency of every response of the S3 stand-in')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16],
+                        help='numbers of GEFS download threads')
+    parser.add_argument('--days', type=int, default=10,
+                        help='number of daily ERA5 requests')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 5],
+                        help='numbers of ERA5 jobs per account')
+    parser.add_argument('--quick', action='store_true',
+                        help='small sizes for a smoke test')
+    args = parser.parse_args()
+    if args.quick:
+        args.years, args.cycles, args.members, args.days = 5, 1, 2, 4
+
+    strt = dt(2021, 1, 26, 0)
+    stop = strt + timedelta(hours=6 * (args.cycles - 1))
+    gefs.FCST_MAX = args.fcst_max
+    era5.AUTHS = [b'1001:00000001-0000-0000-0000-000000000001',
+                  b'1002:00000002-0000-0000-0000-000000000002']
+    era5.DT_INT = 1
+    era5.N_CONNS = 4
+
+    res = {
+           'version': version(),
+           'python' : platform.python_version(),
+           'date'   : dt.now().isoformat(timespec='seconds'),
+           'args'   : vars(args),
+          }
+    print('Planning %s years'%args.years)
+    res['plan'] = bench_plan(args.years)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dates = [strt + timedelta(hours=6 * i) for i in range(args.cycles)]
+        fake_s3.make_gefs_bucket(os.path.join(tmp, 'bucket'), dates,
+                                 list(range(0, args.fcst_max + 3, 3)),
+                                 n_pert=args.members,
+                                 msg_size=args.msg_kb * 1024)
+        server = fake_s3.start_server(os.path.join(tmp, 'bucket'),
+                                      latency=args.latency_ms / 1e3)
+        print('GEFS with %s workers'%args.workers)
+        res['gefs'], root = bench_gefs(server, tmp, strt, stop, args.workers)
+        print('GEFS resume')
+        res['resume'] = {'gefs': resume_gefs(server, root, strt, stop,
+                                             args.workers[-1])}
+        print('GEFS pre-flight')
+        res['preflight'] = preflight_gefs(server, tmp, root, strt, stop,
+                                          args.workers[-1])
+        server.shutdown()
+
+        server = fake_cds.start_server(queue_s=0.2, run_s=0.3,
+                                       result_size=4 * 1024 * 1024)
+        print('ERA5 with %s jobs per account'%args.jobs)
+        res['era5'] = bench_era5(server, tmp, args.days, args.jobs)
+        print('ERA5 resume')
+        res['resume']['era5'] = resume_era5(server, tmp, args.days)
+        status, wall = quiet(era5.main, era5_args(server, os.path.join(tmp,
+                             'era5_resume'), args.days) + ['--plan'])
+        assert status == 0, 'ERA5 pre-flight refused'
+        server.shutdown()
+
+    with open(args.out, 'w') as f:
+        json.dump(res, f, indent=1, sort_keys=True)
+
+    print('\n%-10s %-12s %10s %10s %10s'%('bench', 'run', 'wall (s)',
+                                          'objects/s', 'MB/s'))
+    for bench in ['gefs', 'era5']:
+        for run, stats in res[bench].items():
+            print('%-10s %-12s %10.2f %10.1f %10.1f'%(bench, run,
+                  stats['wall_s'], stats['objects_per_s'], stats['mb_per_s']))
+
+    for bench, stats in res['resume'].items():
+        print('%-10s %-12s %10.2f %10.1f %10.1f'%('resume', bench,
+              stats['wall_s'], stats['objects_per_s'], stats['mb_per_s']))
+
+    print('Pre-flight of GEFS: %.1f ms, %s objects projected %.2f s, measured '
+          '%.2f s'%(1e3 * res['preflight']['plan_s'],
+                    res['preflight']['objects'],
+                    res['preflight']['projected_s'], res['preflight']['wall_s']))
+    print('Plan of %s years: fcst_dt_hr %.1f ms, get_reqs %.1f ms, plan_reqs '
+          '%.1f ms'%(args.years, res['plan']['fcst_dt_hr_ms'],
+                     res['plan']['get_reqs_ms'], res['plan']['plan_reqs_ms']))
+    print('Results written to ' + args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+
+        if old.get('args') != res['args']:
+            print('\nWARNING: %s was run with other arguments'%args.compare)
+
+        print('\n%-40s %12s %12s %8s'%('metric', old.get('version'),
+                                       res['version'], 'ratio'))
+        compare(old, res)
+
+##################################################################################
+# end
@@ -0,0 +1,185 @@
+##################################################################################
+# Description
+##################################################################################
+# This script benchmarks the transfer telemetry of telemetry.py in both
+# download scripts.  A zero hour of a synthetic GEFS bucket is downloaded from
+# the local S3 stand-in in fake_s3.py with and without a telemetry log, and
+# ERA5 requests are then scheduled over CDS accounts against the stand-in in
+# fake_cds.py, with the first ranged transfers dropped.  The cost of an event
+# and the wall time with and without the log are reported, and the summary of
+# the ERA5 log is printed.  The events are checked in tests/test_telemetry.py.
+# Run as
+#
+#     python bench_telemetry.py [--members N] [--fcst-max HH] [--requests N]
+#
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import argparse
+import concurrent.futures
+import contextlib
+import tempfile
+import time
+from datetime import date
+from datetime import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import download_ERA5 as era5
+import download_GEFS_AWS as gefs
+import cds_sched
+import fake_cds
+import fake_s3
+from aws_s3 import S3Client
+from telemetry import Telemetry
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def run_gefs(server, root, date, fcsts, tel):
+    # download a zero hour into root, returning the wall time
+    server.reset()
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+    os.makedirs(root)
+    strt = time.perf_counter()
+    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+        gefs.get_cycle(client, pool, date, fcsts, root, {}, if_clob=True,
+                       if_ctrl=True, if_pert=True, catalog=None,
+                       telemetry=tel)
+
+    wall = time.perf_counter() - strt
+    pool.shutdown()
+    return wall
+
+def run_era5(server, auths, down_dir, n_reqs, tel):
+    # schedule n_reqs daily requests, returning the wall time
+    era5.CALL = 'surf_levels'
+    era5.DATA_ROOT = down_dir + '/'
+    os.makedirs(down_dir)
+    reqs = era5.get_reqs(date(2019, 2, 1), date(2019, 2, n_reqs), 1,
+                         '00:00:00')
+    strt = time.perf_counter()
+    with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+        done, failed = cds_sched.run_jobs(auths, reqs, lambda client, req:
+                                          era5.get_file(client, req, era5.CALL,
+                                                        telemetry=tel),
+                                          url=server.api, poll_int=1,
+                                          backoff_min=0.1, telemetry=tel)
+
+    assert not failed and len(done) == n_reqs, 'requests failed %s'%failed
+    return time.perf_counter() - strt
+
+##################################################################################
+# Run benchmark
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=4,
+                        help='number of perturbation members')
+    parser.add_argument('--fcst-max', type=int, default=12,
+                        help='max forecast hour at 3 hour intervals')
+    parser.add_argument('--requests', type=int, default=6,
+                        help='number of daily ERA5 requests')
+    parser.add_argument('--events', type=int, default=20000,
+                        help='number of events timed')
+    args = parser.parse_args()
+
+    day = dt(2021, 1, 26, 0)
+    fcsts = [str(h) for h in range(0, args.fcst_max + 3, 3)]
+    secrets = ['%s:%08x-1234-5678-9abc-%012x'%(1000 + i, i, 7 * i)
+               for i in range(2)]
+    auths = [key.encode('ascii') for key in secrets]
+    res = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # GEFS objects with and without the log
+        fake_s3.make_gefs_bucket(os.path.join(tmp, 'bucket'), [day],
+                                 [int(h) for h in fcsts],
+                                 n_pert=args.members, msg_size=64 * 1024)
+        server = fake_s3.start_server(os.path.join(tmp, 'bucket'))
+        run_gefs(server, os.path.join(tmp, 'warm/'), day, fcsts, None)
+        res['gefs off'] = run_gefs(server, os.path.join(tmp, 'off/'), day,
+                                   fcsts, None)
+        log = os.path.join(tmp, 'gefs.jsonl')
+        tel = Telemetry(log, prom=os.path.join(tmp, 'gefs.prom'), job='gefs')
+        res['gefs on'] = run_gefs(server, os.path.join(tmp, 'on/'), day, fcsts,
+                                  tel)
+        tel.close()
+        server.shutdown()
+
+        paths = [os.path.join(tmp, 'on', fname) for fname in
+                 os.listdir(os.path.join(tmp, 'on')) if not
+                 fname.startswith('.')]
+
+        # ERA5 requests with dropped ranges and credentials to be redacted
+        server = fake_cds.start_server(queue_s=0.2, run_s=0.3,
+                                       result_size=1024 * 1024, drops=2)
+        era5.N_CONNS = 2
+        log = os.path.join(tmp, 'era5.jsonl')
+        prom = os.path.join(tmp, 'era5.prom')
+        tel = Telemetry(log, prom=prom, job='era5_surf_levels')
+        res['era5 on'] = run_era5(server, auths, os.path.join(tmp, 'era5'),
+                                  args.requests, tel)
+        tel.close()
+        server.shutdown()
+
+        print('ERA5 log')
+        tel.report()
+
+        # cost of a single event written to the log
+        tel = Telemetry(os.path.join(tmp, 'bench.jsonl'), job='bench')
+        strt = time.perf_counter()
+        for i in range(args.events):
+            tel.event('object', key='gefs.20210126/00/%s'%i, bytes=1 << 20,
+                      transfer_s=0.5, retries=0)
+
+        per_event = (time.perf_counter() - strt) / args.events
+        tel.close()
+
+    print('%-10s %10s'%('run', 'wall (s)'))
+    for name in ['gefs off', 'gefs on', 'era5 on']:
+        print('%-10s %10.2f'%(name, res[name]))
+
+    print('%.1f us per event, %s GEFS objects'%(1e6 * per_event, len(paths)))
+
+##################################################################################
+# end
@@ -0,0 +1,348 @@
+##################################################################################
+# Description
+##################################################################################
+# This module is a local stand-in for the task API of the Copernicus Climate Data
+# Store used by cds_api.py, for benchmarking without network access or an
+# account.  The server implements
+#
+#     POST   /api/v2/resources/NAME  -- submit a request, 429 over the limit
+#     GET    /api/v2/tasks/          -- tasks of the account
+#     GET    /api/v2/tasks/ID        -- state / result location of a task
+#     DELETE /api/v2/tasks/ID        -- remove a task
+#     GET    /download/ID            -- result, with single Range support
+#     HEAD   /download/ID            -- result size
+#
+# Accounts are identified by the UID of the Basic authorization header.  A
+# submitted task is queued for queue_s seconds, then running for run_s seconds
+# and then completed, and an account with limit queued / running tasks is
+# refused new requests with 429.  Results are sent at up to rate bytes per
+# second per connection, and connections can be cut part way through a range
+# to exercise the retries of ranged downloads.  The result of each task is a
+# synthetic GRIB2 file of result_size bytes, or the bytes returned by
+# server.result(task).
+#
+# The server counts requests by type and the largest number of active tasks of
+# any account in server.stats.  It can be run standalone as
+#
+#     python fake_cds.py PORT
+#
+# or started in-process with start_server.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import json
+import socket
+import threading
+import time
+import uuid
+from base64 import b64decode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_s3 import grib2_message
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# API base path as in the CDS_URL of the scripts
+API = '/api/v2'
+
+# size of the synthetic GRIB2 messages of results
+MSG_SIZE = 64 * 1024
+
+class FakeCDSHandler(BaseHTTPRequestHandler):
+    """ Request handler for the task API and results of the server """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # headers and body are written separately, avoid delayed ACK stalls
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers={}, head=False):
+        self.send_response(status)
+        for key in headers:
+            self.send_header(key, headers[key])
+
+        if 'Content-Length' not in headers:
+            self.send_header('Content-Length', str(len(body)))
+
+        self.end_headers()
+        if not head and body:
+            self.wfile.write(body)
+
+    def _json(self, status, obj):
+        self._send(status, json.dumps(obj).encode('utf-8'),
+                   {'Content-Type': 'application/json'})
+
+    def _uid(self):
+        # UID of the Basic authorization header, None if missing
+        auth = self.headers.get('Authorization', '')
+        if not auth.startswith('Basic '):
+            return None
+
+        return b64decode(auth[6:]).decode('ascii').split(':')[0]
+
+    def _result(self, task_id, head=False):
+        task = self.server.tasks.get(task_id)
+        if task is None or self.server.state(task) != 'completed':
+            self.server.count('missing')
+            self._send(404, head=head)
+            return
+
+        data = self.server.data(task)
+        start, end, status = 0, len(data) - 1, 200
+        rng = self.headers.get('Range')
+        if rng and not head and self.server.ranges:
+            first, _, last = rng.split('=')[1].partition('-')
+            start = int(first)
+            end = min(int(last), len(data) - 1) if last else len(data) - 1
+            status = 206
+
+        headers = {
+                   'Content-Type': 'application/x-grib',
+                   'Content-Length': str(end - start + 1),
+                  }
+        if self.server.ranges:
+            headers['Accept-Ranges'] = 'bytes'
+
+        if status == 206:
+            headers['Content-Range'] = 'bytes %s-%s/%s'%(start, end, len(data))
+
+        if head:
+            self.server.count('head')
+            self._send(200, headers=headers, head=True)
+            return
+
+        self.server.count('download', end - start + 1)
+        self._send(status, headers=headers, head=True)
+        view = memoryview(data)[start:end + 1]
+        drop = len(view)
+        if status == 206 and len(view) > 1:
+            with self.server.lock:
+                if self.server.drops > 0:
+                    self.server.drops -= 1
+                    self.server.stats['dropped'] += 1
+                    drop = len(view) // 2
+
+        for i in range(0, drop, self.server.chunk):
+            self.wfile.write(view[i:min(i + self.server.chunk, drop)])
+            if self.server.rate:
+                time.sleep(self.server.chunk / self.server.rate)
+
+        if drop < len(view):
+            # cut the connection part way through the range
+            self.close_connection = True
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        uid = self._uid()
+        if uid is None:
+            self._json(401, {'message': 'authentication required'})
+            return
+
+        name = self.path[len(API + '/resources/'):]
+        task = None
+        with self.server.lock:
+            if self.server.active(uid) >= self.server.limit:
+                self.server.stats['throttled'] += 1
+            else:
+                task = {
+                        'request_id': str(uuid.uuid4()),
+                        'uid'       : uid,
+                        'name'      : name,
+                        'request'   : json.loads(body or b'{}'),
+                        'submitted' : time.monotonic(),
+                       }
+                self.server.tasks[task['request_id']] = task
+                self.server.stats['submit'] += 1
+                self.server.stats['max_active'] = max(
+                        self.server.stats['max_active'], self.server.active(uid))
+
+        if task is None:
+            self._json(429, {'message': 'too many requests'})
+        else:
+            self._json(202, self.server.reply(task))
+
+    def do_GET(self):
+        if self.path.startswith('/download/'):
+            self._result(self.path.split('/')[-1])
+            return
+
+        uid = self._uid()
+        task_id = self.path[len(API + '/tasks/'):]
+        with self.server.lock:
+            if not task_id:
+                self.server.stats['list'] += 1
+                tasks = [self.server.reply(task) for task in
+                         self.server.tasks.values() if task['uid'] == uid]
+            else:
+                task = self.server.tasks.get(task_id)
+                self.server.stats['status'] += 1
+
+        if not task_id:
+            self._json(200, tasks)
+        elif task is None or task['uid'] != uid:
+            self._json(404, {'message': 'task not found'})
+        else:
+            self._json(200, self.server.reply(task))
+
+    def do_HEAD(self):
+        self._result(self.path.split('/')[-1], head=True)
+
+    def do_DELETE(self):
+        with self.server.lock:
+            self.server.tasks.pop(self.path[len(API + '/tasks/'):], None)
+
+        self._send(204)
+
+class FakeCDSServer(ThreadingHTTPServer):
+    """ Threaded stand-in for the CDS task API with request statistics
+
+    queue_s / run_s are the seconds each task is queued / running, limit the
+    number of active tasks of an account before requests are refused.  Results
+    of result_size bytes are sent in chunk byte blocks, at up to rate bytes per
+    second per connection if rate is non-zero, with Range requests supported
+    if ranges is True.  The first drops ranged responses are cut off half way
+    through their range."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, queue_s=0.5, run_s=1.0, limit=5,
+                 result_size=4 * 1024 * 1024, chunk=64 * 1024, rate=0,
+                 ranges=True, drops=0):
+        super().__init__(('127.0.0.1', port), FakeCDSHandler)
+        self.queue_s = queue_s
+        self.run_s = run_s
+        self.limit = limit
+        self.result_size = result_size
+        self.chunk = chunk
+        self.rate = rate
+        self.ranges = ranges
+        self.drops = drops
+        self.result = None
+        self.lock = threading.RLock()
+        self.tasks = {}
+        self.results = {}
+        self.url = 'http://127.0.0.1:%s'%self.server_address[1]
+        self.api = self.url + API
+        self.reset()
+
+    def reset(self):
+        # zero the request counters
+        with self.lock:
+            self.stats = {'submit': 0, 'list': 0, 'status': 0, 'throttled': 0,
+                          'download': 0, 'bytes': 0, 'max_active': 0,
+                          'dropped': 0}
+
+    def count(self, kind, nbytes=0):
+        with self.lock:
+            self.stats[kind] = self.stats.get(kind, 0) + 1
+            self.stats['bytes'] += nbytes
+
+    def state(self, task):
+        # state of a task from the time since it was submitted
+        age = time.monotonic() - task['submitted']
+        if age < self.queue_s:
+            return 'queued'
+
+        if age < self.queue_s + self.run_s:
+            return 'running'
+
+        return 'completed'
+
+    def active(self, uid):
+        # number of queued / running tasks of an account
+        return len([task for task in self.tasks.values() if task['uid'] == uid
+                    and self.state(task) != 'completed'])
+
+    def reply(self, task):
+        # reply of the task API for a task
+        reply = {'request_id': task['request_id'], 'state': self.state(task)}
+        if reply['state'] == 'completed':
+            reply['location'] = self.url + '/download/' + task['request_id']
+            reply['content_length'] = len(self.data(task))
+            reply['content_type'] = 'application/x-grib'
+
+        return reply
+
+    def data(self, task):
+        # result bytes of a task, generated once
+        with self.lock:
+            data = self.results.get(task['request_id'])
+
+        if data is None:
+            if self.result is not None:
+                data = self.result(task)
+            else:
+                n_msg = max(self.result_size // MSG_SIZE, 1)
+                data = b''.join([grib2_message(MSG_SIZE)] * n_msg)
+
+            with self.lock:
+                self.results[task['request_id']] = data
+
+        return data
+
+def start_server(port=0, **kwargs):
+    """ Starts a FakeCDSServer on a daemon thread, returning the server """
+
+    server = FakeCDSServer(port=port, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+##################################################################################
+# Serve
+##################################################################################
+if __name__ == '__main__':
+    server = FakeCDSServer(port=int(sys.argv[1]))
+    print('Serving the CDS task API at ' + server.api)
+    server.serve_forever()
+
+##################################################################################
+# end
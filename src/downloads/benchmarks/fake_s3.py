@@ -0,0 +1,406 @@
+##################################################################################
+# Description
+##################################################################################
+# This module is a local stand-in for the public S3 buckets used by the download
+# scripts, for benchmarking without network access.  Objects are served from a
+# directory tree ROOT/BUCKET/KEY with the subset of the S3 REST API used by
+# aws_s3.py:
+#
+#     GET  /BUCKET?list-type=2&prefix=...  -- ListObjectsV2 with pagination
+#     GET  /BUCKET/KEY                     -- object, with single Range / If-Range
+#     HEAD /BUCKET/KEY                     -- object size / ETag
+#
+# The server counts requests and bytes sent by type in server.stats.  It can be
+# run standalone to serve an existing tree as
+#
+#     python fake_s3.py ROOT PORT
+#
+# or started in-process with start_server.  The make_gefs_bucket method fills a
+# tree with synthetic GEFS-shaped objects, where each object is a sequence of
+# minimal GRIB2 messages with a matching .idx inventory.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import hashlib
+import random
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import gefs_keys
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# maximum keys returned per listing page as with S3
+MAX_KEYS = 1000
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    """ Request handler serving objects from the server root directory """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # headers and body are written separately, avoid delayed ACK stalls
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _count(self, kind, nbytes=0):
+        with self.server.lock:
+            self.server.stats[kind] = self.server.stats.get(kind, 0) + 1
+            self.server.stats['bytes'] += nbytes
+
+    def _send(self, status, body=b'', headers={}, head=False):
+        self.send_response(status)
+        for key in headers:
+            self.send_header(key, headers[key])
+
+        if 'Content-Length' not in headers:
+            self.send_header('Content-Length', str(len(body)))
+
+        self.end_headers()
+        if not head and body:
+            self.wfile.write(body)
+
+    def _list(self, bucket, query):
+        prfx = query.get('prefix', [''])[0]
+        token = query.get('continuation-token', [''])[0]
+        base = os.path.join(self.server.root, bucket)
+        keys = []
+        for root, dirs, files in os.walk(base):
+            for fname in files:
+                key = os.path.relpath(os.path.join(root, fname), base)
+                if key.startswith(prfx) and key > token:
+                    keys.append(key)
+
+        keys.sort()
+        page = keys[:MAX_KEYS]
+        body = '<?xml version="1.0" encoding="UTF-8"?>' +\
+               '<ListBucketResult ' +\
+               'xmlns="http://s3.amazonaws.com/doc/2006-03-01/">' +\
+               '<Name>%s</Name><Prefix>%s</Prefix>'%(bucket, escape(prfx))
+        for key in page:
+            size, etag = self.server.meta(os.path.join(base, key))
+            body += '<Contents><Key>%s</Key>'%(escape(key)) +\
+                    '<Size>%s</Size>'%(size) +\
+                    '<ETag>&quot;%s&quot;</ETag></Contents>'%(etag)
+
+        if len(keys) > MAX_KEYS:
+            body += '<IsTruncated>true</IsTruncated>' +\
+                    '<NextContinuationToken>%s</NextContinuationToken>'%(
+                            escape(page[-1]))
+        else:
+            body += '<IsTruncated>false</IsTruncated>'
+
+        body = (body + '</ListBucketResult>').encode('utf-8')
+        self._count('list', len(body))
+        self._send(200, body, {'Content-Type': 'application/xml'})
+
+    def _object(self, bucket, key, head=False):
+        path = os.path.join(self.server.root, bucket, key)
+        if not os.path.isfile(path):
+            self._count('missing')
+            self._send(404, head=head)
+            return
+
+        size, etag = self.server.meta(path)
+        start, end, status = 0, size - 1, 200
+        rng = self.headers.get('Range')
+        if self.headers.get('If-Range', '"%s"'%etag) != '"%s"'%etag:
+            # object changed since the partial transfer, send it whole
+            rng = None
+
+        if rng and not head:
+            first, _, last = rng.split('=')[1].partition('-')
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            status = 206
+
+        headers = {
+                   'ETag': '"%s"'%etag,
+                   'Accept-Ranges': 'bytes',
+                   'Content-Length': str(max(end - start + 1, 0)),
+                  }
+        if status == 206:
+            headers['Content-Range'] = 'bytes %s-%s/%s'%(start, end, size)
+
+        if head:
+            self._count('head')
+            self._send(200, headers=headers, head=True)
+            return
+
+        if self.server.stall:
+            with self.server.lock:
+                stalled = self.server.random.random() < self.server.stall[0]
+
+            if stalled:
+                self._count('stalled')
+                time.sleep(self.server.stall[1])
+
+        self._count('get', end - start + 1)
+        self._send(status, headers=headers, head=True)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            left = end - start + 1
+            while left > 0:
+                buf = f.read(min(left, 1024 * 1024))
+                try:
+                    self.wfile.write(buf)
+                except (BrokenPipeError, ConnectionResetError):
+                    # transfer abandoned by the client
+                    self._count('abandoned')
+                    self.close_connection = True
+                    return
+
+                left -= len(buf)
+
+    def _route(self, head=False):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlsplit(self.path)
+        bucket, _, key = unquote(url.path).lstrip('/').partition('/')
+        if key:
+            self._object(bucket, key, head=head)
+        else:
+            self._list(bucket, parse_qs(url.query))
+
+    def do_GET(self):
+        self._route()
+
+    def do_HEAD(self):
+        self._route(head=True)
+
+class FakeS3Server(ThreadingHTTPServer):
+    """ Threaded server of the directory root with request statistics
+
+    latency is an optional delay in seconds added before every response, and
+    stall an optional (fraction, seconds) of object GET requests delayed by
+    seconds more, as stragglers of a busy service."""
+
+    daemon_threads = True
+
+    def __init__(self, root, port=0, latency=0.0, stall=None):
+        super().__init__(('127.0.0.1', port), FakeS3Handler)
+        self.root = root
+        self.latency = latency
+        self.stall = stall
+        self.random = random.Random(port)
+        self.lock = threading.Lock()
+        self.etags = {}
+        self.url = 'http://127.0.0.1:%s'%self.server_address[1]
+        self.reset()
+
+    def handle_error(self, request, client_address):
+        # connections dropped by clients abandoning transfers are expected
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+    def reset(self):
+        # zero the request / byte counters
+        with self.lock:
+            self.stats = {'bytes': 0}
+
+    def meta(self, path):
+        # size and md5 ETag of a file, cached by modification time
+        st = os.stat(path)
+        with self.lock:
+            cache = self.etags.get(path)
+
+        if cache is None or cache[0] != (st.st_size, st.st_mtime):
+            md5 = hashlib.md5()
+            with open(path, 'rb') as f:
+                for buf in iter(lambda: f.read(1024 * 1024), b''):
+                    md5.update(buf)
+
+            cache = ((st.st_size, st.st_mtime), md5.hexdigest())
+            with self.lock:
+                self.etags[path] = cache
+
+        return st.st_size, cache[1]
+
+def start_server(root, port=0, latency=0.0, stall=None):
+    """ Starts a FakeS3Server on a daemon thread, returning the server """
+
+    server = FakeS3Server(root, port=port, latency=latency, stall=stall)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+##################################################################################
+# SYNTHETIC GEFS DATA
+##################################################################################
+
+# isobaric levels of the pgrb2a / pgrb2b files
+LEVS_A = [10, 20, 50, 100, 200, 250, 300, 500, 700, 850, 925, 1000]
+LEVS_B = [1, 2, 3, 5, 7, 30, 70, 150, 350, 400, 450, 550, 600, 650, 750, 800,
+          900, 950, 975]
+
+# surface records read by ungrib with Vtable.GEFS
+SFC_USED = ['PRES:surface', 'PRMSL:mean sea level', 'TMP:2 m above ground',
+            'RH:2 m above ground', 'UGRD:10 m above ground',
+            'VGRD:10 m above ground', 'SOILW:0-0.1 m below ground',
+            'TSOIL:0-0.1 m below ground', 'ICEC:surface', 'LAND:surface',
+            'HGT:surface', 'TMP:surface', 'WEASD:surface']
+
+# surface records not read by ungrib
+SFC_UNUSED = ['APCP:surface', 'CAPE:surface', 'CIN:surface',
+              'PWAT:entire atmosphere', 'TCDC:entire atmosphere',
+              'DLWRF:surface', 'DSWRF:surface', 'ULWRF:surface',
+              'USWRF:surface', 'LHTFL:surface', 'SHTFL:surface',
+              'CSNOW:surface']
+
+def gefs_records(stream):
+    # inventory 'VAR:LEVEL' records of a synthetic pgrb2a / pgrb2b file
+    if stream == 'a':
+        recs = [var + ':%s mb'%lev for lev in LEVS_A
+                for var in ['HGT', 'TMP', 'RH', 'UGRD', 'VGRD']]
+        return recs + SFC_USED + SFC_UNUSED
+
+    recs = [var + ':%s mb'%lev for lev in LEVS_B
+            for var in ['HGT', 'TMP', 'RH', 'UGRD', 'VGRD']]
+    return recs + [var + ':%s mb'%lev for lev in LEVS_A + LEVS_B
+                   for var in ['VVEL', 'ABSV', 'O3MR', 'CLWMR', 'SPFH']]
+
+def grib2_message(size, discipline=0, ref=None, fhr=0):
+    """ Generates a minimal GRIB2 message of total length size bytes
+
+    The message has a valid indicator section, an arbitrary body and the end
+    section, which is sufficient for message scanning / byte range checks.  If
+    ref is a datetime and size allows, the body starts with an identification
+    section 1 of reference time ref and a product definition section 4 of
+    template 4.0 for forecast hour fhr, as read by grib_split / grib_catalog."""
+
+    head = b''
+    if ref is not None and size >= 128:
+        head = (21).to_bytes(4, 'big') + bytes([1, 0, 7, 0, 0, 2, 0, 1]) +\
+               ref.year.to_bytes(2, 'big') + bytes([ref.month, ref.day,
+                                                    ref.hour, 0, 0, 0, 1]) +\
+               (34).to_bytes(4, 'big') + bytes([4, 0, 0, 0, 0, 0, 0, 2, 0, 0,
+                                                0, 0, 0, 1]) +\
+               fhr.to_bytes(4, 'big') + bytes([100, 0]) +\
+               (50000).to_bytes(4, 'big') + bytes(6)
+        body = size - 20 - len(head)
+        head += body.to_bytes(4, 'big') + bytes([7])
+
+    body = size - 20 - len(head)
+    return b'GRIB\x00\x00' + bytes([discipline, 2]) + size.to_bytes(8, 'big') +\
+           head + os.urandom(min(body, 64)) + bytes(max(body - 64, 0)) + b'7777'
+
+def write_grib(path, date, fhr, recs, msg_size):
+    """ Writes a synthetic GRIB2 file with its .idx inventory """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = []
+    offset = 0
+    with open(path, 'wb') as f:
+        for i, rec in enumerate(recs):
+            lines.append('%s:%s:d=%s:%s:%s hour fcst:'%(i + 1, offset,
+                         date.strftime('%Y%m%d%H'), rec, fhr))
+            msg = grib2_message(msg_size, ref=date, fhr=fhr)
+            f.write(msg)
+            offset += len(msg)
+
+    with open(path + '.idx', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def make_gefs_bucket(root, dates, fhrs, n_pert=2, msg_size=32 * 1024,
+                     res='0p50', bucket='noaa-gefs-pds'):
+    """ Fills root with synthetic GEFS objects in the layout of each date
+
+    dates is a list of zero hour datetimes and fhrs a list of forecast hours.
+    Members are the control gec00 and n_pert perturbations, with the keys of
+    resolution res resolved by gefs_keys for the layout era of each date.
+    Objects which are filtered by the downloader, i.e., ensemble statistics
+    and, after 2020-09-23, 0p25, chem and wave files, are written as small
+    placeholders.  Returns the keys of the member pgrb2a / pgrb2b objects."""
+
+    keys = []
+    for date in dates:
+        base = 'gefs.%s/%s/'%(date.strftime('%Y%m%d'), date.strftime('%H'))
+        hh = date.strftime('%H')
+        for fhr in fhrs:
+            fff = '%03d'%fhr
+            for stream in ['a', 'b']:
+                for mem in range(n_pert + 1):
+                    key = gefs_keys.gefs_key(date, mem, fhr, stream, res)
+                    write_grib(os.path.join(root, bucket, key), date, fhr,
+                               gefs_records(stream), msg_size)
+                    keys.append(key)
+
+                # ensemble mean / spread files next to the member files
+                mem = key.split('/')[-1].split('.')[0]
+                for stat in ['geavg', 'gespr']:
+                    write_grib(os.path.join(root, bucket,
+                                            key.replace(mem, stat)),
+                               date, fhr, ['TMP:2 m above ground'], 64)
+
+            if date < gefs_keys.LAYOUTS[-1]['start']:
+                continue
+
+            for sub in ['atmos/pgrb2sp25/gec00.t%sz.pgrb2s.0p25.f%s',
+                        'chem/pgrb2ap25/gefs.chem.t%sz.a2d_0p25.f%s',
+                        'wave/gridded/gefs.wave.t%sz.c00.global.0p25.f%s']:
+                key = base + sub%(hh, fff)
+                write_grib(os.path.join(root, bucket, key), date, fhr,
+                           ['TMP:2 m above ground'], 64)
+
+    return keys
+
+##################################################################################
+# Serve an existing tree
+##################################################################################
+if __name__ == '__main__':
+    server = FakeS3Server(sys.argv[1], port=int(sys.argv[2]))
+    print('Serving ' + sys.argv[1] + ' at ' + server.url)
+    server.serve_forever()
+
+##################################################################################
+# end
@@ -0,0 +1,395 @@
+##################################################################################
+# Description
+##################################################################################
+# This module provides a minimal, in-process client for the task API of the
+# Copernicus Climate Data Store at
+#
+#     https://cds.climate.copernicus.eu/
+#
+# following the requests made by the cdsapi package, so that the state and
+# request ID of each job are available to the download scripts.  A request is
+# submitted to CDS_URL/resources/NAME, polled at CDS_URL/tasks/REQUEST_ID until
+# it completes and its result is streamed from the returned location.  The
+# queued / running jobs of an account are listed at CDS_URL/tasks/.
+#
+# Large results can be downloaded over several connections in concurrent byte
+# ranges, written in place into a preallocated file, with each range retried
+# from its last byte on interrupted transfers.  Servers which do not support
+# ranges are read over a single connection.
+#
+# Connections are persistent and kept per thread and host, so that a single
+# client can be shared by a pool of threads.  The URL is configurable so that
+# the client can be pointed at a local stand-in for testing, e.g.,
+#
+#     client = CDSClient('UID:KEY', url='http://localhost:9100/api/v2')
+#
+# Credentials are only sent in the Authorization header, and are redacted to
+# the UID in the representation of the client and in messages.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, ssl
+import time
+import json
+import threading
+import http.client
+import concurrent.futures
+from base64 import b64encode
+from urllib.parse import urlsplit
+from telemetry import OFF
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# default endpoint of the CDS API
+CDS_URL = 'https://cds.climate.copernicus.eu/api/v2'
+
+# size of blocks streamed from the socket to disk
+CHUNK = 1024 * 1024
+
+# size of the byte ranges of results downloaded over multiple connections
+RANGE_SIZE = 64 * 1024 * 1024
+
+# response codes of throttled requests
+THROTTLED = (429, 503)
+
+def redact(key):
+    # replaces the secret of a UID:KEY credential for messages
+    if isinstance(key, bytes):
+        key = key.decode('ascii')
+
+    return key.split(':')[0] + ':****'
+
+class CDSError(Exception):
+    """ Error response from a CDS request, storing the HTTP status code
+
+    status is None for jobs that failed at CDS, with the reason given by the
+    error message of the task."""
+
+    def __init__(self, status, reason, url, message=''):
+        self.status = status
+        self.reason = reason
+        self.url = url
+        self.message = message
+        super().__init__(('%s %s for %s %s'%(status, reason, url,
+                                             message)).rstrip())
+
+    @property
+    def throttled(self):
+        # True if the request was refused for the load of the account / server
+        return self.status in THROTTLED
+
+class CDSClient:
+    """ Client for submitting, polling and downloading CDS requests
+
+    key is the 'UID:KEY' credential of a CDS account as a string or bytes, url
+    is the base URL of the API with scheme.  Connections are kept open per
+    thread and reopened with up to retries attempts on connection errors or
+    server side errors, other than throttling, each recorded as a retry event
+    of telemetry."""
+
+    def __init__(self, key, url=CDS_URL, timeout=60, retries=3,
+                 telemetry=None):
+        if isinstance(key, bytes):
+            key = key.decode('ascii')
+
+        self.uid = key.split(':')[0]
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self._auth = 'Basic ' + b64encode(key.encode('ascii')).decode('ascii')
+        self._local = threading.local()
+        self.telemetry = telemetry or OFF
+
+    def __repr__(self):
+        return 'CDSClient(%s, url=%s)'%(redact(self.uid), self.url)
+
+    def _conn(self, url, reset=False):
+        # return the persistent connection of the calling thread to a host
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+
+        host = (url.scheme, url.hostname, url.port)
+        conn = conns.get(host)
+        if reset and conn is not None:
+            conn.close()
+            conn = None
+
+        if conn is None:
+            if url.scheme == 'https':
+                conn = http.client.HTTPSConnection(url.hostname, url.port,
+                        timeout=self.timeout,
+                        context=ssl.create_default_context())
+            else:
+                conn = http.client.HTTPConnection(url.hostname, url.port,
+                        timeout=self.timeout)
+
+            conns[host] = conn
+
+        return conn
+
+    def _request(self, method, url, body=None, headers=None, ok=(200, 202)):
+        """ Makes a request on the thread connection, returning the response
+
+        The response body must be read fully by the caller before the next
+        request to the same host on the same thread.  Connection errors and 5xx
+        responses other than throttling are retried with a short backoff, other
+        status codes not in ok raise a CDSError."""
+
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        headers = dict(headers or {})
+        if parts.netloc == urlsplit(self.url).netloc:
+            headers['Authorization'] = self._auth
+
+        for attempt in range(self.retries + 1):
+            try:
+                conn = self._conn(parts, reset=(attempt > 0))
+                conn.request(method, path, body=body, headers=headers)
+                res = conn.getresponse()
+                if res.status >= 500 and res.status not in THROTTLED and\
+                        attempt < self.retries:
+                    res.read()
+                    self.telemetry.event('retry', account=self.uid, url=url,
+                                         retries=1, error=str(res.status))
+                    time.sleep(2 ** attempt)
+                    continue
+
+                if res.status not in ok:
+                    raise CDSError(res.status, res.reason, url,
+                                   res.read().decode('utf-8', 'replace')[:200])
+
+                return res
+
+            except (http.client.HTTPException, ConnectionError,
+                    TimeoutError) as err:
+                if attempt == self.retries:
+                    raise
+
+                self.telemetry.event('retry', account=self.uid, url=url,
+                                     retries=1, error=repr(err))
+                time.sleep(2 ** attempt)
+
+    def _json(self, method, path, body=None):
+        # request a JSON reply from the API
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+
+        res = self._request(method, self.url + path, body=body,
+                            headers={'Content-Type': 'application/json'})
+        text = res.read()
+        return json.loads(text) if text else {}
+
+    def tasks(self):
+        # lists the tasks of the account
+        return self._json('GET', '/tasks/')
+
+    def active(self):
+        # number of queued or running tasks of the account
+        return len([task for task in self.tasks() if task.get('state') in
+                    ['queued', 'running']])
+
+    def submit(self, name, request):
+        """ Submits a request for the dataset name
+
+        Returns the reply with the 'state' and 'request_id' of the task."""
+
+        return self._json('POST', '/resources/' + name, request)
+
+    def status(self, request_id):
+        # returns the reply of a submitted task
+        return self._json('GET', '/tasks/' + request_id)
+
+    def delete(self, request_id):
+        # removes a task and its result from the account
+        self._request('DELETE', self.url + '/tasks/' + request_id,
+                      ok=(200, 202, 204)).read()
+
+    def wait(self, reply, sleep_max=120):
+        """ Polls a task until it completes
+
+        reply is the reply of submit or status.  The polling interval grows
+        from one second to sleep_max seconds.  Returns the reply of the
+        completed task, with the result 'location' and 'content_length', or
+        raises a CDSError if the task failed at CDS."""
+
+        sleep = 1
+        while reply['state'] in ['queued', 'running']:
+            time.sleep(sleep)
+            sleep = min(sleep * 1.5, sleep_max)
+            reply = self.status(reply['request_id'])
+
+        if reply['state'] != 'completed':
+            error = reply.get('error', {})
+            raise CDSError(None, reply['state'], reply.get('request_id'),
+                           error.get('message', '') + ' ' +
+                           error.get('reason', ''))
+
+        return reply
+
+    def download(self, location, path, n_conns=1, range_size=RANGE_SIZE):
+        """ Streams the result at location to the local file path
+
+        location may be relative to the API URL.  With n_conns > 1 and a
+        server supporting byte ranges, the result is split into ranges of
+        range_size bytes downloaded concurrently over n_conns connections into
+        a preallocated file, see _get_ranges, else it is streamed over a
+        single connection.  Returns the number of bytes written."""
+
+        if not urlsplit(location).scheme:
+            parts = urlsplit(self.url)
+            location = parts.scheme + '://' + parts.netloc + '/' +\
+                    location.lstrip('/')
+
+        if n_conns > 1:
+            # probe for range support with the first byte of the result
+            res = self._request('GET', location, headers={'Range': 'bytes=0-0'},
+                                ok=(200, 206))
+            crange = res.getheader('Content-Range', '')
+            if res.status == 206 and '/' in crange and\
+                    not crange.endswith('/*'):
+                res.read()
+                size = int(crange.split('/')[-1])
+                return self._get_ranges(location, path, size, n_conns,
+                                        range_size)
+
+            # the server ignored the range and sends the whole result
+            with open(path, 'wb') as f:
+                return _stream(res, f)
+
+        res = self._request('GET', location, ok=(200,))
+        with open(path, 'wb') as f:
+            return _stream(res, f)
+
+    def _get_range(self, location, fd, start, end):
+        """ Downloads bytes start to end inclusive of location into fd
+
+        The range is written at its offset with os.pwrite.  Interrupted
+        transfers and responses with an unexpected Content-Range are retried
+        up to retries times from the last byte written.  Returns the number of
+        bytes written."""
+
+        pos = start
+        for attempt in range(self.retries + 1):
+            try:
+                res = self._request('GET', location, ok=(206,), headers={
+                                    'Range': 'bytes=%s-%s'%(pos, end)})
+                if not res.getheader('Content-Range', '').startswith(
+                        'bytes %s-'%pos):
+                    res.read()
+                    raise http.client.HTTPException(
+                            'unexpected range %s for bytes %s-%s'%(
+                            res.getheader('Content-Range'), pos, end))
+
+                while pos <= end:
+                    buf = res.read(min(CHUNK, end + 1 - pos))
+                    if not buf:
+                        break
+
+                    os.pwrite(fd, buf, pos)
+                    pos += len(buf)
+
+                if pos > end:
+                    return end + 1 - start
+
+                raise http.client.IncompleteRead(b'', end + 1 - pos)
+
+            except (http.client.HTTPException, ConnectionError,
+                    TimeoutError) as err:
+                if attempt == self.retries:
+                    raise
+
+                print('Retrying bytes %s-%s of %s: %s'%(pos, end, location,
+                                                        repr(err)))
+                self.telemetry.event('retry', account=self.uid, url=location,
+                                     range='%s-%s'%(pos, end), retries=1,
+                                     error=repr(err))
+                self._conn(urlsplit(location), reset=True)
+                time.sleep(2 ** attempt)
+
+    def _get_ranges(self, location, path, size, n_conns, range_size):
+        """ Downloads a result of size bytes in concurrent byte ranges
+
+        The file is preallocated to size bytes and ranges of range_size bytes
+        are written in place by a pool of n_conns threads, each with its own
+        connection.  Returns the number of bytes written, raising an IOError
+        if the file does not have size bytes."""
+
+        ranges = [(start, min(start + range_size, size) - 1)
+                  for start in range(0, size, range_size)]
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, 'posix_fallocate') and size:
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(n_conns, len(ranges) or 1)) as pool:
+                nbytes = sum(pool.map(lambda rng: self._get_range(location, fd,
+                                      *rng), ranges))
+
+        finally:
+            os.close(fd)
+
+        if nbytes != size or os.path.getsize(path) != size:
+            raise IOError('incomplete result %s, %s of %s bytes'%(
+                          path, nbytes, size))
+
+        return nbytes
+
+def _stream(res, f):
+    # copy a response body to an open file in blocks, returning the size
+    size = 0
+    while True:
+        buf = res.read(CHUNK)
+        if not buf:
+            break
+
+        f.write(buf)
+        size += len(buf)
+
+    return size
+
+##################################################################################
+# end
@@ -0,0 +1,240 @@
+##################################################################################
+# Description
+##################################################################################
+# This module schedules CDS jobs over multiple accounts with asyncio, so that
+# every account is kept at its limit of concurrent jobs.  Each account has
+# max_jobs slots, and each slot takes the next request from a shared queue as
+# soon as the account is free, so that the total concurrency is the sum of the
+# limits of all accounts.
+#
+# Before a slot submits, the live count of queued / running tasks of the
+# account is read from CDS_URL/tasks/ on the pooled connection of the client,
+# to respect jobs submitted by other processes with the same credentials.  An
+# account which is full or refuses a request with a throttling response is
+# backed off exponentially, and the throttled request is put back in the queue
+# for any free account.  Jobs are blocking functions run in a thread pool as
+#
+#     job(client, req)
+#
+# where client is the CDSClient of the account, see download_ERA5.py.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import time
+import random
+import asyncio
+import concurrent.futures
+from cds_api import CDSClient, CDSError, CDS_URL, redact
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+class Account:
+    """ Slots and backoff state of a single CDS account
+
+    key is the 'UID:KEY' credential, max_jobs the number of concurrent jobs
+    allowed for the account.  The remote count of active tasks is cached for
+    poll_int seconds, and refreshed whenever a job of the account finishes.
+    Backoff starts at backoff_min seconds and doubles up to backoff_max.  The
+    client and throttling of the account are recorded in telemetry."""
+
+    def __init__(self, key, max_jobs=5, url=CDS_URL, poll_int=30,
+                 backoff_min=30, backoff_max=3600, telemetry=None):
+        self.client = CDSClient(key, url=url, telemetry=telemetry)
+        self.telemetry = self.client.telemetry
+        self.name = redact(key)
+        self.max_jobs = max_jobs
+        self.poll_int = poll_int
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.backoff = 0
+        self.until = 0
+        self.inflight = 0
+        self.remote = None
+        self.checked = 0
+        self.freed = asyncio.Event()
+        self.lock = asyncio.Lock()
+
+    def throttle(self):
+        # back off the account exponentially with jitter
+        self.backoff = min(max(self.backoff * 2, self.backoff_min),
+                           self.backoff_max)
+        wait = self.backoff * random.uniform(1, 1.25)
+        self.until = time.monotonic() + wait
+        print('%s throttled, backing off %ss'%(self.name, int(self.backoff)))
+        self.telemetry.event('throttle', account=self.name,
+                             backoff_s=round(wait, 3))
+
+    async def free(self):
+        """ Waits until the account has a free slot, without taking it
+
+        The account is free once its backoff has expired and both the jobs
+        in flight from this process and the remote count of active tasks are
+        below max_jobs.  A full account is checked again when one of its jobs
+        finishes, or after poll_int seconds for jobs of other processes."""
+
+        while True:
+            wait = self.until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            async with self.lock:
+                if self.remote is None or\
+                        time.monotonic() - self.checked > self.poll_int:
+                    try:
+                        remote = await asyncio.to_thread(self.client.active)
+
+                    except (CDSError, OSError) as err:
+                        print('%s task count failed: %s'%(self.name, err))
+                        self.throttle()
+                        continue
+
+                    self.remote = remote
+                    self.checked = time.monotonic()
+
+                if max(self.remote, self.inflight) < self.max_jobs:
+                    return
+
+                self.freed.clear()
+
+            try:
+                await asyncio.wait_for(self.freed.wait(), self.poll_int)
+
+            except asyncio.TimeoutError:
+                pass
+
+    def take(self):
+        # takes a slot if the account is still free, else returns False
+        if self.until > time.monotonic() or self.remote is None or\
+                max(self.remote, self.inflight) >= self.max_jobs:
+            return False
+
+        self.inflight += 1
+        self.remote += 1
+        return True
+
+    def release(self, ok):
+        # frees a slot, resetting the backoff after a successful job
+        self.inflight -= 1
+        self.remote = None
+        if ok:
+            self.backoff = 0
+
+        self.freed.set()
+
+async def _slot(account, queue, job, done, failed):
+    # take a request from the queue once the account is free, leaving the
+    # queue to the other accounts while this one is full or backed off, and
+    # put it back if the slot was taken by another request in the meantime
+    while True:
+        await account.free()
+        req = await queue.get()
+        if not account.take():
+            queue.put_nowait(req)
+            queue.task_done()
+            continue
+
+        ok = False
+        try:
+            await asyncio.to_thread(job, account.client, req)
+            done.append(req)
+            ok = True
+
+        except CDSError as err:
+            if err.throttled:
+                account.throttle()
+                queue.put_nowait(req)
+            else:
+                print('%s request failed: %s'%(account.name, err))
+                failed.append((req, err))
+
+        except Exception as err:
+            print('%s request failed: %s'%(account.name, err))
+            failed.append((req, err))
+
+        finally:
+            account.release(ok)
+            queue.task_done()
+
+async def schedule(accounts, reqs, job):
+    """ Runs job on every request over the slots of all accounts
+
+    Returns the list of requests done and the list of (request, exception)
+    which failed other than by throttling."""
+
+    n_slots = sum([account.max_jobs for account in accounts])
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                              max_workers=n_slots + len(accounts)))
+
+    queue = asyncio.Queue()
+    for req in reqs:
+        queue.put_nowait(req)
+
+    done = []
+    failed = []
+    slots = [asyncio.create_task(_slot(account, queue, job, done, failed))
+             for account in accounts for i in range(account.max_jobs)]
+
+    await queue.join()
+    for slot in slots:
+        slot.cancel()
+
+    await asyncio.gather(*slots, return_exceptions=True)
+    return done, failed
+
+def run_jobs(auths, reqs, job, max_jobs=5, url=CDS_URL, **kwargs):
+    """ Schedules the requests reqs over the accounts auths
+
+    auths is a list of 'UID:KEY' credentials, each allowed max_jobs concurrent
+    jobs.  Further keyword arguments are passed to Account.  Returns the lists
+    of requests done and of failed (request, exception) as schedule."""
+
+    accounts = [Account(key, max_jobs=max_jobs, url=url, **kwargs)
+                for key in auths]
+    print('Scheduling %s requests over %s accounts with %s slots'%(
+          len(reqs), len(accounts), len(accounts) * max_jobs))
+    return asyncio.run(schedule(accounts, reqs, job))
+
+##################################################################################
+# end
@@ -0,0 +1,259 @@
+##################################################################################
+# Description
+##################################################################################
+# This module plans the GEFS background data consumed by the cycling workflows,
+# so that the download covers exactly the files read by ungrib.  The Jinja2
+# settings of one or more flow.cylc files are read, and the ungrib tasks of
+# every cycle point are expanded into the (zero hour, forecast hour, member)
+# triples they read, following the conventions of the suites in cylc-src:
+#
+#     ENS_BKG_DATA -- ensemble members range(M, ENS_SIZE) of the graph, zero
+#                     hour lagged LAG hours from the cycle, forecast length
+#                     LAG + CYC_INC, or to EXP_VRF with IF_DYN_LEN = 'Yes'
+#     CTR_BKG_DATA -- control member of the cycle zero hour, forecast length
+#                     FCST_HRS, or to EXP_VRF for the extended forecasts of the
+#                     zero hours EXT_ZHRS after the warm up period WRM_UP
+#
+# The triples of all cycles and all flows are deduplicated into a single plan,
+# which is compared to the naive padded date / forecast hour range covering the
+# same data.  Run standalone to report the plan without downloading as
+#
+#     python cycle_plan.py flow.cylc [flow.cylc ...]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import sys
+import re
+import ast
+from datetime import datetime as dt
+from datetime import timedelta
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# Jinja2 set statements with a literal value
+SET_RE = re.compile(r'{%-?\s*set\s+(\w+)\s*=\s*(.+?)\s*-?%}')
+
+# member range of the ensemble graph
+MEM_RE = re.compile(r'range\(\s*(\d+)\s*,\s*ENS_SIZE\s*\)')
+
+# ISO durations of the form P1D, PT6H, P1DT12H
+DUR_RE = re.compile(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?)?$')
+
+def read_settings(flow):
+    """ Reads the literal Jinja2 settings of a flow.cylc file
+
+    Returns a dictionary of the names and values of the set statements whose
+    values are Python literals, statements with expressions are skipped.  The
+    first member index of the ensemble graph is stored as MEM_STRT."""
+
+    with open(flow, 'r') as f:
+        text = f.read()
+
+    settings = {}
+    for name, expr in SET_RE.findall(text):
+        try:
+            settings.setdefault(name, ast.literal_eval(expr))
+
+        except (ValueError, SyntaxError):
+            continue
+
+    mem = MEM_RE.search(text)
+    settings['MEM_STRT'] = int(mem.group(1)) if mem else 0
+    return settings
+
+def cycle_dt(iso):
+    # parse the YYYY-MM-DDTHH cycle point format of the suites
+    return dt.strptime(iso, '%Y-%m-%dT%H')
+
+def iso_hours(dur):
+    # hours of an ISO duration of days / hours
+    match = DUR_RE.match(dur)
+    if not match:
+        raise ValueError('unsupported duration ' + dur)
+
+    days, hrs = match.groups()
+    return 24 * int(days or 0) + int(hrs or 0)
+
+def fcst_hours(fcst_len, bkg_int):
+    # forecast hours read by ungrib for a forecast of fcst_len hours
+    return list(range(0, fcst_len + 1, bkg_int))
+
+def flow_plan(settings):
+    """ Expands the ungrib tasks of a flow into a list of triples
+
+    settings is a dictionary as returned by read_settings.  Returns the list of
+    (zero hour, forecast hour, member) triples read by all cycle points, with
+    repetitions, or an empty list if the flow does not use GEFS data."""
+
+    strt = cycle_dt(settings['CYC_STRT'])
+    stop = cycle_dt(settings['CYC_STOP'])
+    inc = int(settings['CYC_INC'])
+    cycles = []
+    cycle = strt
+    while cycle <= stop:
+        cycles.append(cycle)
+        cycle += timedelta(hours=inc)
+
+    trpls = []
+    if settings.get('CTR_BKG_DATA') == 'GEFS':
+        bkg_int = int(settings['CTR_BKG_INT'])
+        ext_strt = strt + timedelta(hours=iso_hours(settings.get('WRM_UP', 'P0D'))
+                                    + inc)
+        ext_hrs = [int(zhr.lstrip('T')) for zhr in settings.get('EXT_ZHRS', [])]
+        for cycle in cycles:
+            fcst_len = int(settings['FCST_HRS'])
+            offset = (cycle - ext_strt).total_seconds() / 3600
+            if cycle >= ext_strt and cycle != stop and offset % 24 in ext_hrs:
+                # extended forecast runs to the verification time
+                fcst_len = int((cycle_dt(settings['EXP_VRF']) -
+                                cycle).total_seconds() / 3600)
+
+            for fhr in fcst_hours(fcst_len, bkg_int):
+                trpls.append((cycle, fhr, 0))
+
+    elif settings.get('ENS_BKG_DATA') == 'GEFS':
+        bkg_int = int(settings['ENS_BKG_INT'])
+        lag = int(settings.get('LAG', 0))
+        mems = range(settings['MEM_STRT'], int(settings['ENS_SIZE']))
+        for cycle in cycles:
+            init = cycle - timedelta(hours=lag)
+            if settings.get('IF_DYN_LEN') == 'Yes':
+                fcst_len = int((cycle_dt(settings['EXP_VRF']) -
+                                init).total_seconds() / 3600)
+            else:
+                fcst_len = int(settings.get('FCST_HRS', lag + inc))
+
+            for fhr in fcst_hours(fcst_len, bkg_int):
+                for mem in mems:
+                    trpls.append((init, fhr, mem))
+
+    return trpls
+
+def cycle_plan(flows):
+    """ Plans the deduplicated GEFS data of a list of flow.cylc files
+
+    Returns the set of (zero hour, forecast hour, member) triples and a
+    dictionary with the number of triples requested by all cycles 'requested',
+    the number of unique triples 'planned' and the number of triples of the
+    naive range 'naive'.  The naive range pads the zero hours from the first to
+    the last at the cycle interval, the forecast hours from zero to the
+    longest forecast at the data interval, for all members used."""
+
+    trpls = []
+    cyc_inc = []
+    bkg_int = []
+    for flow in flows:
+        settings = read_settings(flow)
+        flow_trpls = flow_plan(settings)
+        if not flow_trpls:
+            print('WARNING: ' + flow + ' does not use GEFS data, skipping')
+            continue
+
+        trpls += flow_trpls
+        cyc_inc.append(int(settings['CYC_INC']))
+        bkg_int.append(int(settings.get('CTR_BKG_INT',
+                                        settings.get('ENS_BKG_INT'))))
+
+    plan = set(trpls)
+    if not plan:
+        return plan, {'requested': 0, 'planned': 0, 'naive': 0}
+
+    inits = [init for init, _, _ in plan]
+    n_init = int((max(inits) - min(inits)).total_seconds() / 3600 /
+                 min(cyc_inc)) + 1
+    n_fhr = len(fcst_hours(max([fhr for _, fhr, _ in plan]), min(bkg_int)))
+    n_mem = len(set([mem for _, _, mem in plan]))
+    return plan, {
+                  'requested': len(trpls),
+                  'planned'  : len(plan),
+                  'naive'    : n_init * n_fhr * n_mem,
+                 }
+
+def plan_groups(plan):
+    """ Groups a plan into the zero hours to download
+
+    Returns a sorted list of (zero hour, forecast hour strings, members), with
+    one entry for each set of members sharing the same forecast hours, in the
+    format of the dates / fcsts generated by fcst_dt_hr."""
+
+    inits = {}
+    for init, fhr, mem in plan:
+        inits.setdefault(init, {}).setdefault(mem, set()).add(fhr)
+
+    groups = []
+    for init in sorted(inits):
+        fhrs = {}
+        for mem, mem_fhrs in inits[init].items():
+            fhrs.setdefault(tuple(sorted(mem_fhrs)), []).append(mem)
+
+        for fcsts in sorted(fhrs):
+            groups.append((init, [str(fhr) for fhr in fcsts],
+                           sorted(fhrs[fcsts])))
+
+    return groups
+
+def report(stats, n_streams=1):
+    # print the savings of a plan against the naive range
+    print('Cycle plan of (zero hour, forecast hour, member) objects x ' +\
+          str(n_streams) + ' streams:')
+    for name in ['requested', 'planned', 'naive']:
+        print('    %-10s %8s files'%(name, stats[name] * n_streams))
+
+    if stats['naive']:
+        print('    %.1f%% of the naive range is downloaded, %s files saved'%(
+              100 * stats['planned'] / stats['naive'],
+              (stats['naive'] - stats['planned']) * n_streams))
+
+##################################################################################
+# Report a plan
+##################################################################################
+if __name__ == '__main__':
+    plan, stats = cycle_plan(sys.argv[1:])
+    for init, fcsts, mems in plan_groups(plan):
+        print(init.strftime('%Y-%m-%dT%H') + ' f' + fcsts[0] + '-f' + fcsts[-1] +\
+              ' members ' + ','.join(['%02d'%mem for mem in mems]))
+
+    report(stats)
+
+##################################################################################
+# end
@@ -7,7 +7,7 @@
 # and centralized global variables.
 #
 # When calling this script one should provide one of the following arguments as
-# the script CALL = sys.argv[1]:
+# the first argument of the script, setting CALL:
 #    'model_levels' -- the script will download model level data
 #    'surf_levels'  -- the script will download surface level data
 #    'pres_levels'  -- the script will download pressure level data
@@ -18,11 +18,92 @@
 #                 https://cds.climate.copernicus.eu/
 #    STRT_DT   -- Beginning date for data downloaded
 #    STOP_DT   -- Inclusive end date for data downloaded
-#    DT_INT    -- Maximum number of dates to combine to a single download file
+#    DT_INT    -- Maximum number of dates to combine to a single download file,
+#                 None to plan the window from the size of the requests
 #    STRT_HR   -- First hour in each day to pull data
 #    HR_INT    -- Interval on which to pull data throughout the day
+#    ERA5_ROOT -- Directory of the downloads of each CALL in sub-directories
 #    DATA_ROOT -- Directory to which the combined grib files will be downloaded
 #                  default behavior is to download to directory based on CALL
+#    MAX_JOBS  -- Maximum number of queued / running CDS jobs per account
+#    MAX_FIELDS -- Maximum number of fields of a single request
+#    MAX_GB    -- Maximum estimated size of a single request in GB
+#    LEDGER    -- SQLite ledger of the requests, see era5_ledger.py, relative
+#                 to DATA_ROOT as the other paths below
+#    N_CONNS   -- Number of connections over which each result is downloaded
+#    CROP_BOX  -- (south, north, west, east) box in degrees to crop the files
+#                 to with grib_crop.py, None to keep global fields
+#    CROP_MARGIN -- Margin in degrees added to every side of CROP_BOX
+#    STAGES    -- Chain of GRIB stages run on each downloaded file, see
+#                 grib_stages.py, None for the GRIB1 conversion of
+#                 pre_process_ERA5.sh for model level data, followed by the
+#                 crop to CROP_BOX if set
+#    N_PROCS   -- Number of processes running the GRIB stages
+#    KEEP_ORIG -- Keep the downloaded file, writing the processed file to the
+#                 same name with the suffix '.1', else replace it
+#    CYC_INC   -- Interval of the cycles in hours into which the processed
+#                 files are split with grib_split.py, None to not split
+#    CYC_FCST  -- Hours after each cycle point included in its window
+#    CYC_ROOT  -- Directory of the cycle files, in sub-directories YYYYMMDDHH
+#    CACHE_ROOT -- Root of the GRIB cache shared between experiments, see
+#                 grib_cache.py, None to not cache
+#    CACHE_GB  -- Quota of the cache in GB
+#    CATALOG   -- SQLite catalog of the downloaded files, see grib_catalog.py,
+#                 None to not catalog
+#    TELEMETRY -- JSON lines log of the request events, see telemetry.py, None
+#                 to not log
+#    PROM_FILE -- Prometheus textfile of the totals of the events, None to not
+#                 export
+#    MIN_FREE_GB -- Free space in GB to leave on the file system of DATA_ROOT,
+#                 the run is refused if the estimated downloads leave less
+#
+# With CACHE_ROOT set, requests are looked up in the cache by the hash of their
+# dataset and request before they are submitted, and results are added to the
+# cache once downloaded, before any GRIB stage.
+#
+# Each file is recorded in CATALOG with its checksum and the valid times of its
+# messages once downloaded and processed, so that the valid times on disk can
+# be queried without touching the file system.
+#
+# The queue time at CDS, transfer time, bytes and retries of each request,
+# the throttling of each account and the processing time of each file are
+# recorded as JSON lines in TELEMETRY, with credentials redacted, and their
+# totals are printed and written as a summary at the end of the run.
+#
+# Each downloaded file is handed to the GRIB stages as soon as it is complete,
+# so that the processing overlaps the remaining downloads, and is then split
+# into the messages of each cycle window for ungrib.
+#
+# The CDS request ID, account and state of each request are recorded in LEDGER,
+# so that a restarted download reattaches to jobs still queued, running or
+# completed at CDS, and only submits requests again which failed or expired.
+#
+# The number of days combined into each request is planned with era5_plan.py
+# from the estimated fields and bytes of the request of CALL, as the largest
+# window under MAX_FIELDS and MAX_GB, reduced so that every account slot has a
+# request where the date range allows.  Call the script with --dry-run after
+# CALL to print the plan and estimated sizes without submitting, e.g.,
+#
+#     python download_ERA5.py model_levels --dry-run
+#
+# The date range, the download directory and the CDS endpoint can be given on
+# the command line instead, e.g.,
+#
+#     python download_ERA5.py surf_levels --start 2019-02-01 --stop 2019-02-28
+#
+# and the script can be imported without side effects, with the download run
+# by main(argv) as from the command line.
+#
+# Before submitting, the requests, the estimated bytes, the files already
+# present and the wall time projected from the throughput of the earlier runs
+# in TELEMETRY are printed with preflight.py, and the run is refused if the
+# estimated downloads leave less than MIN_FREE_GB free.  Call the script with
+# --plan to print the estimate only, exiting with status 1 if it does not fit.
+#
+# Requests are scheduled over all accounts in AUTHS with cds_sched.py, handing
+# the next request to any account as soon as it has a free slot, so that up to
+# MAX_JOBS times the number of accounts requests run concurrently.  Accounts
+# which are full or throttled are backed off exponentially.
 #
 ##################################################################################
 # License Statement:
@@ -64,17 +145,26 @@
 ##################################################################################
 # Imports
 ##################################################################################
-import cdsapi
 import signal, time, random
 import os, sys, ssl
-import urllib3
-from http.client import HTTPSConnection
-from base64 import b64encode
-import concurrent.futures
+import argparse
 import json
 import pprint
 import calendar
 from datetime import date, timedelta
+from cds_api import CDSClient, CDSError
+import cds_sched
+import era5_plan
+import grib_split
+from functools import partial
+from era5_ledger import Ledger, IN_FLIGHT
+from grib_stages import StagePool
+from grib_cache import Cache, cds_key
+from grib_catalog import Catalog
+from grib_crop import crop_spec
+from telemetry import Telemetry, OFF
+from manifest import check_file
+import preflight
 
 ##################################################################################
 # SET PARAMETERS 
@@ -83,19 +173,25 @@ from datetime import date, timedelta
 # include multiple accounts in the list for more downloads simulataneously
 AUTHS = [b'xxxxxx:xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx']
 
-# which type of data to download, defined in script call
-CALL = sys.argv[1]
+# which type of data to download, set from the script call
+CALL = 'model_levels'
 
-# root directory where date stamped sub-directories will collect data downloads
-DATA_ROOT = '/cw3e/mead/projects/cwp106/scratch' +\
-    '/DATA/ERA5/' + CALL + '/'
+# root directory of the downloads, with a sub-directory for each CALL, and the
+# directory of the downloads of CALL, None for ERA5_ROOT + CALL + '/'
+ERA5_ROOT = '/cw3e/mead/projects/cwp106/scratch/DATA/ERA5/'
+DATA_ROOT = None
 
 # define the start and end year / month / day in YYYY-MM-DD formated string values
 STRT_DT = '2019-02-08'
 STOP_DT = '2019-02-08'
 
+# ledger of requests and CDS jobs for restarts, relative to the download
+# directory
+LEDGER = '.ledger.sqlite'
+
 # interval over which to combine days into single files for download, format Int
-DT_INT = 1
+# or None to plan the interval from the request size of CALL
+DT_INT = None
 
 # first hour to get data, format Int
 STRT_HR = 11
@@ -103,35 +199,60 @@ STRT_HR = 11
 # interval on which to get additional data
 HR_INT = 1
 
+# maximum number of queued / running CDS jobs per account
+MAX_JOBS = 5
+
+# maximum number of fields / estimated GB of data of a single request
+MAX_FIELDS = 120000
+MAX_GB = 40
+
+# number of concurrent byte range connections per result download
+N_CONNS = 8
+
+# (south, north, west, east) box in degrees to crop the files to, None to keep
+# global fields, with a margin in degrees on every side
+CROP_BOX = None
+CROP_MARGIN = 2.0
+
+# chain of GRIB stages run on each file, None for the default of CALL, see
+# get_stages, number of processes and if the original downloaded file is kept
+STAGES = None
+N_PROCS = 4
+KEEP_ORIG = False
+
+# interval of the cycles in hours to split files into, None for no split, the
+# forecast hours of the window of each cycle and the root of the cycle files
+# relative to the download directory
+CYC_INC = None
+CYC_FCST = 0
+CYC_ROOT = 'cycles/'
+
+# root of the GRIB cache shared between experiments, None to not cache, and
+# its quota in GB
+CACHE_ROOT = None
+CACHE_GB = 500
+
+# catalog of the downloaded files, relative to the download directory, None
+# to not catalog
+CATALOG = '.catalog.sqlite'
+
+# JSON lines log of the request events, relative to the download directory,
+# None to not log, and the Prometheus textfile of their totals, None to not
+# export
+TELEMETRY = '.telemetry.jsonl'
+PROM_FILE = None
+
+# free space in GB to leave on the file system of the download directory, see
+# preflight.py
+MIN_FREE_GB = 50
+
+# CDS API endpoint, set to e.g., 'http://localhost:9100/api/v2' for a stand-in
+CDS_URL = 'https://cds.climate.copernicus.eu/api/v2'
+
 ##################################################################################
 # UTILITY METHODS
 ##################################################################################
 
-def get_creds_to_use():
-    random.shuffle(AUTHS)
-    for auth in AUTHS:
-        #Rotate the list
-        print(auth)
-        c = HTTPSConnection('cds.climate.copernicus.eu')
-        c
-        userAndPass = b64encode(auth).decode('ascii')
-        headers = { 'Authorization' : 'Basic %s' %  userAndPass }
-        c.request('GET', '/api/v2/tasks/', headers=headers)
-        res = c.getresponse()
-        result = res.read()
-        data = json.loads(result)
-        count = 0
-        tcount = 0
-        for res in data:
-            tcount += 1
-            if res['state'] in ['queued','running']:
-                count += 1
-        print('%s had %s in process, %s were queued or running'%(auth, tcount, count))
-        if count < 5:
-            return auth
-
-    return None
-
 def get_call(call, date1, date2, hours):
     # defines calls for cdsapi downloads in pre-set forms
     if call == 'model_levels':
@@ -205,27 +326,162 @@ def get_call(call, date1, date2, hours):
                 }
                }
 
-def get_file(req, key, call):
-    # starts and monitors download
-    req[0] = cdsapi.Client(
-                           key=key,
-                           url='https://cds.climate.copernicus.eu/api/v2',
-                           wait_until_complete=True,
-                           full_stack=True
-                          )
-    req[0].info('Download client started')
-    req[0].info('Saving file to using key (%s): %s' %(key, req[4]))
-    
-    retrieve_call = get_call(call, req[1], req[2], req[3])
-    retrieve_key = [*retrieve_call][0]
-    req[5] = req[0].retrieve(retrieve_key, retrieve_call[retrieve_key], req[4])
-    req[0].info('Download complete!')
-    del req[5]
-    req[0].info('Done')
+def reattach(client, req, ledger, clients):
+    """ Looks up the job of a request recorded in the ledger at CDS
+
+    clients is a dictionary of the CDSClient of each account by UID.  Returns
+    the reply of the job and the client of the account which submitted it, or
+    None and client if the request has no job which can be reattached."""
+
+    row = ledger.get(req[4])
+    if row is None or row['state'] not in IN_FLIGHT or\
+            row['account'] not in clients:
+        return None, client
+
+    owner = clients[row['account']]
+    try:
+        reply = owner.status(row['request_id'])
+
+    except CDSError as err:
+        if err.throttled:
+            raise
+
+        print('Request %s for %s not found, submitting again'%(
+              row['request_id'], req[4]))
+        ledger.update(req[4], state='planned', request_id=None, account=None)
+        return None, client
+
+    if reply.get('state') not in ['queued', 'running', 'completed']:
+        print('Request %s for %s %s at CDS, submitting again'%(
+              row['request_id'], req[4], reply.get('state')))
+        ledger.update(req[4], state='failed')
+        return None, client
+
+    req[0] = row['account']
+    req[5] = row['request_id']
+    print('Request %s for %s reattached with %s, %s'%(req[5], req[4], req[0],
+                                                      reply['state']))
+    return reply, owner
+
+def get_file(client, req, call, ledger=None, clients=None, stages=None,
+             cache=None, catalog=None, telemetry=None):
+    """ Submits a request, waits for its result and downloads it
+
+    client is the CDSClient of the account scheduled for the request, req is a
+    request as generated by get_reqs, with the account UID stored in req[0] and
+    the request ID stored in req[5].  The result is written to a hidden
+    temporary file and renamed to req[4] once its size matches the reply.
+    Raises a CDSError if CDS refuses or fails the request.
+
+    If ledger is an era5_ledger.Ledger, each state change of the request is
+    recorded, and a job queued, running or completed at CDS under one of the
+    accounts of clients is reattached with reattach instead of submitted.  If
+    stages is a grib_stages.StagePool, the file is submitted to it once it is
+    downloaded.  If cache is a grib_cache.Cache, a cached result of the same
+    request is linked to req[4] without submitting, and downloaded results are
+    added to the cache.  If catalog is a grib_catalog.Catalog, files which are
+    not handed to stages are added to it on its own threads.  The request is
+    recorded as a request event of telemetry, with the wait for the job at CDS
+    from its submission or reattachment as its queue time."""
+
+    telemetry = telemetry or OFF
+    with telemetry.span('request', path=req[4]) as ev:
+        retrieve_call = get_call(call, req[1], req[2], req[3])
+        retrieve_key = [*retrieve_call][0]
+        key = None
+        if cache is not None:
+            key = cds_key(retrieve_key, retrieve_call[retrieve_key])
+            if cache.get(key, req[4]):
+                print('Request for %s served from the cache'%req[4])
+                ev['cache'] = 'hit'
+                if ledger is not None:
+                    ledger.update(req[4], state='downloaded',
+                                  size=os.path.getsize(req[4]))
+
+                if stages is not None:
+                    stages.submit(req[4])
+                elif catalog is not None:
+                    catalog.submit(req[4])
+
+                return
+
+        reply = None
+        if ledger is not None:
+            reply, client = reattach(client, req, ledger, clients or {})
+            ev['reattached'] = reply is not None
+
+        if reply is None:
+            reply = client.submit(retrieve_key, retrieve_call[retrieve_key])
+            req[0] = client.uid
+            req[5] = reply['request_id']
+            print('Request %s for %s queued with %s'%(req[5], req[4],
+                                                      client.uid))
+            if ledger is not None:
+                ledger.update(req[4], state='submitted', request_id=req[5],
+                              account=req[0])
+
+        ev['account'] = client.uid
+        ev['request_id'] = req[5]
+        t0 = time.monotonic()
+        try:
+            reply = client.wait(reply)
+
+        except CDSError as err:
+            if ledger is not None and err.status is None:
+                ledger.update(req[4], state='failed')
+
+            raise
+
+        if ledger is not None:
+            ledger.update(req[4], state='completed',
+                          size=reply.get('content_length'))
+
+        head, tail = os.path.split(req[4])
+        tmp = os.path.join(head, '.' + tail + '.part')
+        ev['queue_s'] = round(time.monotonic() - t0, 6)
+        t0 = time.monotonic()
+        nbytes = client.download(reply['location'], tmp, n_conns=N_CONNS)
+        ev['transfer_s'] = round(time.monotonic() - t0, 6)
+        ev['bytes'] = nbytes
+        if nbytes != reply.get('content_length', nbytes):
+            os.remove(tmp)
+            raise IOError('incomplete result for %s, %s of %s bytes'%(
+                          req[4], nbytes, reply['content_length']))
+
+        os.replace(tmp, req[4])
+        if ledger is not None:
+            ledger.update(req[4], state='downloaded', size=nbytes)
+
+        client.delete(req[5])
+        if cache is not None:
+            cache.put(key, req[4], source=req[5])
+
+        if stages is not None:
+            stages.submit(req[4])
+        elif catalog is not None:
+            catalog.submit(req[4])
+
+        print('Download complete %s %s bytes'%(req[4], nbytes))
+
+def data_root():
+    # directory of the downloads of CALL
+    return DATA_ROOT or ERA5_ROOT + CALL + '/'
+
+def get_stages():
+    # chain of GRIB stages of CALL, STAGES if set, else the GRIB1 conversion
+    # of model level data, followed by the crop to CROP_BOX if set
+    if STAGES is not None:
+        return list(STAGES)
+
+    stages = ['to_grib1'] if CALL == 'model_levels' else []
+    if CROP_BOX:
+        stages.append(crop_spec(CROP_BOX, CROP_MARGIN))
+
+    return stages
 
 def get_reqs(strt_dt, stop_dt, interval, hours):
     # generates requests based on script parameters, appending reqs with
-    # [client, date0, date1, hours, output file, running download])
+    # [account, date0, date1, hours, output file, request ID])
     reqs = []
     dates_range = max([int((stop_dt - strt_dt).days) + 1])
 
@@ -235,7 +491,7 @@ def get_reqs(strt_dt, stop_dt, interval, hours):
         if n + interval >= dates_range:
             d0 = (strt_dt + timedelta(n)).strftime('%Y-%m-%d')
             d1 = stop_dt.strftime('%Y-%m-%d')
-            path = DATA_ROOT + '%s--%s_'%(d0, d1) + CALL + '.grib'
+            path = data_root() + '%s--%s_'%(d0, d1) + CALL + '.grib'
             reqs.append([None, d0, d1, hours, path, None])
             break
         else:
@@ -243,68 +499,229 @@ def get_reqs(strt_dt, stop_dt, interval, hours):
             # length interval
             d0 = (strt_dt + timedelta(n)).strftime('%Y-%m-%d')
             d1 = (strt_dt + timedelta(n + interval - 1)).strftime('%Y-%m-%d') 
-            path = DATA_ROOT + '%s--%s_'%(d0, d1) + CALL + '.grib'
+            path = data_root() + '%s--%s_'%(d0, d1) + CALL + '.grib'
             reqs.append([None, d0, d1, hours, path, None])
     
     return reqs
 
+def get_hours():
+    # defines all hours to download data from STRT_HR and HR_INT
+    hours = str(STRT_HR).zfill(2) + ':00:00'
+    for i in range(STRT_HR + HR_INT, 24, HR_INT):
+        hours += '/' + str(i).zfill(2) + ':00:00'
+
+    return hours
+
+def req_size(call, date1, date2, hours):
+    # estimated fields and bytes of the payload of a request
+    retrieve_call = get_call(call, date1, date2, hours)
+    return era5_plan.req_size(retrieve_call[[*retrieve_call][0]])
+
+def plan_reqs(strt_dt, stop_dt, hours, n_slots):
+    """ Generates requests with the window planned from the size of CALL
+
+    The window is planned with era5_plan.plan_window from the size of a single
+    day request, under MAX_FIELDS and MAX_GB and DT_INT if it is set, for
+    n_slots concurrent jobs.  Returns the requests and the list of estimated
+    (fields, bytes) of each request."""
+
+    day = strt_dt.strftime('%Y-%m-%d')
+    day_fields, day_bytes = req_size(CALL, day, day, hours)
+    interval = era5_plan.plan_window(day_fields, day_bytes,
+                                     (stop_dt - strt_dt).days + 1, n_slots,
+                                     MAX_FIELDS, MAX_GB * 1e9, max_days=DT_INT)
+
+    reqs = get_reqs(strt_dt, stop_dt, interval, hours)
+    sizes = [req_size(CALL, req[1], req[2], hours) for req in reqs]
+    return reqs, sizes
+
+def get_preflight(reqs, sizes, ledger=None):
+    """ Totals of the pre-flight estimate of requests
+
+    sizes are the estimated (fields, bytes) of each request from plan_reqs.
+    Requests whose file passes ledger.is_done, or ends with a complete GRIB
+    message if ledger is None, are present and not transferred, as skipped by
+    main.  The ledger is not updated."""
+
+    plan = preflight.totals()
+    for req, (fields, size) in zip(reqs, sizes):
+        if ledger is not None:
+            present = ledger.is_done(req[4], update=False)
+        else:
+            present = check_file(req[4]) is None
+
+        preflight.add(plan, size, present, transfer=not present,
+                      local=os.path.getsize(req[4]) if os.path.isfile(req[4])
+                      else 0)
+
+    return plan
+
+def main(argv=None):
+    """ Downloads the requests of CALL over the accounts in AUTHS
+
+    argv is the list of command line arguments, defaulting to sys.argv[1:],
+    with the type of data first.  CALL, DATA_ROOT, STRT_DT, STOP_DT and CDS_URL
+    are set from the arguments.  Returns the exit status of the script, 1 if
+    any request or GRIB stage failed."""
+
+    global CALL, DATA_ROOT, STRT_DT, STOP_DT, CDS_URL
+    parser = argparse.ArgumentParser()
+    parser.add_argument('call', choices=['model_levels', 'surf_levels',
+                                         'pres_levels'],
+                        help='type of data to download')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the plan of the requests and exit')
+    parser.add_argument('--plan', action='store_true',
+                        help='print the pre-flight estimate of the run and '
+                        'exit, 1 if it does not fit')
+    parser.add_argument('--start', default=STRT_DT,
+                        help='first date YYYY-MM-DD, default STRT_DT')
+    parser.add_argument('--stop', default=STOP_DT,
+                        help='last date YYYY-MM-DD, default STOP_DT')
+    parser.add_argument('--data-root', default=DATA_ROOT,
+                        help='download directory, default ERA5_ROOT/CALL')
+    parser.add_argument('--url', default=CDS_URL,
+                        help='CDS API endpoint, default CDS_URL')
+    args = parser.parse_args(argv)
+    CALL = args.call
+    DATA_ROOT = os.path.join(args.data_root, '') if args.data_root else None
+    STRT_DT = args.start
+    STOP_DT = args.stop
+    CDS_URL = args.url
+    down_dir = data_root()
+
+    # define date range to get data
+    strt_dt = date.fromisoformat(STRT_DT)
+    stop_dt = date.fromisoformat(STOP_DT)
+
+    # define all hours to download data
+    hours = get_hours()
+
+    # define all requests based on script parameters and the request size
+    n_slots = len(AUTHS) * MAX_JOBS
+    reqs, sizes = plan_reqs(strt_dt, stop_dt, hours, n_slots)
+    if args.dry_run:
+        print('Download plan for ' + CALL + ': ' + STRT_DT + ' -- ' + STOP_DT)
+        era5_plan.report(reqs, sizes, n_slots)
+        return 0
+
+    # estimated bytes and wall time of the requests left, against free space,
+    # with the ledger of an earlier run
+    print('Pre-flight estimate for ' + CALL + ': ' + STRT_DT + ' -- ' + STOP_DT)
+    ledger_path = os.path.join(down_dir, LEDGER)
+    ledger = Ledger(ledger_path) if os.path.isfile(ledger_path) else None
+    plan = get_preflight(reqs, sizes, ledger)
+    if ledger is not None:
+        ledger.close()
+
+    fits = preflight.report(plan, down_dir, log=os.path.join(down_dir,
+                            TELEMETRY) if TELEMETRY else None,
+                            event='request', min_free_gb=MIN_FREE_GB)
+    if args.plan or not fits:
+        return 0 if fits else 1
+
+    # make sure download directory exists
+    print('Creating download directory ' + down_dir)
+    os.makedirs(down_dir, exist_ok=True)
+
+    # record the requests in the ledger of the download directory
+    ledger = Ledger(ledger_path)
+    ledger.plan(CALL, reqs, sizes)
+    cache = Cache(CACHE_ROOT, quota_gb=CACHE_GB) if CACHE_ROOT else None
+    catalog = None
+    if CATALOG:
+        catalog = Catalog(os.path.join(down_dir, CATALOG))
+
+    telemetry = Telemetry(os.path.join(down_dir, TELEMETRY) if TELEMETRY else
+                          None, prom=PROM_FILE, job='era5_' + CALL)
+    clients = {}
+    for key in AUTHS:
+        client = CDSClient(key, url=CDS_URL, telemetry=telemetry)
+        clients[client.uid] = client
+
+    def processed(path, out, size):
+        # record a file through the GRIB stages in the ledger and catalog
+        ledger.update(path, state='processed',
+                      **({} if KEEP_ORIG else {'size': size}))
+        if catalog is not None:
+            # checksum and inventory off the thread of the pool
+            catalog.submit(out)
+
+    # GRIB stages of the downloaded files, recorded in the ledger when done
+    stages = None
+    post = None
+    if CYC_INC:
+        post = partial(grib_split.split_file,
+                       out_root=os.path.join(down_dir, CYC_ROOT),
+                       cyc_inc=CYC_INC, fcst_hrs=CYC_FCST)
+
+    names = get_stages()
+    if names or post:
+        stages = StagePool(names, n_procs=N_PROCS, keep=KEEP_ORIG, post=post,
+                           done=processed, telemetry=telemetry)
+
+    # storage for outsanding requests
+    outstanding_reqs = []
+
+    print('Download date range: ' + STRT_DT + ' -- ' + STOP_DT)
+    print('Download hours ' + hours)
+    print('Download directory ' + down_dir)
+    print('Checking requests for duplicates')
+
+    # check for intact files corresponding to request in case of restart
+    for req in reqs:
+        if ledger.is_done(req[4]):
+            print('Skipping %s file already found'%(req[4]))
+            if stages is not None and\
+                    ledger.get(req[4])['state'] == 'downloaded':
+                stages.submit(req[4])
+
+            continue
+        outstanding_reqs.append(req)
+
+    # jobs still at CDS are reattached first
+    outstanding_reqs.sort(key=lambda req: (ledger.get(req[4])['state'] not in
+                                           IN_FLIGHT))
+
+    print('+------------------------------------------+')
+    for req in outstanding_reqs:
+        print('Requesting download ' + req[4])
+
+    print('+------------------------------------------+')
+    done, failed = cds_sched.run_jobs(AUTHS, outstanding_reqs,
+                                      lambda client, req:
+                                      get_file(client, req, CALL, ledger,
+                                               clients, stages, cache,
+                                               catalog, telemetry),
+                                      max_jobs=MAX_JOBS, url=CDS_URL,
+                                      telemetry=telemetry)
+
+    print('+------------------------------------------+')
+    print('%s requests downloaded, %s failed'%(len(done), len(failed)))
+    for req, err in failed:
+        print('Failed %s: %s'%(req[4], err))
+
+    bad = []
+    if stages is not None:
+        print('Waiting for the GRIB stages')
+        bad = stages.close()
+        for path, err in bad:
+            print('Failed processing %s: %s'%(path, err))
+
+    print('Ledger ' + ledger_path + ' %s'%ledger.counts())
+    ledger.close()
+    if catalog is not None:
+        catalog.close()
+
+    telemetry.report()
+    telemetry.close()
+    return 1 if failed or bad else 0
+
 ##################################################################################
 # Download data
 ##################################################################################
-# make sure download directory exists
-print('Creating download directory ' + DATA_ROOT)
-os.system('mkdir -p ' + DATA_ROOT)
-
-# disable warnings
-urllib3.disable_warnings()
-
-# define date range to get data
-strt_dt = date.fromisoformat(STRT_DT)
-stop_dt = date.fromisoformat(STOP_DT)
-
-# define all hours to download data
-hours = str(STRT_HR).zfill(2) + ':00:00'
-for i in range(STRT_HR + HR_INT, 24, HR_INT):
-    hours += '/' + str(i).zfill(2) + ':00:00'
-
-# define all requests based on script parameters
-reqs = get_reqs(strt_dt, stop_dt, DT_INT, hours)
-
-# storage for outsanding requests
-outstanding_reqs = []
-
-print('Download date range: ' + STRT_DT + ' -- ' + STOP_DT)
-print('Download hours ' + hours)
-print('Download directory ' + DATA_ROOT)
-print('Checking requests for duplicates')
-
-# check for existing files corresponding to request in case of restart
-for req in reqs:
-    if os.path.isfile(req[4]):
-        print('Skipping %s file already found'%(req[4]))
-        continue
-    outstanding_reqs.append(req)
-
-print('+------------------------------------------+')
-for req in outstanding_reqs:
-    print('Requesting download ' + req[4])
-
-print('+------------------------------------------+')
-with concurrent.futures.ThreadPoolExecutor(max_workers=4) as e:
-    for req in outstanding_reqs:
-        time.sleep(15)
-        print(req[4])
-        auth = None
-        while auth == None:
-            auth = get_creds_to_use()
-            if auth == None:
-                print('Did not get auth, sleep for an hour')
-                time.sleep(60*60*1)
-            else:
-                print('Got auth: %s'%(auth))
-
-        e.submit(get_file, req, auth.decode('ascii'), CALL)
-
+if __name__ == '__main__':
+    sys.exit(main())
 
 ##################################################################################
 # end
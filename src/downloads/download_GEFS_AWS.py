@@ -19,8 +19,97 @@
 #     2018-07-27 to 2020-09-22
 #     2020-09-23 to PRESENT
 #
-# the exclude statements in the below are designed to handle these exceptions
-# using a recurisive copy from a base path.
+# the filter rules in the below are designed to handle these exceptions by
+# listing all objects under the base path of each zero hour a single time.
+#
+# Objects are downloaded in-process with an anonymous S3 client, using a pool of
+# N_WORKERS threads, so that the AWS Command Line Interface is not required.
+# ENDPOINT_URL can be set to a local S3 stand-in for testing.
+#
+# With IF_SUBSET = True, only the GRIB2 messages of the variables / levels read
+# by ungrib are downloaded, using byte ranges from the .idx inventory of each
+# object.  The records are chosen from the GRIB2 columns of VTABLE, or from the
+# explicit 'VAR:LEVEL' list SUBSET_VARS if this is non-empty.
+#
+# Each date stamped directory keeps a manifest of the key, size, ETag and local
+# path of the objects downloaded, see manifest.py.  With IF_CLOB = False a fresh
+# listing is compared against the manifest and only new or changed objects are
+# downloaded.  Files from before the manifest was introduced are adopted into
+# the manifest when their size matches the listing.
+#
+# With IF_LIST = False the base path is not listed, and the exact keys of the
+# GEFS_RES / STREAMS files of each member are resolved for the layout era of the
+# zero hour with gefs_keys.py.  Keys missing from the bucket are reported and
+# skipped, and zero hours without the members or resolution are reported as
+# failed.
+#
+# Objects are written directly to their flat destination DATA_ROOT/YYYYMMDD/,
+# first to a hidden temporary file in the same directory and then renamed once
+# complete, so that ungrib never sees a partially written file and concurrent
+# runs over different dates or zero hours do not interfere.
+#
+# Files are verified against the size and ETag of the object, and the GRIB end
+# section, before they are renamed and recorded in the manifest.  A partial
+# file left by an interrupted run is resumed with a Range request rather than
+# downloaded again.  Run with
+#
+#     python download_GEFS_AWS.py --verify [--checksum]
+#
+# to audit an existing DATA_ROOT tree, checking many files concurrently and
+# dropping failed files from the manifests so the next sync replaces them.
+#
+# Instead of the date range below, the data read by the cycling workflows can
+# be downloaded with
+#
+#     python download_GEFS_AWS.py --cycle-plan flow.cylc [flow.cylc ...]
+#
+# which plans the deduplicated zero hours, forecast hours and members consumed
+# by the ungrib tasks of the flows with cycle_plan.py, reporting the savings
+# against the naive padded range.  IF_LIST = False is best suited to plans.
+#
+# The date range, DATA_ROOT, ENDPOINT_URL, N_WORKERS and IF_CLOB = False can be
+# given on the command line instead of edited below, e.g.,
+#
+#     python download_GEFS_AWS.py --start 2021-01-26T00 --stop 2021-01-26T18 \
+#         --data-root /path/to/GEFS --no-clob
+#
+# and the script can be imported without side effects, with the download run
+# by main(argv) as from the command line.
+#
+# With CACHE_ROOT set, objects are served from and added to a GRIB cache shared
+# by the experiments on the same file system, keyed by the object key, ETag and
+# subset fields, with least recently used objects evicted over CACHE_GB, see
+# grib_cache.py.
+#
+# Each file written is recorded with its member, forecast hour, checksum and
+# message inventory in the SQLite catalog CATALOG, which can be queried for the
+# holdings of DATA_ROOT without touching the file system, see grib_catalog.py.
+#
+# With CROP_BOX set, each file is repacked to simple packing and cropped to the
+# lat / lon box plus CROP_MARGIN with grib_crop.py on a pool of N_PROCS
+# processes before it is moved into place, keeping only the part of the global
+# fields covering the WRF domain.  The cache keeps the global files.
+#
+# The listing of each zero hour and the queue, transfer and finish times,
+# bytes and retries of each object are recorded as JSON lines in TELEMETRY,
+# summarized at the end of the run, and exported to the Prometheus textfile
+# PROM_FILE if set, see telemetry.py.
+#
+# With MIRRORS set, objects are read from the bucket and the mirrors listed,
+# other cloud copies or HTTP mirrors of the bucket layout and local archive
+# trees, from the source with the best throughput in the stats file
+# MIRROR_STATS, and a transfer slower than the HEDGE_PCT percentile of its
+# source is hedged with the next source, keeping whichever finishes first, see
+# gefs_mirrors.py.
+# Mirrors can also be added on the command line with --mirror URL_OR_PATH.
+#
+# Run with --plan to list each zero hour, or to HEAD each resolved key with
+# IF_LIST = False, and print the objects, exact bytes, files already present
+# and the wall time projected from the throughput of the earlier runs in
+# TELEMETRY with preflight.py, exiting with status 1 if the downloads would
+# leave less than MIN_FREE_GB free on the file system of DATA_ROOT.  With
+# PREFLIGHT = True, the same estimate is made before every download, at the
+# cost of these requests, and the run is refused if it does not fit.
 # 
 ##################################################################################
 # License Statement:
@@ -63,10 +152,26 @@
 # Imports
 ##################################################################################
 import os, sys, ssl
+import argparse
+import http.client
+import re
+import time
 import calendar
-import glob
+import concurrent.futures
 from datetime import datetime as dt
 from datetime import timedelta
+from aws_s3 import S3Client, S3Error
+import cycle_plan
+import gefs_keys
+import grib_idx
+import manifest as mfst
+from grib_cache import Cache, s3_key
+from grib_catalog import Catalog
+from grib_crop import crop_spec
+from grib_stages import StagePool
+from telemetry import Telemetry, OFF
+from gefs_mirrors import Mirrors, source
+import preflight
 
 ##################################################################################
 # SET GLOBAL PARAMETERS 
@@ -98,9 +203,81 @@ IF_CTRL = False
 # Download ensemble perturbations
 IF_PERT = True
 
-# Download all files or exlcude patterns of existing files True / False
+# Download all files or only new / changed files in the manifest True / False
 IF_CLOB = True
 
+# Compare the MD5 of downloaded files with single part ETags True / False
+IF_MD5 = True
+
+# Number of concurrent object downloads
+N_WORKERS = 16
+
+# S3 service endpoint, set to e.g., 'http://localhost:9000' for a local stand-in
+ENDPOINT_URL = 'https://s3.amazonaws.com'
+
+# Bucket hosting the GEFS data
+BUCKET = 'noaa-gefs-pds'
+
+# List the zero hour base path (True) or resolve object keys directly (False)
+IF_LIST = True
+
+# Resolution of resolved keys, '0p50' or '1p00' depending on the layout era,
+# None for 0p50 where the era has it, else 1p00
+GEFS_RES = None
+
+# GRIB2 streams of resolved keys
+STREAMS = ['a', 'b']
+
+# Download only the GRIB2 messages used by ungrib True / False
+IF_SUBSET = False
+
+# Vtable defining the messages used by ungrib for subsetting
+VTABLE = os.path.dirname(os.path.abspath(__file__)) +\
+        '/../../settings/shared/variable_tables/Vtable.GEFS'
+
+# Explicit 'VAR:LEVEL' records for subsetting, e.g., ['TMP:2 m above ground'],
+# overrides the VTABLE records if non-empty
+SUBSET_VARS = []
+
+# Root of the GRIB cache shared between experiments, None to not cache, and its
+# quota in GB, see grib_cache.py
+CACHE_ROOT = None
+CACHE_GB = 500
+
+# SQLite catalog of the files under DATA_ROOT, relative to DATA_ROOT, None to
+# not catalog
+CATALOG = '.catalog.sqlite'
+
+# (south, north, west, east) box in degrees to crop the files to, None to keep
+# global fields, with a margin in degrees on every side
+CROP_BOX = None
+CROP_MARGIN = 2.0
+
+# chain of GRIB stages run on each file before it is moved into place, None
+# for the crop to CROP_BOX if set, see get_stages and grib_stages.py, and the
+# number of processes running them
+STAGES = None
+N_PROCS = 4
+
+# JSON lines log of the transfer events relative to DATA_ROOT, None to not
+# log, and the Prometheus textfile of their totals, None to not export, see
+# telemetry.py
+TELEMETRY = '.telemetry.jsonl'
+PROM_FILE = None
+
+# copies of the bucket read besides BUCKET at ENDPOINT_URL, as base URLs or
+# local paths, the percentile of the seconds per byte of a source past which
+# it is hedged, and the transfer stats of the sources relative to DATA_ROOT,
+# see gefs_mirrors.py
+MIRRORS = []
+HEDGE_PCT = 90
+MIRROR_STATS = '.mirrors.json'
+
+# estimate the size of every run before downloading, as with --plan, and the
+# free space in GB to leave on the file system of DATA_ROOT, see preflight.py
+PREFLIGHT = False
+MIN_FREE_GB = 50
+
 ##################################################################################
 # UTILITY METHODS
 ##################################################################################
@@ -108,8 +285,8 @@ IF_CLOB = True
 # standard string indentation
 INDT = '    '
 
-# base aws anonymous request
-CMD = 'aws s3 cp --no-sign-request s3://noaa-gefs-pds/gefs.'
+# patterns of keys excluded from any download
+EXCLUDE = ['chem', 'wave', 'geavg', 'gespr', '0p25']
 
 # method for generating forecast start date / forecast hour lengths
 def fcst_dt_hr(strt_dt, stop_dt, init_int, fcst_min, fcst_max, fcst_int):
@@ -145,91 +322,575 @@ def fcst_dt_hr(strt_dt, stop_dt, init_int, fcst_min, fcst_max, fcst_int):
 
     return dates, fcsts
 
+def key_filter(key, fcsts, if_ctrl, if_pert, members=None):
+    """ Determines if an object key is included in the download
+
+    key is the object key relative to the zero hour base path, fcsts is the
+    list of forecast hour strings as generated by fcst_dt_hr.  Keys ending in
+    the two or three digit padded forecast hours are included, unless they match
+    one of the EXCLUDE patterns, or the control / perturbation members are
+    switched off with if_ctrl / if_pert respectively.  If members is a list of
+    member indices, only the keys of these members are included."""
+
+    sfxs = tuple(['f' + fcst.zfill(2) for fcst in fcsts] +\
+                 ['f' + fcst.zfill(3) for fcst in fcsts])
+
+    if not key.endswith(sfxs):
+        return False
+
+    excl = EXCLUDE[:]
+    if not if_ctrl:
+        excl.append('gec')
+
+    if not if_pert:
+        excl.append('gep')
+
+    for pattern in excl:
+        if pattern in key:
+            return False
+
+    if members is not None:
+        names = ['gec00' if mem == 0 else 'gep%02d'%mem for mem in members]
+        return key.split('/')[-1].startswith(tuple(names))
+
+    return True
+
+def get_stages():
+    # chain of GRIB stages, STAGES if set, else the repack to simple packing
+    # and crop to CROP_BOX if set
+    if STAGES is not None:
+        return list(STAGES)
+
+    if CROP_BOX:
+        return ['to_simple', crop_spec(CROP_BOX, CROP_MARGIN)]
+
+    return []
+
+def member_name(key):
+    # ensemble member name gec00 / gepNN of an object key
+    return key.split('/')[-1][:5]
+
+def part_path(path):
+    # hidden temporary file for path on the same filesystem
+    head, tail = os.path.split(path)
+    return os.path.join(head, '.' + tail + '.part')
+
+def finish(tmp, path, obj, fields=None, stages=None, catalog=None):
+    """ Moves a verified download into place at path
+
+    If stages is a grib_stages.StagePool, the file is first processed on its
+    pool, waiting for the result.  A file failing a stage is removed and an
+    IOError raised, so that the object is reported as failed and downloaded
+    again by the next run.  If catalog is a grib_catalog.Catalog, the file is
+    recorded in it, with the ETag as the checksum of an unprocessed full single
+    part object."""
+
+    md5 = None
+    if stages is not None:
+        try:
+            stages.submit(tmp).result()
+
+        except Exception as exc:
+            # reported by the pool, which collects the failure
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+
+            raise IOError('processing failed, ' +
+                          (str(exc) or type(exc).__name__))
+    elif fields is None and obj['etag'] and\
+            re.fullmatch('[0-9a-f]{32}', obj['etag']):
+        md5 = obj['etag']
+
+    os.replace(tmp, path)
+    if catalog is not None:
+        catalog.add(path, md5=md5)
+
+def get_file(client, obj, path, fields=None, checksum=IF_MD5, cache=None,
+             catalog=None, stages=None, telemetry=None, queued=None):
+    """ Downloads and verifies a single object atomically to path
+
+    The object is written to part_path(path) and renamed to path once it passes
+    mfst.check_file.  A partial file left by an interrupted transfer is resumed
+    with a Range request for the remaining bytes, restarting only if the object
+    has changed.  Transfers dropped mid-stream are resumed up to client.retries
+    times, and a file failing verification is discarded and downloaded again.
+    If fields is a list of (VAR, LEVEL) records, the object is subset with
+    grib_idx and restarted on failure.  If cache is a grib_cache.Cache, the
+    object is served from the cache by its key, ETag and fields if present,
+    and added to it once downloaded, before any GRIB stage.  The verified file
+    is moved into place with finish, passing stages and catalog.  The object is
+    recorded as an object event of telemetry, with the time since queued, the
+    time.monotonic() of its submission, as its queue time.  Returns the number
+    of bytes downloaded, zero for a cache hit."""
+
+    telemetry = telemetry or OFF
+    with telemetry.span('object', key=obj['key'], path=path) as ev:
+        if queued is not None:
+            ev['queue_s'] = round(time.monotonic() - queued, 6)
+
+        tmp = part_path(path)
+        key = None
+        if cache is not None:
+            if not obj['etag']:
+                obj.update(client.head_object(obj['key']))
+
+            key = s3_key(client.bucket, obj['key'], obj['etag'], fields)
+            if cache.get(key, tmp):
+                ev['cache'] = 'hit'
+                t0 = time.monotonic()
+                finish(tmp, path, obj, fields, stages, catalog)
+                ev['finish_s'] = round(time.monotonic() - t0, 6)
+                return 0
+
+            ev['cache'] = 'miss'
+
+        nbytes = 0
+        t0 = time.monotonic()
+        for attempt in range(client.retries + 1):
+            ev['retries'] = attempt
+            try:
+                if fields is not None:
+                    nbytes += grib_idx.get_subset(client, obj['key'], tmp,
+                                                  fields, size=obj['size'])
+                    err = mfst.check_file(tmp)
+                else:
+                    nbytes += client.resume_object(obj['key'], tmp, obj)
+                    err = mfst.check_file(tmp, obj['size'], obj['etag'],
+                                          checksum=checksum)
+
+            except (OSError, http.client.HTTPException) as exc:
+                err = str(exc) or type(exc).__name__
+
+            if err is None:
+                ev['bytes'] = nbytes
+                if obj.get('source'):
+                    ev['source'] = obj['source']
+
+                ev['transfer_s'] = round(time.monotonic() - t0, 6)
+                t0 = time.monotonic()
+                if cache is not None:
+                    cache.put(key, tmp, source=obj['key'])
+
+                finish(tmp, path, obj, fields, stages, catalog)
+                ev['finish_s'] = round(time.monotonic() - t0, 6)
+                return nbytes
+
+            print(INDT * 2 + 'WARNING: ' + obj['key'] + ' ' + err +\
+                  ', attempt ' + str(attempt + 1))
+
+            if not os.path.isfile(tmp):
+                continue
+
+            if fields is not None or obj['size'] is None or\
+                    os.path.getsize(tmp) >= obj['size']:
+                # restart a subset or a complete file which failed
+                # verification, keeping a partial full file to be resumed
+                os.remove(tmp)
+
+        ev['bytes'] = nbytes
+        raise IOError('failed after ' + str(client.retries + 1) + ' attempts')
+
+def get_cycle(client, pool, date, fcsts, down_dir, manifest,
+              if_clob=IF_CLOB, if_ctrl=IF_CTRL, if_pert=IF_PERT, fields=None,
+              if_list=IF_LIST, members=None, cache=None, catalog=None,
+              stages=None, telemetry=None, failed=None):
+    """ Downloads all forecast hours for a single zero hour
+
+    If if_list is True, the base path of the zero hour is listed once with the
+    S3 client and all objects passing key_filter are submitted to the thread
+    pool.  Otherwise the keys are resolved directly with gefs_keys.  Files are
+    written flat into down_dir with get_file.  Unless if_clob is True, objects
+    which are current in the manifest of down_dir are skipped.  The manifest is
+    updated with the path of each file downloaded, and written to down_dir as
+    the files of each member complete.  If fields is a list of (VAR, LEVEL)
+    records, objects with an .idx inventory are subset to these records with
+    grib_idx.  If members is a list of member indices, e.g., from a cycle plan,
+    it replaces the members of if_ctrl / if_pert.  cache, catalog, stages and
+    telemetry are passed to get_file, and the listing is recorded as a list
+    event of telemetry.  An object failing to download is reported and the
+    remaining objects continue, with its key appended to failed if a list, as
+    is the prefix of a zero hour whose keys cannot be resolved.  Returns the
+    number of objects and the number of bytes downloaded."""
+
+    telemetry = telemetry or OFF
+    prfx = 'gefs.' + date.strftime('%Y%m%d') + '/' + date.strftime('%H') + '/'
+    if if_list:
+        print(INDT + 'Listing ' + prfx + '\n')
+        with telemetry.span('list', prefix=prfx) as ev:
+            listing = client.list_objects(prfx)
+            ev['objects'] = len(listing)
+
+        keys = set([obj['key'] for obj in listing])
+        objs = [obj for obj in listing if
+                key_filter(obj['key'][len(prfx):], fcsts, if_ctrl, if_pert,
+                           members)]
+    else:
+        print(INDT + 'Resolving keys of ' + prfx + '\n')
+        try:
+            mems = members
+            if mems is None:
+                mems = gefs_keys.gefs_members(date, if_ctrl, if_pert)
+
+            keys = None
+            objs = [{'key': key, 'size': None, 'etag': None} for key in
+                    gefs_keys.cycle_keys(date, fcsts, mems, STREAMS, GEFS_RES)]
+
+        except ValueError as err:
+            print(INDT * 2 + 'FAILED: ' + prfx + ' ' + str(err))
+            if failed is not None:
+                failed.append(prfx)
+
+            return 0, 0
+
+    # single read of the directory for resume checks
+    local = set(os.listdir(down_dir))
+
+    # submit in member order so that each member completes as early as possible
+    objs = sorted(objs, key=lambda obj: (member_name(obj['key']), obj['key']))
+
+    futs = {}
+    for obj in objs:
+        fname = obj['key'].split('/')[-1]
+        path = down_dir + fname
+        if not if_clob:
+            if mfst.is_current(manifest, obj, local):
+                continue
+
+            if obj['key'] not in manifest and fields is None and\
+                    obj['size'] is not None and fname in local and\
+                    os.path.isfile(path) and\
+                    os.path.getsize(path) == obj['size']:
+                # adopt a complete file from a run without a manifest
+                mfst.record(manifest, obj, path)
+                continue
+
+        kwargs = {'cache': cache, 'catalog': catalog, 'stages': stages,
+                  'telemetry': telemetry, 'queued': time.monotonic()}
+        if fields is not None and (keys is None or obj['key'] + '.idx' in keys):
+            fut = pool.submit(get_file, client, obj, path, fields, **kwargs)
+        else:
+            fut = pool.submit(get_file, client, obj, path, **kwargs)
+
+        futs[fut] = obj
+
+    print(INDT + 'Downloading ' + str(len(futs)) + ' of ' + str(len(objs)) +\
+          ' objects\n')
+
+    # objects left for each member, the manifest is written as each completes
+    left = {}
+    for obj in futs.values():
+        mem = member_name(obj['key'])
+        left[mem] = left.get(mem, 0) + 1
+
+    n_obj = 0
+    size = 0
+    for fut in concurrent.futures.as_completed(futs):
+        obj = futs[fut]
+        mem = member_name(obj['key'])
+        left[mem] -= 1
+        try:
+            nbytes = fut.result()
+
+        except S3Error as err:
+            if err.status == 404:
+                print(INDT * 2 + 'WARNING: ' + obj['key'] +\
+                      ' not found in bucket')
+            else:
+                print(INDT * 2 + 'FAILED: ' + obj['key'] + ' ' + str(err))
+                if failed is not None:
+                    failed.append(obj['key'])
+
+            nbytes = None
+
+        except (OSError, http.client.HTTPException) as err:
+            print(INDT * 2 + 'FAILED: ' + obj['key'] + ' ' +\
+                  (str(err) or type(err).__name__))
+            if failed is not None:
+                failed.append(obj['key'])
+
+            nbytes = None
+
+        if nbytes is not None:
+            print(INDT * 2 + obj['key'] + ' ' + str(nbytes) + ' bytes')
+            mfst.record(manifest, obj, down_dir + obj['key'].split('/')[-1])
+            n_obj += 1
+            size += nbytes
+
+        if not left[mem]:
+            # member complete, visible to gefs_ready before the zero hour is
+            mfst.write_manifest(down_dir, manifest)
+
+    return n_obj, size
+
+def get_plan(client, pool, groups, data_root, fields=None, if_clob=IF_CLOB,
+             cache=None, catalog=None, stages=None, telemetry=None):
+    """ Downloads a list of zero hours in order
+
+    groups is a list of (date, fcsts, members) for get_cycle, as generated by
+    cycle_plan.plan_groups, with members None for the members of IF_CTRL /
+    IF_PERT.  Files are written to date stamped directories of data_root, and
+    the manifest of each directory is written as each member completes, so that
+    the cycles of a running suite become ready with gefs_ready in cycle order.
+    if_clob and the further arguments are passed to get_cycle.  Returns the
+    keys of the objects which failed to download."""
+
+    failed = []
+    for date, fcsts, members in groups:
+        print('Downloading GEFS Date ' + date.strftime('%Y-%m-%d') + '\n')
+        print('Zero Hour ' + date.strftime('%H') + '\n')
+
+        down_dir = data_root + '/' + date.strftime('%Y%m%d') + '/'
+        os.makedirs(down_dir, exist_ok=True)
+
+        # manifest of objects already downloaded into the directory
+        manifest = mfst.read_manifest(down_dir)
+
+        get_cycle(client, pool, date, fcsts, down_dir, manifest,
+                  if_clob=if_clob, fields=fields, members=members, cache=cache,
+                  catalog=catalog, stages=stages, telemetry=telemetry,
+                  failed=failed)
+
+        mfst.write_manifest(down_dir, manifest)
+
+    return failed
+
+def head_key(client, key):
+    # listing entry of a resolved key from a HEAD request, size None if missing
+    try:
+        return dict(client.head_object(key), key=key)
+
+    except S3Error as err:
+        if err.status != 404:
+            raise
+
+        return {'key': key, 'size': None, 'etag': None}
+
+def plan_cycle(client, date, fcsts, down_dir, if_clob=IF_CLOB, members=None,
+               pool=None):
+    """ Totals of the pre-flight estimate of a single zero hour
+
+    The exact size of the objects of get_cycle is taken from a listing of the
+    base path of the zero hour, for the objects passing key_filter, or if
+    IF_LIST is False from a HEAD request for each key resolved with gefs_keys,
+    on pool if given, keys missing from the bucket being counted as missing.
+    Objects current in the manifest of down_dir, or complete files from a run
+    without a manifest, are present, and partial downloads are resumed.  Sizes
+    are of the full objects, an upper bound with IF_SUBSET."""
+
+    prfx = 'gefs.' + date.strftime('%Y%m%d') + '/' + date.strftime('%H') + '/'
+    if IF_LIST:
+        objs = [obj for obj in client.list_objects(prfx) if
+                key_filter(obj['key'][len(prfx):], fcsts, IF_CTRL, IF_PERT,
+                           members)]
+    else:
+        try:
+            mems = members
+            if mems is None:
+                mems = gefs_keys.gefs_members(date, IF_CTRL, IF_PERT)
+
+            keys = gefs_keys.cycle_keys(date, fcsts, mems, STREAMS, GEFS_RES)
+
+        except ValueError as err:
+            print('WARNING: ' + prfx + ' ' + str(err) + ', not planned')
+            return preflight.totals()
+
+        head = lambda key: head_key(client, key)
+        objs = list(pool.map(head, keys) if pool is not None else
+                    map(head, keys))
+
+    manifest = {}
+    local = set()
+    if os.path.isdir(down_dir):
+        manifest = mfst.read_manifest(down_dir)
+        local = set(os.listdir(down_dir))
+
+    plan = preflight.totals()
+    for obj in objs:
+        fname = obj['key'].split('/')[-1]
+        path = down_dir + fname
+        size = 0
+        if fname in local and os.path.isfile(path):
+            size = os.path.getsize(path)
+        present = mfst.is_current(manifest, obj, local) or\
+                  (obj['key'] not in manifest and fname in local and
+                   size == obj['size'])
+        tmp = part_path(path)
+        resume = os.path.getsize(tmp) if os.path.basename(tmp) in local else 0
+        preflight.add(plan, obj['size'], present,
+                      transfer=if_clob or not present,
+                      resume=resume if obj['size'] and resume < obj['size']
+                      else 0, local=size)
+
+    return plan
+
+def get_preflight(client, pool, groups, data_root, if_clob=IF_CLOB):
+    # totals of the pre-flight estimate of a list of zero hours, listed
+    # concurrently on pool, or in order with their HEAD requests on pool
+    plan = preflight.totals()
+    cycle = lambda group: plan_cycle(client, group[0], group[1],
+                                     data_root + '/' +
+                                     group[0].strftime('%Y%m%d') + '/',
+                                     if_clob=if_clob, members=group[2],
+                                     pool=None if IF_LIST else pool)
+    cycles = pool.map(cycle, groups) if IF_LIST else map(cycle, groups)
+    for cycle in cycles:
+        for key in plan:
+            plan[key] += cycle[key]
+
+    return plan
+
+def main(argv=None):
+    """ Downloads the zero hours of the date range or of a cycle plan
+
+    argv is the list of command line arguments, defaulting to sys.argv[1:],
+    with options overriding the global parameters of the date range, DATA_ROOT,
+    ENDPOINT_URL, N_WORKERS and IF_CLOB.  Returns the exit status of the
+    script, 1 if any file failed verification or a GRIB stage."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--verify', action='store_true',
+                        help='audit the files under DATA_ROOT and exit')
+    parser.add_argument('--checksum', action='store_true',
+                        help='with --verify, also compare MD5 against ETags')
+    parser.add_argument('--cycle-plan', nargs='+', metavar='FLOW',
+                        help='download the data planned from flow.cylc files')
+    parser.add_argument('--start', default=STRT_DT,
+                        help='first zero hour in iso format, default STRT_DT')
+    parser.add_argument('--stop', default=STOP_DT,
+                        help='last zero hour in iso format, default STOP_DT')
+    parser.add_argument('--data-root', default=DATA_ROOT,
+                        help='root of the downloads, default DATA_ROOT')
+    parser.add_argument('--endpoint-url', default=ENDPOINT_URL,
+                        help='S3 service endpoint, default ENDPOINT_URL')
+    parser.add_argument('--workers', type=int, default=N_WORKERS,
+                        help='concurrent object downloads, default N_WORKERS')
+    parser.add_argument('--no-clob', action='store_true',
+                        help='download only new / changed files as IF_CLOB '
+                        '= False')
+    parser.add_argument('--plan', action='store_true',
+                        help='print the pre-flight estimate of the run and '
+                        'exit, 1 if it does not fit')
+    parser.add_argument('--mirror', action='append', default=[],
+                        metavar='URL_OR_PATH',
+                        help='copy of the bucket to read besides MIRRORS')
+    args = parser.parse_args(argv)
+    data_root = args.data_root
+
+    if args.verify:
+        print('Verifying downloads at root ' + data_root + '\n')
+        bad = mfst.verify_tree(data_root, n_workers=args.workers,
+                               checksum=args.checksum)
+        for path in sorted(bad):
+            print(INDT + 'FAILED: ' + path + ' ' + bad[path])
+
+        print('\n' + str(len(bad)) + ' files failed verification, rerun with ' +\
+              'IF_CLOB = False to download them again\n')
+        return 1 if bad else 0
+
+    if args.cycle_plan:
+        # zero hours / forecast hours / members read by the cycle graphs
+        plan, stats = cycle_plan.cycle_plan(args.cycle_plan)
+        cycle_plan.report(stats, len(STREAMS))
+        groups = cycle_plan.plan_groups(plan)
+
+    else:
+        # define date range to get data
+        strt_dt = dt.fromisoformat(args.start)
+        stop_dt = dt.fromisoformat(args.stop)
+
+        # obtain combinations
+        dates, fcsts = fcst_dt_hr(strt_dt, stop_dt,
+                                  INIT_INT, FCST_MIN, FCST_MAX, FCST_INT)
+        groups = [(date, fcsts, None) for date in dates]
+
+    # records of GRIB2 messages to download when subsetting
+    fields = None
+    if IF_SUBSET and SUBSET_VARS:
+        fields = grib_idx.list_fields(SUBSET_VARS)
+    elif IF_SUBSET:
+        fields = grib_idx.vtable_fields(VTABLE)
+
+    # anonymous client shared by all download threads
+    client = S3Client(BUCKET, endpoint_url=args.endpoint_url)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers)
+    if_clob = IF_CLOB and not args.no_clob
+
+    # exact bytes and projected wall time of the run, against free space
+    if args.plan or PREFLIGHT:
+        print('Pre-flight estimate of ' + str(len(groups)) + ' zero hours\n')
+        fits = preflight.report(get_preflight(client, pool, groups, data_root,
+                                              if_clob=if_clob), data_root,
+                                log=os.path.join(data_root, TELEMETRY) if
+                                TELEMETRY else None, event='object',
+                                min_free_gb=MIN_FREE_GB)
+        print('\n')
+        if args.plan or not fits:
+            pool.shutdown()
+            return 0 if fits else 1
+
+    # events of the transfers, summarized at the end of the run
+    telemetry = Telemetry(os.path.join(data_root, TELEMETRY) if TELEMETRY
+                          else None, prom=PROM_FILE, job='gefs')
+
+    # reads hedged over the mirrors
+    mirrors = MIRRORS + args.mirror
+    if mirrors:
+        os.makedirs(data_root, exist_ok=True)
+        client = Mirrors([client] + [source(spec) for spec in mirrors],
+                         hedge_pct=HEDGE_PCT, n_workers=args.workers,
+                         stats=os.path.join(data_root, MIRROR_STATS)
+                         if MIRROR_STATS else None, telemetry=telemetry)
+
+    # cache shared with other experiments
+    cache = Cache(CACHE_ROOT, quota_gb=CACHE_GB) if CACHE_ROOT else None
+
+    # catalog of the files written
+    catalog = None
+    if CATALOG:
+        os.makedirs(data_root, exist_ok=True)
+        catalog = Catalog(os.path.join(data_root, CATALOG))
+
+    # GRIB stages run on each file before it is moved into place
+    stages = None
+    names = get_stages()
+    if names:
+        stages = StagePool(names, n_procs=N_PROCS, telemetry=telemetry)
+
+    # make requests
+    failed = get_plan(client, pool, groups, data_root, fields=fields,
+                      if_clob=if_clob, cache=cache, catalog=catalog,
+                      stages=stages, telemetry=telemetry)
+
+    pool.shutdown()
+    bad = []
+    if stages is not None:
+        bad = stages.close()
+
+    if catalog is not None:
+        catalog.close()
+
+    print('\n')
+    if mirrors:
+        client.close()
+        client.report()
+        print('\n')
+
+    telemetry.report()
+    telemetry.close()
+
+    print('\n')
+    if failed:
+        print(str(len(failed)) + ' objects failed, rerun to download them ' +\
+              'again\n')
+
+    print('Script complete -- verify the downloads at root ' + data_root + '\n')
+    return 1 if bad or failed else 0
+
 ##################################################################################
 # Download data
 ##################################################################################
-# define date range to get data
-strt_dt = dt.fromisoformat(STRT_DT)
-stop_dt = dt.fromisoformat(STOP_DT)
-
-# obtain combinations
-dates, fcsts = fcst_dt_hr(strt_dt, stop_dt,
-                          INIT_INT, FCST_MIN, FCST_MAX, FCST_INT)
-
-# make requests
-for date in dates:
-    print('Downloading GEFS Date ' + date.strftime('%Y-%m-%d') + '\n')
-    print('Zero Hour ' + date.strftime('%H') + '\n')
-
-    down_dir = DATA_ROOT + '/' + date.strftime('%Y%m%d') + '/'
-    os.system('mkdir -p ' + down_dir)
-
-    # Check for existing files to include in the exclude list
-    exc_list = sorted(glob.glob(down_dir + '*.f???'))
-    for i_l in range(len(exc_list)):
-        exc_list[i_l] = exc_list[i_l].split('/')[-1]
-
-    for fcst in fcsts:
-        # the following are the two and three digit padding versions of the hours
-        HH  = fcst.zfill(2)
-        HHH = fcst.zfill(3)
-        print(INDT + 'Forecast Hour ' + HH + '\n')
-        cmd = CMD + date.strftime('%Y%m%d') + '/' + date.strftime('%H') + ' ' +\
-              down_dir + ' ' +\
-              '--recursive ' +\
-              '--exclude \'*\'' + ' ' +\
-              '--include \'*f' + HH + '\' '  +\
-              '--include \'*f' + HHH + '\' '  +\
-              '--exclude \'*chem*\'' + ' ' +\
-              '--exclude \'*wave*\'' + ' ' +\
-              '--exclude \'*geavg*\'' + ' ' +\
-              '--exclude \'*gespr*\'' + ' ' +\
-              '--exclude \'*0p25*\' '
-
-        if not IF_CLOB:
-            for fname in exc_list:
-                cmd += '--exclude \'*' + fname + '\' '
-       
-        if not IF_CTRL:
-            cmd += '--exclude \'*gec*\' '
-
-        if not IF_PERT: 
-            cmd += '--exclude \'*gep*\' '
-
-        print(INDT * 2 + 'Running command:\n')
-        print(INDT * 3 + cmd + '\n')
-        os.system(cmd)
-
-    # unpack data from nested directory structure, excluding the root
-    print(INDT + 'Unpacking files from nested directories')
-    find_cmd = 'find ' + down_dir + ' -type f > file_list.txt'
-
-    print(find_cmd)
-    os.system(find_cmd)
-              
-    with open('./file_list.txt', 'r') as f:
-        print(INDT * 2 + 'Unpacking nested directory structure into ' + down_dir)
-        for line in f:
-            cmd = 'mv ' + line[:-1] + ' ' + down_dir
-            os.system(cmd)
-
-    find_cmd = 'find ' + down_dir + ' -type d > dir_list.txt'
-    print(find_cmd)
-    os.system(find_cmd)
-
-    with open('./dir_list.txt', 'r') as f:
-        print(INDT * 2 + 'Removing empty nested directories')
-        line_list = f.readlines()
-        line_list = line_list[-1:0:-1]
-
-        for line in line_list:
-            os.system('rmdir ' + line)
-
-    os.system('rm file_list.txt')
-    os.system('rm dir_list.txt')
-
-print('\n')
-print('Script complete -- verify the downloads at root ' + DATA_ROOT + '\n')
+if __name__ == '__main__':
+    sys.exit(main())
 
 ##################################################################################
 # end
@@ -0,0 +1,198 @@
+##################################################################################
+# Description
+##################################################################################
+# This module keeps a persistent ledger of the ERA5 requests of download_ERA5.py
+# in an SQLite database, so that a restarted download reattaches to the jobs
+# still queued or running at CDS instead of submitting them again.  A row is
+# kept per output file with the dates and hours of the request, the CDS
+# request ID, the UID of the account used, the state of the request and the
+# size of the result as
+#
+#     planned    -- not yet submitted, or to be submitted again
+#     submitted  -- queued / running at CDS under request_id
+#     completed  -- finished at CDS, result not yet downloaded
+#     downloaded -- result downloaded and checked against its size
+#     processed  -- downloaded file processed by the GRIB stages, with the size
+#                   of the output if it replaced the original
+#     failed     -- failed at CDS, submitted again on restart
+#
+# Each state change is committed immediately, with the database in WAL mode so
+# that a killed process leaves the last committed state.  A downloaded file is
+# only trusted if it still has the recorded size and ends with a complete GRIB
+# message, see manifest.check_file.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import time
+import sqlite3
+import threading
+from manifest import check_file
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# states of requests with a job at CDS which can be reattached
+IN_FLIGHT = ['submitted', 'completed']
+
+# states of requests with a local file
+ON_DISK = ['downloaded', 'processed']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reqs (
+    path       TEXT PRIMARY KEY,
+    call       TEXT NOT NULL,
+    date0      TEXT NOT NULL,
+    date1      TEXT NOT NULL,
+    hours      TEXT NOT NULL,
+    state      TEXT NOT NULL DEFAULT 'planned',
+    request_id TEXT,
+    account    TEXT,
+    size       INTEGER,
+    est_size   INTEGER,
+    updated    REAL
+)
+"""
+
+class Ledger:
+    """ SQLite ledger of ERA5 requests keyed by their output file
+
+    path is the database file, created if missing.  A single connection is
+    shared by the download threads, with updates serialized by a lock."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def get(self, path):
+        # returns the row of an output file as a dictionary, or None
+        with self.lock:
+            row = self.db.execute('SELECT * FROM reqs WHERE path = ?',
+                                  (path,)).fetchone()
+
+        return dict(row) if row else None
+
+    def rows(self):
+        # returns all rows as dictionaries
+        with self.lock:
+            return [dict(row) for row in
+                    self.db.execute('SELECT * FROM reqs ORDER BY path')]
+
+    def plan(self, call, reqs, sizes=None):
+        """ Records planned requests, keeping the state of known files
+
+        reqs are requests as generated by get_reqs in download_ERA5.py, sizes
+        the optional list of estimated (fields, bytes) of each request."""
+
+        with self.lock:
+            for i, req in enumerate(reqs):
+                est = sizes[i][1] if sizes else None
+                self.db.execute('INSERT OR IGNORE INTO reqs (path, call, date0,'
+                                ' date1, hours, est_size, updated) VALUES '
+                                '(?, ?, ?, ?, ?, ?, ?)', (req[4], call, req[1],
+                                req[2], req[3], est, time.time()))
+
+    def update(self, path, **fields):
+        # sets fields of the row of an output file
+        fields['updated'] = time.time()
+        keys = ', '.join([key + ' = ?' for key in fields])
+        with self.lock:
+            self.db.execute('UPDATE reqs SET ' + keys + ' WHERE path = ?',
+                            list(fields.values()) + [path])
+
+    def is_done(self, path, update=True):
+        """ Determines if the file of a request is downloaded and intact
+
+        A file not recorded as downloaded, e.g., downloaded before the ledger
+        was kept, is accepted and recorded if it ends with a complete GRIB
+        message.  Rows of files which fail the check are reset to planned,
+        keeping in-flight jobs.  If update is False, the file is checked the
+        same way without changing any row."""
+
+        row = self.get(path)
+        size = row['size'] if row and row['state'] in ON_DISK else None
+        problem = check_file(path, size)
+        if not update:
+            return problem is None
+
+        if problem is None:
+            if row and row['state'] not in ON_DISK:
+                self.update(path, state='downloaded',
+                            size=os.path.getsize(path))
+
+            return True
+
+        if row and row['state'] in ON_DISK:
+            print('Found %s %s, downloading again'%(path, problem))
+            self.update(path, state='planned', request_id=None, account=None)
+
+        return False
+
+    def counts(self):
+        # number of rows by state
+        with self.lock:
+            return dict(self.db.execute('SELECT state, COUNT(*) FROM reqs '
+                                        'GROUP BY state').fetchall())
+
+##################################################################################
+# Report ledger
+##################################################################################
+if __name__ == '__main__':
+    ledger = Ledger(sys.argv[1])
+    for row in ledger.rows():
+        print('%-10s %-38s %-8s %s'%(row['state'], row['request_id'] or '-',
+                                     row['account'] or '-',
+                                     os.path.basename(row['path'])))
+
+    print(ledger.counts())
+
+##################################################################################
+# end
@@ -0,0 +1,195 @@
+##################################################################################
+# Description
+##################################################################################
+# This module estimates the size of ERA5 requests and plans the number of days
+# combined into each request, so that the window suits the product of the
+# request rather than a single fixed interval for all data types.
+#
+# The number of fields of a request is the product of the number of dates,
+# times, parameters and levels of its payload, as counted against the field
+# limits of CDS, with MARS lists of the form 'a/b/c' and '1/to/137'.  The byte
+# volume assumes GRIB data packed at 16 bits per value on the regular lat / lon
+# grid of the request, with a small header per field.
+#
+# The window is the largest number of days under both the field and byte caps
+# per request, reduced so that there are at least as many requests as slots
+# over all accounts while the date range allows.  Run standalone to print the
+# plan of a call as
+#
+#     python era5_plan.py CALL STRT_DT STOP_DT [N_SLOTS]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import sys
+import math
+from datetime import date
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# bytes per packed value and per GRIB header of a field
+VAL_BYTES = 2
+HDR_BYTES = 200
+
+# grid increment of requests without a grid, as the CDS default for ERA5
+GRID_DEF = '0.25/0.25'
+
+def mars_list(value):
+    """ Expands a MARS list value into its list of items
+
+    value is a string with items separated by '/', or a list of such strings.
+    Integer ranges 'a/to/b' or 'a/to/b/by/c' are expanded, date ranges of the
+    form 'a/to/b' are returned as the list [a, b]."""
+
+    if isinstance(value, (list, tuple)):
+        items = []
+        for val in value:
+            items += mars_list(val)
+
+        return items
+
+    items = str(value).split('/')
+    expanded = []
+    i = 0
+    while i < len(items):
+        if i + 2 < len(items) and items[i + 1] == 'to' and\
+                items[i].isdigit() and items[i + 2].isdigit():
+            step = 1
+            if i + 4 < len(items) and items[i + 3] == 'by':
+                step = int(items[i + 4])
+                i += 2
+
+            expanded += [str(n) for n in range(int(items[i]),
+                                                int(items[i + 2]) + 1, step)]
+            i += 3
+
+        elif items[i] == 'to':
+            i += 1
+
+        else:
+            expanded.append(items[i])
+            i += 1
+
+    return expanded
+
+def n_dates(value):
+    # number of days of a date range 'a/to/b', 'a/b' or a single date
+    dates = [date.fromisoformat(d) for d in mars_list(value)]
+    return (max(dates) - min(dates)).days + 1
+
+def n_points(grid):
+    # number of points of a regular global lat / lon grid 'dlon/dlat'
+    dlon, dlat = [float(d) for d in mars_list(grid)]
+    return round(360 / dlon) * (round(180 / dlat) + 1)
+
+def req_size(request):
+    """ Estimates the number of fields and bytes of a request payload
+
+    request is the payload of a call as defined by get_call in
+    download_ERA5.py.  Returns the tuple (fields, bytes)."""
+
+    fields = n_dates(request['date']) * len(mars_list(request['time']))
+    fields *= len(mars_list(request.get('param', request.get('variable', []))))
+    for key in ['levelist', 'pressure_level']:
+        if key in request:
+            fields *= len(mars_list(request[key]))
+
+    size = fields * (n_points(request.get('grid', GRID_DEF)) * VAL_BYTES +
+                     HDR_BYTES)
+    return fields, size
+
+def plan_window(day_fields, day_bytes, n_days, n_slots, max_fields, max_bytes,
+                max_days=None):
+    """ Plans the number of days combined into each request
+
+    day_fields / day_bytes are the size of a request of a single day, n_days
+    the length of the date range and n_slots the number of concurrent jobs over
+    all accounts.  The window is the largest number of days under max_fields
+    and max_bytes, and under max_days if given, reduced so that the range is
+    split into at least n_slots requests where possible.  A single day above
+    the caps is requested on its own with a warning."""
+
+    cap = int(min(max_fields // day_fields, max_bytes // day_bytes))
+    if cap < 1:
+        print('WARNING: a single day of %s fields / %.1f GB exceeds the cap of '
+              '%s fields / %.1f GB per request'%(day_fields, day_bytes / 1e9,
+              max_fields, max_bytes / 1e9))
+        cap = 1
+
+    if max_days:
+        cap = min(cap, max_days)
+
+    return max(1, min(cap, math.ceil(n_days / max(n_slots, 1))))
+
+def report(reqs, sizes, n_slots):
+    """ Prints the dates and estimated sizes of planned requests
+
+    reqs are requests as generated by get_reqs in download_ERA5.py, sizes the
+    list of (fields, bytes) of each request."""
+
+    print('%-24s %6s %10s %10s'%('dates', 'days', 'fields', 'size (GB)'))
+    for req, (fields, size) in zip(reqs, sizes):
+        days = (date.fromisoformat(req[2]) - date.fromisoformat(req[1])).days
+        print('%-24s %6s %10s %10.2f'%(req[1] + '--' + req[2], days + 1,
+                                       fields, size / 1e9))
+
+    print('%s requests, %s fields, %.2f GB over %s slots'%(
+          len(reqs), sum([s[0] for s in sizes]),
+          sum([s[1] for s in sizes]) / 1e9, n_slots))
+
+##################################################################################
+# Plan requests
+##################################################################################
+if __name__ == '__main__':
+    import download_ERA5 as era5
+    era5.CALL = sys.argv[1]
+
+    strt_dt = date.fromisoformat(sys.argv[2])
+    stop_dt = date.fromisoformat(sys.argv[3])
+    n_slots = int(sys.argv[4]) if len(sys.argv) > 4 else\
+            len(era5.AUTHS) * era5.MAX_JOBS
+
+    reqs, sizes = era5.plan_reqs(strt_dt, stop_dt, era5.get_hours(), n_slots)
+    report(reqs, sizes, n_slots)
+
+##################################################################################
+# end
@@ -0,0 +1,162 @@
+##################################################################################
+# Description
+##################################################################################
+# This module resolves the exact object keys of GEFS forecast files in the
+# noaa-gefs-pds bucket, so that downloads can be made without any recursive
+# listing of the bucket.  The layout of the bucket changed at the zero hours
+#
+#     2018-07-27T00 -- 0.5 degree files added in pgrb2ap5 / pgrb2bp5
+#     2020-09-23T00 -- GEFSv12, files moved to atmos/ with 30 perturbations
+#
+# and the templates for each era are defined in LAYOUTS below.  Keys are
+# resolved from the zero hour, the member index (0 for the control gec00, N for
+# the perturbation gepNN), the forecast hour, the a / b stream and the
+# resolution '1p00' or '0p50', by default 0p50 where the era has it, else 1p00.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+from datetime import datetime as dt
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# 1 degree files with two digit forecast hours below 100
+KEY_1P00 = 'gefs.{ymd}/{hh}/pgrb2{s}/{mem}.t{hh}z.pgrb2{s}f{fhr:02d}'
+
+# 0.5 degree files before / after the move to the atmos directory
+KEY_0P50 = 'gefs.{ymd}/{hh}/pgrb2{s}p5/{mem}.t{hh}z.pgrb2{s}.0p50.f{fhr:03d}'
+KEY_0P50_ATM = 'gefs.{ymd}/{hh}/atmos/pgrb2{s}p5/' +\
+               '{mem}.t{hh}z.pgrb2{s}.0p50.f{fhr:03d}'
+
+# bucket layouts ordered by the first zero hour of each era
+LAYOUTS = [
+           {
+            'start' : dt(2017, 1, 1),
+            'n_pert': 20,
+            'keys'  : {'1p00': KEY_1P00},
+           },
+           {
+            'start' : dt(2018, 7, 27),
+            'n_pert': 20,
+            'keys'  : {'1p00': KEY_1P00, '0p50': KEY_0P50},
+           },
+           {
+            'start' : dt(2020, 9, 23),
+            'n_pert': 30,
+            'keys'  : {'0p50': KEY_0P50_ATM},
+           },
+          ]
+
+def gefs_layout(cycle):
+    """ Returns the bucket layout of the era containing the zero hour cycle """
+
+    if cycle < LAYOUTS[0]['start']:
+        raise ValueError('GEFS data is not available on AWS before ' +\
+                         LAYOUTS[0]['start'].strftime('%Y-%m-%d'))
+
+    for layout in reversed(LAYOUTS):
+        if cycle >= layout['start']:
+            return layout
+
+def gefs_members(cycle, if_ctrl, if_pert):
+    """ Returns the member indices of the ensemble at the zero hour cycle """
+
+    mems = []
+    if if_ctrl:
+        mems.append(0)
+
+    if if_pert:
+        mems += list(range(1, gefs_layout(cycle)['n_pert'] + 1))
+
+    return mems
+
+def gefs_res(cycle, res=None):
+    """ Returns the resolution of the keys of the zero hour cycle
+
+    res is returned if given, else 0p50 if the era of cycle has it, else the
+    1p00 of the era before 2018-07-27."""
+
+    if res is not None:
+        return res
+
+    keys = gefs_layout(cycle)['keys']
+    return '0p50' if '0p50' in keys else list(keys)[0]
+
+def gefs_key(cycle, member, fhr, stream='a', res=None):
+    """ Resolves the object key of a single GEFS forecast file
+
+    cycle is the zero hour datetime, member the member index, fhr the forecast
+    hour as an integer, stream 'a' or 'b' and res '1p00' or '0p50', None for
+    gefs_res.  Raises a ValueError for members or resolutions which do not
+    exist in the era."""
+
+    layout = gefs_layout(cycle)
+    res = gefs_res(cycle, res)
+    if res not in layout['keys']:
+        raise ValueError('resolution %s is not available for %s, use one of %s'%(
+                         res, cycle.strftime('%Y-%m-%dT%H'),
+                         list(layout['keys'])))
+
+    if member < 0 or member > layout['n_pert']:
+        raise ValueError('member %s is not available for %s'%(
+                         member, cycle.strftime('%Y-%m-%dT%H')))
+
+    mem = 'gec00' if member == 0 else 'gep%02d'%member
+    return layout['keys'][res].format(ymd=cycle.strftime('%Y%m%d'),
+                                      hh=cycle.strftime('%H'), mem=mem,
+                                      s=stream, fhr=fhr)
+
+def cycle_keys(cycle, fcsts, members, streams=['a', 'b'], res=None):
+    """ Resolves the object keys of all members / forecast hours of a cycle
+
+    fcsts is a list of forecast hour strings as generated by fcst_dt_hr."""
+
+    keys = []
+    for member in members:
+        for fcst in fcsts:
+            for stream in streams:
+                keys.append(gefs_key(cycle, member, int(fcst), stream, res))
+
+    return keys
+
+##################################################################################
+# end
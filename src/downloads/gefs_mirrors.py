@@ -0,0 +1,505 @@
+##################################################################################
+# Description
+##################################################################################
+# This module fetches the GEFS objects from several copies of the bucket, in
+# place of the single S3Client of download_GEFS_AWS.py.  A source is either
+#
+#     an S3Client of the primary bucket, e.g., noaa-gefs-pds on AWS,
+#     an HTTPMirror of another copy served over HTTP(S), e.g., the open data
+#         copy at https://storage.googleapis.com/gfs-ensemble-forecast-system
+#         or an institutional mirror of the bucket layout,
+#     a LocalArchive of a directory tree ROOT/KEY, e.g., a tape staging area,
+#
+# made from a spec string with source.  Mirrors wraps the sources with the
+# methods of S3Client used by the download script, listing the primary only and
+# reading each object from the source with the best throughput so far.  A
+# transfer still running past the hedge delay, the HEDGE_PCT percentile of the
+# seconds per byte of the source times the remaining bytes, is hedged with a
+# second transfer from the next source, the first to finish is kept and the
+# other abandoned.  A failed transfer moves on to the next source at once.
+#
+# The bytes and seconds of each transfer, including abandoned ones, and the
+# fetches, wins, hedges and failures of each source are kept in a JSON stats
+# file, so the ranking and hedge delays carry over between runs, and reported
+# at the end of a run with
+#
+#     python gefs_mirrors.py STATS_FILE
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import json
+import time
+import shutil
+import threading
+import concurrent.futures
+from urllib.parse import urlsplit
+
+from aws_s3 import S3Client, S3Error, CHUNK
+from telemetry import OFF
+
+##################################################################################
+# Sources
+##################################################################################
+
+# percentile of the seconds per byte of a source past which it is hedged, and
+# the delay used before a source has MIN_SAMPLES transfers
+HEDGE_PCT = 90
+HEDGE_S = 10.0
+MIN_SAMPLES = 5
+
+# shortest hedge delay in seconds, covering the first byte latency
+HEDGE_MIN_S = 0.2
+
+# number of recent transfers kept per source
+SAMPLES = 200
+
+class HTTPMirror(S3Client):
+    """ Client of a copy of the bucket served over HTTP(S) at base_url
+
+    Objects are read at base_url/KEY with the same GET, HEAD and Range requests
+    as S3Client, so that base_url can be a public cloud copy of the bucket, a
+    virtual-hosted S3 bucket or a web server over a mirror of the tree.
+    Mirrors are not listed."""
+
+    def __init__(self, base_url, timeout=60, retries=3):
+        url = urlsplit(base_url)
+        super().__init__(url.path.strip('/').split('/')[-1],
+                         endpoint_url=url.scheme + '://' + url.netloc,
+                         timeout=timeout, retries=retries)
+        self.base = url.path.rstrip('/')
+        self.name = base_url.rstrip('/')
+
+class LocalArchive:
+    """ Source of the objects in the directory tree root, at root/KEY
+
+    Files are opened in place of responses, with the size of the file and no
+    ETag, and missing files raise an S3Error with status 404."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.bucket = os.path.basename(self.root)
+        self.name = 'file://' + self.root
+        self.retries = 0
+
+    def path(self, key):
+        # local path of the object at key
+        path = os.path.join(self.root, key)
+        if not os.path.isfile(path):
+            raise S3Error(404, 'Not Found', path)
+
+        return path
+
+    def head_object(self, key):
+        return {'size': os.path.getsize(self.path(key)), 'etag': ''}
+
+    def read_object(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def open_object(self, key, offset=0, meta=None):
+        # open file at offset, as S3Client.open_object
+        meta = {} if meta is None else meta
+        f = open(self.path(key), 'rb')
+        meta['size'] = os.fstat(f.fileno()).st_size
+        meta['etag'] = ''
+        f.seek(min(offset, meta['size']))
+        return f, offset > 0
+
+    def resume_object(self, key, path, meta):
+        offset = os.path.getsize(path) if os.path.isfile(path) else 0
+        f, resumed = self.open_object(key, offset, meta)
+        with f, open(path, 'ab' if resumed else 'wb') as out:
+            return _copy(f, out, threading.Event())
+
+    def get_ranges(self, key, path, ranges):
+        size = 0
+        with open(self.path(key), 'rb') as f, open(path, 'wb') as out:
+            for start, end in ranges:
+                f.seek(start)
+                buf = f.read() if end is None else f.read(end - start + 1)
+                out.write(buf)
+                size += len(buf)
+
+        return size
+
+    def reset(self):
+        pass
+
+def source(spec):
+    # HTTPMirror of an http(s) URL, else LocalArchive of a directory
+    if spec.startswith(('http://', 'https://')):
+        return HTTPMirror(spec)
+
+    return LocalArchive(spec)
+
+def _copy(res, f, cancel):
+    # copy a response body to an open file until done or cancel is set
+    size = 0
+    while not cancel.is_set():
+        buf = res.read(CHUNK)
+        if not buf:
+            break
+
+        f.write(buf)
+        size += len(buf)
+
+    return size
+
+##################################################################################
+# Hedged transfers
+##################################################################################
+
+class Mirrors:
+    """ Hedged reads of the same objects from several sources
+
+    sources are S3Client, HTTPMirror or LocalArchive instances, the first the
+    primary used for listings and for the bucket name of cache keys.  Objects
+    are read from the source with the best throughput in the stats, falling
+    back to the order given, and hedged with the next source after the
+    hedge_pct percentile of its seconds per byte times the bytes remaining, or
+    hedge_s before min_samples transfers.  Each source reads on its own pool of
+    threads sized for n_workers concurrent objects, keeping their connections
+    open between objects.  stats is the path of the JSON file the transfer
+    statistics are loaded from and saved to, and each object is recorded as a
+    mirror event of telemetry."""
+
+    def __init__(self, sources, hedge_pct=HEDGE_PCT, hedge_s=HEDGE_S,
+                 min_samples=MIN_SAMPLES, n_workers=16, stats=None,
+                 telemetry=None):
+        self.sources = list(sources)
+        self.primary = self.sources[0]
+        self.bucket = self.primary.bucket
+        self.retries = self.primary.retries
+        self.hedge_pct = hedge_pct
+        self.hedge_s = hedge_s
+        self.min_samples = min_samples
+        self.path = stats
+        self.telemetry = telemetry or OFF
+        self.lock = threading.Lock()
+        self.stats = {}
+        if stats is not None and os.path.isfile(stats):
+            with open(stats) as f:
+                self.stats = json.load(f)
+
+        self.pools = {}
+        for src in self.sources:
+            self.stats.setdefault(src.name, {'fetches': 0, 'wins': 0,
+                                             'hedged': 0, 'failures': 0,
+                                             'bytes': 0, 'seconds': 0.0,
+                                             'samples': []})
+            # room for abandoned transfers draining beside n_workers reads
+            self.pools[src.name] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=2 * n_workers)
+
+    def throughput(self, name):
+        # bytes per second over the recent transfers of a source, None if none
+        samples = self.stats[name]['samples']
+        secs = sum([sec for nbytes, sec in samples])
+        if not samples or not secs:
+            return None
+
+        return sum([nbytes for nbytes, sec in samples]) / secs
+
+    def ranked(self):
+        """ Sources by throughput, best first
+
+        Sources without transfers come first in their configured order, so
+        that each source is measured once and the primary is tried first on
+        a fresh stats file."""
+
+        with self.lock:
+            rates = [self.throughput(src.name) for src in self.sources]
+
+        known = sorted([(-rate, i) for i, rate in enumerate(rates)
+                        if rate is not None])
+        order = [i for i, rate in enumerate(rates) if rate is None] +\
+                [i for rate, i in known]
+        return [self.sources[i] for i in order]
+
+    def delay(self, name, nbytes):
+        # seconds after which a transfer of nbytes from a source is hedged
+        with self.lock:
+            rates = sorted([sec / n for n, sec in self.stats[name]['samples']
+                            if n > 0])
+
+        if nbytes is None or len(rates) < self.min_samples:
+            return self.hedge_s
+
+        pct = rates[min(len(rates) - 1, len(rates) * self.hedge_pct // 100)]
+        return max(HEDGE_MIN_S, pct * nbytes)
+
+    def _record(self, name, nbytes, secs, failed=False):
+        with self.lock:
+            stat = self.stats[name]
+            stat['fetches'] += 1
+            stat['failures'] += failed
+            stat['bytes'] += nbytes
+            stat['seconds'] += secs
+            if nbytes:
+                stat['samples'] = stat['samples'][1 - SAMPLES:] +\
+                                  [[nbytes, round(secs, 6)]]
+
+    def _first(self, method, *args):
+        # result of method on the first source in rank order not failing
+        err = None
+        for src in self.ranked():
+            try:
+                return getattr(src, method)(*args)
+            except Exception as exc:
+                err = err or exc
+
+        raise err
+
+    def list_objects(self, prefix):
+        return self.primary.list_objects(prefix)
+
+    def head_object(self, key):
+        return self._first('head_object', key)
+
+    def read_object(self, key):
+        return self._first('read_object', key)
+
+    def get_ranges(self, key, path, ranges):
+        return self._first('get_ranges', key, path, ranges)
+
+    def _fetch(self, src, key, path, offset, meta, cancel):
+        """ Reads the object at key from src into path from byte offset
+
+        Runs on the pool of src.  path is written with the bytes after offset
+        if the source honours the range, else the whole object, stopping early
+        once cancel is set.  The object must match the size and any MD5 ETag
+        of meta.  Returns a dictionary of the 'size', 'etag', 'bytes' written
+        and whether the transfer 'resumed'."""
+
+        t0 = time.monotonic()
+        info = {'etag': meta.get('etag')}
+        nbytes = 0
+        try:
+            res, resumed = src.open_object(key, offset, info)
+            try:
+                with open(path, 'wb') as f:
+                    nbytes = _copy(res, f, cancel)
+            finally:
+                res.close()
+                if cancel.is_set():
+                    # connection left part way through the body
+                    src.reset()
+
+            if cancel.is_set():
+                return None
+
+            if meta.get('size') is not None and info['size'] != meta['size']:
+                raise IOError('size %s differs from %s'%(info['size'],
+                                                         meta['size']))
+
+            if _md5(info['etag']) and _md5(meta.get('etag')) and\
+                    info['etag'] != meta['etag']:
+                raise IOError('ETag %s differs from %s'%(info['etag'],
+                                                         meta['etag']))
+
+            if (offset if resumed else 0) + nbytes != info['size']:
+                raise IOError('short read of %s bytes'%nbytes)
+
+        except Exception:
+            self._record(src.name, nbytes, time.monotonic() - t0, failed=True)
+            raise
+
+        self._record(src.name, nbytes, time.monotonic() - t0)
+        return dict(info, bytes=nbytes, resumed=resumed)
+
+    def resume_object(self, key, path, meta):
+        """ Reads the object at key to path, hedged across the sources
+
+        As S3Client.resume_object, a partial file at path is resumed from its
+        size and the 'size' and 'etag' of meta are updated, with 'source' set
+        to the name of the source the object was read from.  Each source
+        reads into a side file of path, and the file of the first to finish
+        is appended to path, or replaces it if the source sent the whole
+        object.  Returns the number of bytes kept."""
+
+        offset = os.path.getsize(path) if os.path.isfile(path) else 0
+        if offset and meta.get('size') is None:
+            meta.update(self.head_object(key))
+
+        if offset and offset == meta['size']:
+            return 0
+
+        if offset and offset > meta['size']:
+            offset = 0
+
+        order = self.ranked()
+        left = None if meta.get('size') is None else meta['size'] - offset
+        hedge_at = time.monotonic() + self.delay(order[0].name, left)
+        done = threading.Condition()
+        racers = []
+
+        def notify(future):
+            with done:
+                done.notify()
+
+        def start(src):
+            out = path + '.%s'%len(racers)
+            cancel = threading.Event()
+            future = self.pools[src.name].submit(self._fetch, src, key, out,
+                                                 offset, meta, cancel)
+            racers.append((src, out, cancel, future))
+            future.add_done_callback(notify)
+
+        t0 = time.monotonic()
+        hedged = False
+        winner = None
+        with done:
+            start(order[0])
+            while winner is None:
+                running = [r for r in racers if not r[3].done()]
+                for racer in racers:
+                    if racer[3].done() and racer[3].exception() is None:
+                        winner = racer
+                        break
+
+                if winner is not None:
+                    break
+
+                if len(racers) < len(order) and (not running or (not hedged and
+                        time.monotonic() >= hedge_at)):
+                    # failover once all transfers failed, else hedge once
+                    hedged = hedged or bool(running)
+                    start(order[len(racers)])
+                    continue
+
+                if not running:
+                    break
+
+                done.wait(max(0, hedge_at - time.monotonic()) if not hedged
+                          and len(racers) < len(order) else None)
+
+        for src, out, cancel, future in racers:
+            if winner is None or future is not winner[3]:
+                # abandoned transfers clean up once they see cancel, without
+                # holding up the object
+                cancel.set()
+                future.add_done_callback(lambda f, out=out: _remove(out))
+
+        if winner is None:
+            raise racers[0][3].exception()
+
+        src, out, cancel, future = winner
+        info = future.result()
+        if info['resumed']:
+            # remaining bytes appended to the partial file
+            with open(path, 'ab') as f, open(out, 'rb') as part:
+                shutil.copyfileobj(part, f, CHUNK)
+
+            os.remove(out)
+        else:
+            os.replace(out, path)
+
+        meta['size'] = info['size']
+        if not _md5(meta.get('etag')):
+            meta['etag'] = info['etag']
+
+        meta['source'] = src.name
+        with self.lock:
+            self.stats[src.name]['wins'] += 1
+            self.stats[order[0].name]['hedged'] += hedged
+
+        self.telemetry.event('mirror', key=key, source=src.name, hedged=hedged,
+                             tried=[r[0].name for r in racers],
+                             bytes=info['bytes'],
+                             transfer_s=round(time.monotonic() - t0, 6))
+        return info['bytes']
+
+    def save(self):
+        # write the stats to their file, atomically
+        if self.path is None:
+            return
+
+        with self.lock:
+            text = json.dumps(self.stats, indent=1)
+
+        with open(self.path + '.part', 'w') as f:
+            f.write(text)
+
+        os.replace(self.path + '.part', self.path)
+
+    def close(self):
+        # shut down the source pools without waiting on abandoned transfers,
+        # and save the stats
+        for pool in self.pools.values():
+            pool.shutdown(wait=False)
+
+        self.save()
+
+    def report(self):
+        report(self.stats, [src.name for src in self.ranked()])
+
+def _md5(etag):
+    # True for the hex MD5 ETag of a single part object
+    return bool(etag) and len(etag) == 32 and '-' not in etag
+
+def _remove(path):
+    if os.path.isfile(path):
+        os.remove(path)
+
+##################################################################################
+# Report stats
+##################################################################################
+
+def report(stats, names=None):
+    # prints the transfer statistics of each source, in the order of names
+    print('%-60s %8s %6s %7s %8s %10s %8s'%('source', 'fetches', 'wins',
+          'hedged', 'failed', 'MB', 'MB/s'))
+    for name in names or sorted(stats):
+        stat = stats[name]
+        secs = sum([sec for nbytes, sec in stat['samples']])
+        rate = sum([nbytes for nbytes, sec in stat['samples']]) / secs\
+               if secs else None
+        print('%-60s %8s %6s %7s %8s %10.1f %8s'%(name[-60:], stat['fetches'],
+              stat['wins'], stat['hedged'], stat['failures'],
+              stat['bytes'] / 1e6, '%.1f'%(rate / 1e6) if rate else '-'))
+
+if __name__ == '__main__':
+    with open(sys.argv[1]) as f:
+        report(json.load(f))
+
+##################################################################################
+# end
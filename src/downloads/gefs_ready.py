@@ -0,0 +1,136 @@
+##################################################################################
+# Description
+##################################################################################
+# This module is a Cylc xtrigger reporting when the GEFS data of a cycle point
+# and ensemble member has been downloaded and verified by download_GEFS_AWS.py,
+# so that ungrib can start on the first cycles while the downloader continues
+# with later ones.  The downloader is run in the background over the cycle plan
+# of the workflow, which it fetches in cycle order, writing the manifest of the
+# date stamped directory as each member completes
+#
+#     nohup python download_GEFS_AWS.py --cycle-plan flow.cylc &
+#
+# Cylc imports xtrigger functions from the workflow lib/python directory or the
+# PYTHONPATH, e.g., with ${HOME}/src/downloads added to the PYTHONPATH of the
+# scheduler.  For the lagged ensemble background workflows the xtrigger of each
+# member is declared and made a prerequisite of ungrib as
+#
+#     [[xtriggers]]
+#     {% for mem in range(1,ENS_SIZE) %}
+#         {% set idx = mem | pad(2, '0') %}
+#         gefs_{{idx}} = gefs_ready(point=%(point)s, member={{mem}}, \
+#                                   data_root='/path/to/GRIB/GEFS', \
+#                                   lag={{LAG}}, fcst_hrs={{lag + CYC_INC}}, \
+#                                   bkg_int={{ENS_BKG_INT}}):PT1M
+#     {% endfor %}
+#     [[graph]]
+#         @gefs_{{idx}} => ungrib_ens_{{idx}}
+#
+# When satisfied, the xtrigger returns the directory and the zero hour of the
+# background data, available to the dependent tasks as gefs_NN_bkg_dir and
+# gefs_NN_bkg_strt_dt.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+from datetime import datetime as dt
+from datetime import timedelta
+import gefs_keys
+import manifest as mfst
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# cycle point formats of the suites
+POINT_FMTS = ['%Y%m%dT%H%MZ', '%Y%m%dT%H%M', '%Y%m%dT%H', '%Y-%m-%dT%H:%MZ',
+              '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H']
+
+def parse_point(point):
+    # parse a Cylc cycle point string
+    for fmt in POINT_FMTS:
+        try:
+            return dt.strptime(point, fmt)
+
+        except ValueError:
+            continue
+
+    raise ValueError('unsupported cycle point format ' + point)
+
+def gefs_ready(point, member, data_root, lag=0, fcst_hrs=6, bkg_int=3,
+               streams='ab', res=None):
+    """ Cylc xtrigger for the GEFS data of a cycle point and member
+
+    The zero hour of the background data is point minus lag hours, and the
+    forecast hours from zero to fcst_hrs at bkg_int hours are required for
+    each GRIB2 stream in streams at resolution res, None for 0p50, or 1p00 in
+    the layout era of the zero hours before 2018-07-27.  The xtrigger is
+    satisfied once every file is recorded in the manifest of data_root/YYYYMMDD
+    and passes mfst.check_entry.  Returns a tuple of the satisfied status and,
+    once satisfied, a dictionary with the 'bkg_dir' and 'bkg_strt_dt'
+    YYYYMMDDHH.  Zero hours, members or resolutions which are not available on
+    AWS, and manifests which cannot be read, return (False, {}) with a
+    message."""
+
+    init = parse_point(str(point)) - timedelta(hours=int(lag))
+    down_dir = os.path.join(data_root, init.strftime('%Y%m%d'))
+    try:
+        manifest = mfst.read_manifest(down_dir)
+        if not manifest:
+            return False, {}
+
+        for fhr in range(0, int(fcst_hrs) + 1, int(bkg_int)):
+            for stream in streams:
+                key = gefs_keys.gefs_key(init, int(member), fhr, stream, res)
+                if key not in manifest or mfst.check_entry(manifest[key]):
+                    return False, {}
+
+    except ValueError as err:
+        print('gefs_ready: ' + str(err))
+        return False, {}
+
+    return True, {
+                  'bkg_dir'    : down_dir,
+                  'bkg_strt_dt': init.strftime('%Y%m%d%H'),
+                 }
+
+##################################################################################
+# end
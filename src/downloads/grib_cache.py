@@ -0,0 +1,270 @@
+##################################################################################
+# Description
+##################################################################################
+# This module is a content-addressed cache of downloaded GRIB files shared by
+# the download scripts of different experiments, so that data of the same dates
+# requested into several DATA_ROOT trees is only transferred once.
+#
+# Objects are keyed by the identity of their source, as the SHA-256 digest of
+#
+#     s3 BUCKET KEY ETAG [FIELDS]  -- GEFS objects of download_GEFS_AWS.py
+#     cds DATASET REQUEST          -- ERA5 requests of download_ERA5.py
+#
+# with the request as JSON with sorted keys, and stored under
+# ROOT/objects/AB/DIGEST.  A hit is served into the requested path as a
+# hardlink, or as a symbolic link if ROOT is on another file system, and a
+# downloaded file is added to the cache as a hardlink, copied only if ROOT is
+# on another file system.  The size and last access time of every entry are
+# kept in the SQLite database ROOT/cache.sqlite, which is shared by concurrent
+# processes.  Once the entries exceed the quota, the least recently used are
+# evicted.  Evicting an entry served as a hardlink does not affect the linked
+# files, but frees no space until they are removed, while symbolic links to it
+# are left dangling.  The manifest / ledger checks of the scripts count a
+# dangling link as missing, so that its file is downloaded again by the next
+# run.
+#
+# Files served from the cache must not be modified in place, the download
+# scripts and GRIB stages always write a new file and rename it over the path.
+# Run standalone to report the use of a cache and evict to a quota in GB as
+#
+#     python grib_cache.py ROOT [QUOTA_GB]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import errno
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key    TEXT PRIMARY KEY,
+    size   INTEGER NOT NULL,
+    atime  REAL NOT NULL,
+    source TEXT
+)
+"""
+
+def s3_key(bucket, key, etag, fields=None):
+    # cache key of an S3 object, or of its subset to fields, None without ETag
+    if not etag:
+        return None
+
+    ident = ['s3', bucket, key, etag]
+    if fields is not None:
+        ident.append(json.dumps(sorted([list(field) for field in fields])))
+
+    return hashlib.sha256(' '.join(ident).encode('utf-8')).hexdigest()
+
+def cds_key(dataset, request):
+    # cache key of a CDS request for dataset
+    ident = ' '.join(['cds', dataset, json.dumps(request, sort_keys=True)])
+    return hashlib.sha256(ident.encode('utf-8')).hexdigest()
+
+def _link(src, dst, symlink=True):
+    # link src to dst atomically, hardlink if possible, else symlink / copy,
+    # through a temporary name unique to the process and thread
+    tmp = os.path.join(os.path.dirname(dst), '.%s.%s.%s.link'%(
+                       os.path.basename(dst), os.getpid(), threading.get_ident()))
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+
+    try:
+        os.link(src, tmp)
+
+    except OSError as err:
+        if err.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK]:
+            raise
+
+        try:
+            if not symlink:
+                raise err
+
+            os.symlink(os.path.abspath(src), tmp)
+
+        except OSError:
+            shutil.copyfile(src, tmp)
+
+    os.replace(tmp, dst)
+    if os.path.lexists(tmp):
+        # rename does nothing if tmp and dst are hardlinks of the same file
+        os.remove(tmp)
+
+class Cache:
+    """ Shared GRIB cache under root with a quota of quota_gb GB
+
+    Connections are opened per thread, with the state of all processes in the
+    SQLite database of root."""
+
+    def __init__(self, root, quota_gb=500):
+        self.root = root
+        self.quota = quota_gb * 1e9
+        self.db_path = os.path.join(root, 'cache.sqlite')
+        self._local = threading.local()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self._db().execute(SCHEMA)
+
+    def _db(self):
+        # connection of the calling thread
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=60,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+
+        return db
+
+    def path(self, key):
+        # location of the object of key in the cache
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def get(self, key, dst):
+        """ Serves the object of key at dst if cached
+
+        Returns True on a hit, updating the access time of the entry.  Entries
+        whose object is missing or has changed size are dropped."""
+
+        if key is None:
+            return False
+
+        row = self._db().execute('SELECT size FROM entries WHERE key = ?',
+                                 (key,)).fetchone()
+        if row is None:
+            return False
+
+        obj = self.path(key)
+        if not os.path.isfile(obj) or os.path.getsize(obj) != row[0]:
+            self._drop(key)
+            return False
+
+        try:
+            _link(obj, dst)
+
+        except FileNotFoundError:
+            # evicted by another process
+            return False
+
+        self._db().execute('UPDATE entries SET atime = ? WHERE key = ?',
+                           (time.time(), key))
+        return True
+
+    def put(self, key, src, source=''):
+        """ Adds the downloaded file src as the object of key
+
+        The file is hardlinked into the cache, or copied if the cache is on
+        another file system, and entries are evicted to the quota.  Returns True
+        if the file was added."""
+
+        if key is None:
+            return False
+
+        obj = self.path(key)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        try:
+            _link(src, obj, symlink=False)
+
+        except OSError as err:
+            print('WARNING: could not cache ' + src + ': ' + str(err))
+            return False
+
+        self._db().execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                           (key, os.path.getsize(obj), time.time(), source))
+        self.evict()
+        return True
+
+    def _drop(self, key):
+        # remove an entry and its object
+        self._db().execute('DELETE FROM entries WHERE key = ?', (key,))
+        if os.path.lexists(self.path(key)):
+            os.remove(self.path(key))
+
+    def usage(self):
+        # number of entries and their total size in bytes
+        return self._db().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) '
+                                  'FROM entries').fetchone()
+
+    def evict(self, quota=None):
+        """ Evicts least recently used entries until the cache is under quota
+
+        quota defaults to the quota of the cache in bytes.  Returns the number
+        of entries and bytes evicted."""
+
+        quota = self.quota if quota is None else quota
+        n_evict = 0
+        freed = 0
+        total = self.usage()[1]
+        if total <= quota:
+            return n_evict, freed
+
+        for key, size in self._db().execute('SELECT key, size FROM entries '
+                                            'ORDER BY atime').fetchall():
+            if total - freed <= quota:
+                break
+
+            self._drop(key)
+            n_evict += 1
+            freed += size
+
+        return n_evict, freed
+
+##################################################################################
+# Report cache
+##################################################################################
+if __name__ == '__main__':
+    cache = Cache(sys.argv[1])
+    if len(sys.argv) > 2:
+        n_evict, freed = cache.evict(float(sys.argv[2]) * 1e9)
+        print('Evicted %s entries, %.2f GB'%(n_evict, freed / 1e9))
+
+    n_entries, size = cache.usage()
+    print('%s entries, %.2f GB in %s'%(n_entries, size / 1e9, cache.root))
+
+##################################################################################
+# end
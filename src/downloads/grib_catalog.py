@@ -0,0 +1,550 @@
+##################################################################################
+# Description
+##################################################################################
+# This module keeps a catalog of the GRIB files downloaded under a DATA_ROOT in
+# an SQLite database, so that the holdings of a tree can be queried without
+# globbing or stat calls over large Lustre / NFS directories.  Each file is
+# recorded with
+#
+#     source  -- 'gefs' or 'era5', from the name of the file
+#     cycle   -- zero hour YYYYMMDDHH of GEFS files, first date of the window
+#                or the cycle directory of ERA5 files
+#     member  -- GEFS member index, 0 for the control gec00
+#     fhr     -- GEFS forecast hour
+#     stream  -- GEFS stream 'a' / 'b', or the ERA5 CALL
+#     res     -- GEFS resolution '1p00' / '0p50', of the files named without
+#                one for the 1 degree files
+#
+# with its size, modification time, MD5 checksum and the inventory of its
+# messages, as the offset, length, valid time, parameter and level of each
+# message read from the GRIB1 / GRIB2 headers.  Parameters are recorded as
+# 'TABLE.PARAM' for GRIB1 and 'DISCIPLINE.CATEGORY.NUMBER' for GRIB2, levels
+# as 'TYPE:VALUE'.
+#
+# The download scripts add each file to CATALOG as they write it, or hand it to
+# the threads of the catalog where they must not wait on its checksum.  The
+# catalog of an existing tree is built or refreshed by crawling the tree on a
+# pool of threads, only describing files which are new or changed since they
+# were recorded.  Run standalone as
+#
+#     python grib_catalog.py CATALOG rebuild ROOT [--workers N]
+#     python grib_catalog.py CATALOG complete YYYYMMDDHH --members 1-30 \
+#                                             --fhrs 0-12:3 [--streams a,b] \
+#                                             [--res 0p50]
+#     python grib_catalog.py CATALOG valid YYYYMMDDHH [...] [--stream CALL]
+#     python grib_catalog.py CATALOG summary
+#
+# where complete and valid exit with status 1 and list what is missing if the
+# cycle or valid times are not fully on disk.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import re
+import time
+import argparse
+import hashlib
+import sqlite3
+import threading
+import concurrent.futures
+from datetime import datetime as dt
+from grib_split import scan
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path    TEXT PRIMARY KEY,
+    source  TEXT NOT NULL,
+    cycle   TEXT,
+    member  INTEGER,
+    fhr     INTEGER,
+    stream  TEXT,
+    res     TEXT,
+    size    INTEGER NOT NULL,
+    mtime   REAL NOT NULL,
+    md5     TEXT,
+    n_msgs  INTEGER NOT NULL,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    path   TEXT NOT NULL,
+    num    INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    valid  TEXT NOT NULL,
+    param  TEXT,
+    level  TEXT,
+    PRIMARY KEY (path, num)
+);
+CREATE INDEX IF NOT EXISTS files_cycle ON files (source, cycle);
+CREATE INDEX IF NOT EXISTS messages_valid ON messages (valid);
+"""
+
+# GEFS file names, e.g., gep01.t00z.pgrb2a.0p50.f003 or gec00.t00z.pgrb2af06
+GEFS_NAME = re.compile(r'ge(c|p)(\d\d)\.t(\d\d)z\.pgrb2(a|b)' +
+                       r'(?:\.(\dp\d\d))?\.?f(\d+)$')
+
+# columns of the files table, with res added to catalogs created before it
+COLUMNS = ['path', 'source', 'cycle', 'member', 'fhr', 'stream', 'res', 'size',
+           'mtime', 'md5', 'n_msgs', 'updated']
+
+# ERA5 window names, e.g., 2019-02-08--2019-02-11_model_levels.grib
+ERA5_NAME = re.compile(r'(\d{4}-\d\d-\d\d)--\d{4}-\d\d-\d\d_(\w+)\.grib')
+
+def describe(path):
+    """ Returns the source, cycle, member, forecast hour, stream and resolution
+    of a file
+
+    Fields are parsed from the name of the file and its directory, and are None
+    where they do not apply."""
+
+    head, name = os.path.split(path)
+    parent = os.path.basename(head)
+    match = GEFS_NAME.match(name)
+    if match and re.fullmatch(r'\d{8}', parent):
+        return ('gefs', parent + match.group(3), int(match.group(2)),
+                int(match.group(6)), match.group(4), match.group(5) or '1p00')
+
+    match = ERA5_NAME.match(name)
+    if match:
+        if re.fullmatch(r'\d{10}', parent):
+            # cycle file split with grib_split.py
+            cycle = parent
+        else:
+            cycle = match.group(1).replace('-', '') + '00'
+
+        return 'era5', cycle, None, None, match.group(2), None
+
+    return 'other', None, None, None, None, None
+
+def _field(f, pos):
+    # parameter and level of the first field of the message at pos
+    f.seek(pos)
+    ind = f.read(16)
+    if ind[7] == 1:
+        f.seek(pos + 8)
+        pds = f.read(12)
+        return '%s.%s'%(pds[3], pds[8]), '%s:%s'%(pds[9],
+                                                   int.from_bytes(pds[10:12],
+                                                                  'big'))
+
+    end = pos + int.from_bytes(ind[8:16], 'big') - 4
+    sec_pos = pos + 16
+    while sec_pos < end:
+        f.seek(sec_pos)
+        head = f.read(5)
+        size, num = int.from_bytes(head[:4], 'big'), head[4]
+        if num == 4:
+            sec = f.read(24)
+            value = int.from_bytes(sec[19:23], 'big')
+            if sec[18] not in [0, 255] and value != 0xffffffff:
+                # scale factors are stored with a sign bit
+                scale = -(sec[18] & 0x7f) if sec[18] & 0x80 else sec[18]
+                value = value / 10**scale
+
+            return '%s.%s.%s'%(ind[6], sec[4], sec[5]), '%s:%s'%(sec[17], value)
+
+        sec_pos += size
+
+    return None, None
+
+def inventory(path):
+    """ Returns the inventory of the messages of a GRIB file
+
+    Yields (offset, length, valid time, parameter, level) of each message,
+    reading only the headers of the message sections."""
+
+    with open(path, 'rb') as f:
+        for offset, length, valid in scan(path):
+            param, level = _field(f, offset)
+            yield offset, length, valid, param, level
+
+def md5sum(path):
+    # MD5 digest of a file, read in blocks
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for buf in iter(lambda: f.read(4 * 1024 * 1024), b''):
+            md5.update(buf)
+
+    return md5.hexdigest()
+
+def is_grib(path):
+    # the file starts with a GRIB indicator
+    with open(path, 'rb') as f:
+        return f.read(4) == b'GRIB'
+
+def read_file(path, md5=None, checksum=True):
+    """ Describes a GRIB file for the catalog
+
+    md5 is the known checksum of the file, e.g., the ETag of a verified single
+    part upload, else it is computed if checksum is True.  Returns the row of
+    the file and the rows of its messages, or None if it is not GRIB.  Files
+    whose messages cannot be read are described without an inventory."""
+
+    if not is_grib(path):
+        return None
+
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    if md5 is None and checksum:
+        md5 = md5sum(path)
+
+    try:
+        msgs = [(path, i + 1, offset, length, valid.strftime('%Y%m%d%H%M'),
+                 param, level) for i, (offset, length, valid, param, level) in
+                enumerate(inventory(path))]
+
+    except ValueError as err:
+        # keep the file on record without an inventory
+        print('WARNING: no inventory of %s: %s'%(path, err))
+        msgs = []
+
+    row = (path, *describe(path), st.st_size, st.st_mtime, md5, len(msgs),
+           time.time())
+    return row, msgs
+
+def parse_range(text):
+    """ Parses a list of integers as 'A,B-C,D-E:STEP' into a sorted list """
+
+    vals = set()
+    for part in text.split(','):
+        step = 1
+        if ':' in part:
+            part, step = part.split(':')
+
+        if '-' in part:
+            strt, stop = part.split('-')
+            vals.update(range(int(strt), int(stop) + 1, int(step)))
+        else:
+            vals.add(int(part))
+
+    return sorted(vals)
+
+class Catalog:
+    """ SQLite catalog of the GRIB files under a DATA_ROOT
+
+    path is the database file, created if missing.  A single connection is
+    shared by the download threads, with updates serialized by a lock.  Files
+    handed over with submit are added on a pool of n_workers threads."""
+
+    def __init__(self, path, n_workers=2):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self._migrate()
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+
+    def _migrate(self):
+        # add the res column to a catalog created before it
+        cols = [row[1] for row in self.db.execute('PRAGMA table_info(files)')]
+        if 'res' in cols:
+            return
+
+        self.db.execute('ALTER TABLE files ADD COLUMN res TEXT')
+        paths = [row[0] for row in self.db.execute('SELECT path FROM files '
+                                                   'WHERE source = ?',
+                                                   ('gefs',))]
+        self.db.execute('BEGIN IMMEDIATE')
+        self.db.executemany('UPDATE files SET res = ? WHERE path = ?',
+                            [(describe(path)[5], path) for path in paths])
+        self.db.execute('COMMIT')
+
+    def close(self):
+        # waits for the files submitted before closing the database
+        self.pool.shutdown(wait=True)
+        self.db.close()
+
+    def _write(self, rows):
+        # replace the rows of a list of described files in one transaction
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                for row, msgs in rows:
+                    self.db.execute('DELETE FROM messages WHERE path = ?',
+                                    (row[0],))
+                    self.db.execute('INSERT OR REPLACE INTO files (%s) '
+                                    'VALUES (%s)'%(', '.join(COLUMNS),
+                                                   ', '.join('?' * len(row))),
+                                    row)
+                    self.db.executemany('INSERT INTO messages VALUES '
+                                        '(?, ?, ?, ?, ?, ?, ?)', msgs)
+
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+
+            self.db.execute('COMMIT')
+
+    def add(self, path, md5=None, checksum=True):
+        """ Adds or updates a file written by a download script
+
+        md5 and checksum are passed to read_file.  Files which are not GRIB,
+        e.g., left by a failed request, are not recorded."""
+
+        rows = read_file(path, md5, checksum)
+        if rows is not None:
+            self._write([rows])
+
+    def submit(self, path, md5=None, checksum=True):
+        """ Adds a file with add on the threads of the catalog
+
+        For callers which must not wait on the checksum and inventory of the
+        file, e.g., the done callbacks of grib_stages.StagePool.  Failures are
+        reported as warnings.  Returns the future of add."""
+
+        def added(fut):
+            if fut.exception() is not None:
+                print('WARNING: could not catalog %s: %s'%(path,
+                                                           fut.exception()))
+
+        fut = self.pool.submit(self.add, path, md5, checksum)
+        fut.add_done_callback(added)
+        return fut
+
+    def remove(self, paths):
+        # drop the rows of files no longer on disk
+        with self.lock:
+            for path in paths:
+                self.db.execute('DELETE FROM messages WHERE path = ?', (path,))
+                self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def files(self, source=None, cycle=None):
+        # rows of the files of a source / cycle as dictionaries
+        query = 'SELECT * FROM files WHERE 1'
+        args = []
+        for key, val in [('source', source), ('cycle', cycle)]:
+            if val is not None:
+                query += ' AND %s = ?'%key
+                args.append(val)
+
+        with self.lock:
+            cur = self.db.execute(query + ' ORDER BY path', args)
+            keys = [col[0] for col in cur.description]
+            return [dict(zip(keys, row)) for row in cur.fetchall()]
+
+    def missing(self, cycle, members, fhrs, streams=['a', 'b'], res='0p50'):
+        """ Lists the GEFS files of a zero hour which are not in the catalog
+
+        cycle is the zero hour as YYYYMMDDHH, members and fhrs lists of member
+        indices and forecast hours, and res the resolution of the files.
+        Returns the sorted list of missing (member, fhr, stream), empty if the
+        cycle is complete."""
+
+        with self.lock:
+            have = set(self.db.execute('SELECT member, fhr, stream FROM files '
+                                       'WHERE source = ? AND cycle = ? AND '
+                                       'res = ?', ('gefs', cycle,
+                                                   res)).fetchall())
+
+        return sorted([(mem, fhr, stream) for mem in members for fhr in fhrs
+                       for stream in streams if (mem, fhr, stream) not in have])
+
+    def missing_valid(self, valids, stream=None):
+        """ Lists the valid times with no ERA5 message in the catalog
+
+        valids is a list of datetimes, stream an ERA5 CALL to restrict the
+        files to.  Returns the sorted list of the valid times missing."""
+
+        query = 'SELECT DISTINCT m.valid FROM messages m JOIN files f ON ' +\
+                'm.path = f.path WHERE f.source = ? AND m.valid BETWEEN ? AND ?'
+        args = ['era5', min(valids).strftime('%Y%m%d%H%M'),
+                max(valids).strftime('%Y%m%d%H%M')]
+        if stream is not None:
+            query += ' AND f.stream = ?'
+            args.append(stream)
+
+        with self.lock:
+            have = set([row[0] for row in self.db.execute(query, args)])
+
+        return sorted([valid for valid in valids if
+                       valid.strftime('%Y%m%d%H%M') not in have])
+
+    def summary(self):
+        # number of files, bytes and messages by source
+        with self.lock:
+            return self.db.execute('SELECT source, COUNT(*), SUM(size), '
+                                   'SUM(n_msgs) FROM files GROUP BY source '
+                                   'ORDER BY source').fetchall()
+
+    def rebuild(self, root, n_workers=16, checksum=True):
+        """ Crawls the tree under root and refreshes its rows in the catalog
+
+        The directories under root are listed concurrently on a pool of
+        n_workers threads, and files which are new or whose size or
+        modification time changed are described on the same pool.  Rows of
+        files under root which are no longer on disk are removed.  Returns the
+        number of files described, unchanged and removed."""
+
+        with self.lock:
+            known = dict([(row[0], (row[1], row[2])) for row in
+                          self.db.execute('SELECT path, size, mtime FROM '
+                                          'files')])
+
+        def walk(top):
+            # stats of the visible files under top
+            found = {}
+            for head, dirs, names in os.walk(top):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                for name in names:
+                    if name.startswith('.'):
+                        continue
+
+                    path = os.path.join(head, name)
+                    st = os.stat(path)
+                    found[path] = (st.st_size, st.st_mtime)
+
+            return found
+
+        root = os.path.abspath(root)
+        tops = []
+        found = {}
+        for entry in os.scandir(root):
+            if entry.name.startswith('.'):
+                continue
+
+            if entry.is_dir():
+                tops.append(entry.path)
+            elif entry.is_file():
+                st = entry.stat()
+                found[entry.path] = (st.st_size, st.st_mtime)
+
+        n_read = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as pool:
+            for part in pool.map(walk, tops):
+                found.update(part)
+
+            new = [path for path in sorted(found) if known.get(path) !=
+                   found[path]]
+            futs = [pool.submit(read_file, path, None, checksum)
+                    for path in new]
+            batch = []
+            for fut in concurrent.futures.as_completed(futs):
+                try:
+                    rows = fut.result()
+
+                except (OSError, ValueError) as err:
+                    print('WARNING: could not read a file: ' + str(err))
+                    continue
+
+                if rows is None:
+                    continue
+
+                batch.append(rows)
+                if len(batch) >= 100:
+                    self._write(batch)
+                    n_read += len(batch)
+                    batch = []
+
+            self._write(batch)
+            n_read += len(batch)
+
+        gone = [path for path in known if path.startswith(root + os.sep) and
+                path not in found]
+        self.remove(gone)
+        return n_read, len(found) - len(new), len(gone)
+
+##################################################################################
+# Query catalog
+##################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('catalog', help='SQLite catalog file')
+    cmds = parser.add_subparsers(dest='cmd', required=True)
+    cmd = cmds.add_parser('rebuild', help='crawl a tree into the catalog')
+    cmd.add_argument('root')
+    cmd.add_argument('--workers', type=int, default=16)
+    cmd.add_argument('--no-checksum', action='store_true',
+                     help='do not compute the MD5 of new files')
+    cmd = cmds.add_parser('complete', help='check the files of a GEFS cycle')
+    cmd.add_argument('cycle', help='zero hour YYYYMMDDHH')
+    cmd.add_argument('--members', default='0-30', help='e.g. 1-30')
+    cmd.add_argument('--fhrs', default='0', help='e.g. 0-12:3')
+    cmd.add_argument('--streams', default='a,b')
+    cmd.add_argument('--res', default='0p50', help='1p00 or 0p50')
+    cmd = cmds.add_parser('valid', help='check the ERA5 valid times')
+    cmd.add_argument('valids', nargs='+', help='valid times YYYYMMDDHH')
+    cmd.add_argument('--stream', help='ERA5 CALL, e.g. model_levels')
+    cmds.add_parser('summary', help='report the holdings by source')
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    if args.cmd == 'rebuild':
+        strt = time.perf_counter()
+        n_read, n_same, n_gone = catalog.rebuild(args.root, args.workers,
+                                                 not args.no_checksum)
+        print('%s files described, %s unchanged, %s removed in %.2f s'%(
+              n_read, n_same, n_gone, time.perf_counter() - strt))
+
+    elif args.cmd == 'complete':
+        missing = catalog.missing(args.cycle, parse_range(args.members),
+                                  parse_range(args.fhrs),
+                                  args.streams.split(','), args.res)
+        for mem, fhr, stream in missing:
+            print('MISSING: member %02d f%03d stream %s'%(mem, fhr, stream))
+
+        print('Cycle %s %s'%(args.cycle, 'incomplete, %s files missing'%
+                             len(missing) if missing else 'complete'))
+        sys.exit(1 if missing else 0)
+
+    elif args.cmd == 'valid':
+        missing = catalog.missing_valid([dt.strptime(valid, '%Y%m%d%H') for
+                                         valid in args.valids], args.stream)
+        for valid in missing:
+            print('MISSING: ' + valid.strftime('%Y-%m-%dT%H'))
+
+        sys.exit(1 if missing else 0)
+
+    else:
+        for source, n_files, size, n_msgs in catalog.summary():
+            print('%-6s %8s files %10.2f GB %10s messages'%(source, n_files,
+                  size / 1e9, n_msgs))
+
+    catalog.close()
+
+##################################################################################
+# end
@@ -0,0 +1,484 @@
+##################################################################################
+# Description
+##################################################################################
+# This module crops the messages of GRIB files on global regular lat-lon grids
+# to a regional lat / lon box, so that only the part of the GEFS / ERA5 fields
+# covering the WRF domains is kept on scratch, in files ungrib can still read.
+#
+# Messages are read and written one at a time.  The packed data of the rows
+# and columns of the grid inside the box are copied bit for bit, keeping the
+# reference value, scale factors and number of bits of the message, so that
+# the cropped field has exactly the values of the original at every point
+# inside the box.  The grid definition is updated to the number of points and
+# the first / last latitude and longitude of the cropped grid.  Boxes across
+# the longitude seam of a global grid are supported.  The bitmap of a field
+# with missing points, e.g., the sea fields of ERA5 or the land fields of GEFS,
+# is cropped with the grid, keeping the values of the points present.  Messages
+# must be
+#
+#     GRIB1 -- grid 0 regular lat-lon, simple packing, with or without an
+#              explicit bitmap
+#     GRIB2 -- template 3.0 regular lat-lon, template 5.0 simple packing,
+#              with or without a bitmap, one field per message
+#
+# Other packings, e.g., the complex packing of the GEFS files, are repacked to
+# simple packing with the eccodes stage to_simple in grib_stages.py first.  The
+# crop is run as the stage 'crop:SOUTH/NORTH/WEST/EAST' of grib_stages.py, or
+# standalone as
+#
+#     python grib_crop.py SOUTH,NORTH,WEST,EAST SRC DST
+#
+# reporting the bytes saved.  Longitudes are in degrees east, negative to the
+# west of Greenwich.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import struct
+from grib_split import scan
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def crop_spec(box, margin=0.0):
+    """ Returns the crop stage of grib_stages.py for box plus a margin
+
+    box is (south, north, west, east) in degrees, margin in degrees is added
+    on every side, with latitudes limited to the poles."""
+
+    south, north, west, east = box
+    return 'crop:%g/%g/%g/%g'%(max(south - margin, -90),
+                               min(north + margin, 90), west - margin,
+                               east + margin)
+
+def _sint(buf, nbytes):
+    # integer stored with a sign bit in its most significant bit
+    val = int.from_bytes(buf, 'big')
+    sign = 1 << (8 * nbytes - 1)
+    return -(val & (sign - 1)) if val & sign else val
+
+def _pack_sint(val, nbytes):
+    # integer to bytes with a sign bit in its most significant bit
+    return ((1 << (8 * nbytes - 1) if val < 0 else 0) | abs(val)).to_bytes(
+            nbytes, 'big')
+
+def _ibm_float(buf):
+    # IBM single precision float of GRIB1 reference values
+    val = int.from_bytes(buf[1:4], 'big') * 16.0**((buf[0] & 0x7f) - 64) *\
+          2.0**-24
+    return -val if buf[0] & 0x80 else val
+
+def _select(grid, box, unit):
+    """ Rows and runs of columns of grid inside box
+
+    grid is a dictionary of ni, nj, la1, lo1, di, dj and scan in integer units
+    of unit per degree.  Returns the range of rows, the list of (first, last)
+    columns of each run and the first latitude and longitude of the cropped
+    grid, raising a ValueError if no grid point is in the box."""
+
+    south, north, west, east = [round(val * unit) for val in box]
+    full = 360 * unit
+    span = min(east - west, full) if east >= west else (east - west) % full
+    sgn = 1 if grid['scan'] & 0x40 else -1
+    rows = [j for j in range(grid['nj'])
+            if south <= grid['la1'] + sgn * j * grid['dj'] <= north]
+    cols = [i for i in range(grid['ni'])
+            if (grid['lo1'] + i * grid['di'] - west) % full <= span]
+    if not rows or not cols:
+        raise ValueError('no grid point in the box %s'%(box,))
+
+    # split the columns into runs, starting after the gap of a global grid
+    runs = [[cols[0], cols[0]]]
+    for i in cols[1:]:
+        if i == runs[-1][1] + 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+
+    if len(runs) > 1 and runs[0][0] == 0 and runs[-1][1] == grid['ni'] - 1 and\
+            grid['ni'] * grid['di'] >= full:
+        runs = [runs[-1]] + runs[:-1]
+
+    la1 = grid['la1'] + sgn * rows[0] * grid['dj']
+    lo1 = (grid['lo1'] + runs[0][0] * grid['di']) % full
+    return range(rows[0], rows[-1] + 1), [tuple(run) for run in runs], la1, lo1
+
+def _bits(data, start, length):
+    # integer of the length bits of data from bit start
+    b0, b1 = start // 8, (start + length + 7) // 8
+    return (int.from_bytes(data[b0:b1], 'big') >> (8 * b1 - start - length)) &\
+           ((1 << length) - 1)
+
+def _ranges(ni, rows, runs, bitmap=None):
+    """ Ranges of the packed values of rows / column runs of a grid
+
+    Without bitmap, a value is packed for each of the ni columns of a row.
+    With a bitmap, values are only packed for the points of its set bits, and
+    the values of a run start after the set bits before it.  Returns the list
+    of (first, count) of the values of each run of each row."""
+
+    ranges = []
+    n_set = 0
+    row = 0
+    for j in rows:
+        if bitmap is None:
+            ranges += [(j * ni + c0, c1 - c0 + 1) for c0, c1 in runs]
+            continue
+
+        # set bits before the row
+        while row < j:
+            n_set += _bits(bitmap, row * ni, ni).bit_count()
+            row += 1
+
+        for c0, c1 in runs:
+            ranges.append((n_set + _bits(bitmap, j * ni, c0).bit_count(),
+                           _bits(bitmap, j * ni + c0, c1 - c0 + 1).bit_count()))
+
+    return ranges
+
+def _copy_bits(data, nbits, ranges):
+    """ Packs the ranges of values of packed data of nbits
+
+    ranges is a list of (first, count) values, see _ranges.  Returns the packed
+    bytes of the values copied and the number of unused bits at their end."""
+
+    out = bytearray()
+    if nbits == 0:
+        return bytes(out), 0
+
+    if nbits % 8 == 0:
+        size = nbits // 8
+        for first, count in ranges:
+            out += data[first * size:(first + count) * size]
+
+        return bytes(out), 0
+
+    acc = 0
+    acc_bits = 0
+    for first, count in ranges:
+        length = count * nbits
+        acc = (acc << length) | _bits(data, first * nbits, length)
+        acc_bits += length
+
+        # flush whole bytes, keeping the accumulator to a run
+        n_out = acc_bits // 8
+        out += (acc >> (acc_bits - 8 * n_out)).to_bytes(n_out, 'big')
+        acc_bits -= 8 * n_out
+        acc &= (1 << acc_bits) - 1
+
+    unused = 0
+    if acc_bits:
+        unused = 8 - acc_bits
+        out.append(acc << unused)
+
+    return bytes(out), unused
+
+def _grib1_sections(msg):
+    # offsets of the PDS, GDS, BMS, None without bitmap, and BDS of a GRIB1
+    # message
+    pds = 8
+    if not msg[pds + 7] & 0x80:
+        raise ValueError('GRIB1 message without grid definition')
+
+    gds = pds + int.from_bytes(msg[pds:pds + 3], 'big')
+    bds = gds + int.from_bytes(msg[gds:gds + 3], 'big')
+    bms = None
+    if msg[pds + 7] & 0x40:
+        bms, bds = bds, bds + int.from_bytes(msg[bds:bds + 3], 'big')
+        if int.from_bytes(msg[bms + 4:bms + 6], 'big') != 0:
+            raise ValueError('GRIB1 message with a predefined bitmap is not '
+                             'supported')
+
+    if msg[gds + 5] != 0:
+        raise ValueError('GRIB1 grid %s is not regular lat-lon'%msg[gds + 5])
+
+    if msg[bds + 3] & 0xd0:
+        raise ValueError('GRIB1 packing is not simple packing, repack with '
+                         'the to_simple stage')
+
+    return pds, gds, bms, bds
+
+def _grib1_grid(msg, gds):
+    # regular lat-lon grid of a GRIB1 GDS in millidegrees
+    grid = {
+            'ni' : int.from_bytes(msg[gds + 6:gds + 8], 'big'),
+            'nj' : int.from_bytes(msg[gds + 8:gds + 10], 'big'),
+            'la1': _sint(msg[gds + 10:gds + 13], 3),
+            'lo1': _sint(msg[gds + 13:gds + 16], 3),
+            'di' : int.from_bytes(msg[gds + 23:gds + 25], 'big'),
+            'dj' : int.from_bytes(msg[gds + 25:gds + 27], 'big'),
+            'scan': msg[gds + 27],
+           }
+    if grid['ni'] == 0xffff or grid['scan'] & 0xa0:
+        raise ValueError('GRIB1 grid with scanning mode %s is not supported'%
+                         grid['scan'])
+
+    return grid
+
+def crop_grib1(msg, box):
+    # crop a GRIB1 message to box
+    pds, gds, bms, bds = _grib1_sections(msg)
+    grid = _grib1_grid(msg, gds)
+    rows, runs, la1, lo1 = _select(grid, box, 1000)
+    bitmap = msg[bms + 6:bds] if bms is not None else None
+    n_i = sum([c1 - c0 + 1 for c0, c1 in runs])
+    sgn = 1 if grid['scan'] & 0x40 else -1
+    la2 = la1 + sgn * (len(rows) - 1) * grid['dj']
+    lo2 = (lo1 + (n_i - 1) * grid['di']) % 360000
+
+    bds_len = int.from_bytes(msg[bds:bds + 3], 'big')
+    data, unused = _copy_bits(msg[bds + 11:bds + bds_len], msg[bds + 10],
+                              _ranges(grid['ni'], rows, runs, bitmap))
+    if (11 + len(data)) % 2:
+        # sections have an even number of octets
+        data += b'\x00'
+        unused += 8
+
+    bmap = b''
+    if bitmap is not None:
+        bits, bm_unused = _copy_bits(bitmap, 1,
+                                     _ranges(grid['ni'], rows, runs))
+        if (6 + len(bits)) % 2:
+            bits += b'\x00'
+            bm_unused += 8
+
+        bmap = (6 + len(bits)).to_bytes(3, 'big') + bytes([bm_unused]) +\
+               msg[bms + 4:bms + 6] + bits
+
+    gdef = bytearray(msg[gds:gds + int.from_bytes(msg[gds:gds + 3], 'big')])
+    gdef[6:8] = n_i.to_bytes(2, 'big')
+    gdef[8:10] = len(rows).to_bytes(2, 'big')
+    gdef[10:13] = _pack_sint(la1, 3)
+    gdef[13:16] = _pack_sint(lo1, 3)
+    gdef[17:20] = _pack_sint(la2, 3)
+    gdef[20:23] = _pack_sint(lo2, 3)
+    bdef = bytearray(msg[bds:bds + 11])
+    bdef[0:3] = (11 + len(data)).to_bytes(3, 'big')
+    bdef[3] = (bdef[3] & 0xf0) | unused
+    body = msg[pds:gds] + bytes(gdef) + bmap + bytes(bdef) + data
+    return b'GRIB' + (8 + len(body) + 4).to_bytes(3, 'big') + b'\x01' + body +\
+           b'7777'
+
+def _grib2_sections(msg):
+    # offsets of the sections of a GRIB2 message by number
+    secs = {}
+    pos = 16
+    while msg[pos:pos + 4] != b'7777':
+        num = msg[pos + 4]
+        if num in secs:
+            raise ValueError('GRIB2 messages with several fields are not '
+                             'supported')
+
+        secs[num] = pos
+        pos += int.from_bytes(msg[pos:pos + 4], 'big')
+
+    if int.from_bytes(msg[secs[3] + 12:secs[3] + 14], 'big') != 0:
+        raise ValueError('GRIB2 grid is not regular lat-lon')
+
+    if int.from_bytes(msg[secs[5] + 9:secs[5] + 11], 'big') != 0:
+        raise ValueError('GRIB2 packing is not simple packing, repack with '
+                         'the to_simple stage')
+
+    if msg[secs[6] + 5] not in [0, 255]:
+        raise ValueError('GRIB2 message with a predefined bitmap is not '
+                         'supported')
+
+    return secs
+
+def _grib2_grid(msg, sec3):
+    # regular lat-lon grid of a GRIB2 template 3.0 in microdegrees
+    basic = int.from_bytes(msg[sec3 + 38:sec3 + 42], 'big')
+    if basic not in [0, 0xffffffff]:
+        raise ValueError('GRIB2 grid with basic angle %s is not supported'%
+                         basic)
+
+    grid = {
+            'ni' : int.from_bytes(msg[sec3 + 30:sec3 + 34], 'big'),
+            'nj' : int.from_bytes(msg[sec3 + 34:sec3 + 38], 'big'),
+            'la1': _sint(msg[sec3 + 46:sec3 + 50], 4),
+            'lo1': _sint(msg[sec3 + 50:sec3 + 54], 4),
+            'di' : int.from_bytes(msg[sec3 + 63:sec3 + 67], 'big'),
+            'dj' : int.from_bytes(msg[sec3 + 67:sec3 + 71], 'big'),
+            'scan': msg[sec3 + 71],
+           }
+    if grid['scan'] & 0xb0:
+        raise ValueError('GRIB2 grid with scanning mode %s is not supported'%
+                         grid['scan'])
+
+    return grid
+
+def crop_grib2(msg, box):
+    # crop a GRIB2 message to box
+    secs = _grib2_sections(msg)
+    grid = _grib2_grid(msg, secs[3])
+    rows, runs, la1, lo1 = _select(grid, box, 1000000)
+    n_i = sum([c1 - c0 + 1 for c0, c1 in runs])
+    sgn = 1 if grid['scan'] & 0x40 else -1
+    la2 = la1 + sgn * (len(rows) - 1) * grid['dj']
+    lo2 = (lo1 + (n_i - 1) * grid['di']) % 360000000
+    n_pts = n_i * len(rows)
+
+    sec5, sec6, sec7 = secs[5], secs[6], secs[7]
+    sec7_len = int.from_bytes(msg[sec7:sec7 + 4], 'big')
+    bitmap = msg[sec6 + 6:sec7] if msg[sec6 + 5] == 0 else None
+    ranges = _ranges(grid['ni'], rows, runs, bitmap)
+    data, unused = _copy_bits(msg[sec7 + 5:sec7 + sec7_len], msg[sec5 + 19],
+                              ranges)
+
+    gdef = bytearray(msg[secs[3]:secs[4]])
+    gdef[6:10] = n_pts.to_bytes(4, 'big')
+    gdef[30:34] = n_i.to_bytes(4, 'big')
+    gdef[34:38] = len(rows).to_bytes(4, 'big')
+    gdef[46:50] = _pack_sint(la1, 4)
+    gdef[50:54] = _pack_sint(lo1, 4)
+    gdef[55:59] = _pack_sint(la2, 4)
+    gdef[59:63] = _pack_sint(lo2, 4)
+    rdef = bytearray(msg[sec5:sec6])
+    rdef[5:9] = sum([count for first, count in ranges]).to_bytes(4, 'big')
+    bmap = msg[sec6:sec7]
+    if bitmap is not None:
+        bits = _copy_bits(bitmap, 1, _ranges(grid['ni'], rows, runs))[0]
+        bmap = (6 + len(bits)).to_bytes(4, 'big') + b'\x06\x00' + bits
+
+    body = msg[16:secs[3]] + bytes(gdef) + msg[secs[4]:sec5] + bytes(rdef) +\
+           bmap + (5 + len(data)).to_bytes(4, 'big') + b'\x07' + data
+    return msg[:8] + (16 + len(body) + 4).to_bytes(8, 'big') + body + b'7777'
+
+def crop_message(msg, box):
+    """ Crops a single GRIB1 / GRIB2 message to box
+
+    msg is the bytes of the message and box (south, north, west, east) in
+    degrees.  Returns the bytes of the cropped message, raising a ValueError
+    for grids or packings which are not supported."""
+
+    if msg[7] == 1:
+        return crop_grib1(msg, box)
+
+    if msg[7] == 2:
+        return crop_grib2(msg, box)
+
+    raise ValueError('unknown GRIB edition %s'%msg[7])
+
+def grid_values(msg):
+    """ Decodes a simple packed regular lat-lon message for checks
+
+    Returns a dictionary of the value at each grid point by (latitude,
+    longitude) in integer millidegrees, with longitudes in [0, 360), None at
+    the points missing from the bitmap."""
+
+    if msg[7] == 1:
+        pds, gds, bms, bds = _grib1_sections(msg)
+        grid = _grib1_grid(msg, gds)
+        bitmap = msg[bms + 6:bds] if bms is not None else None
+        unit = 1
+        bds_len = int.from_bytes(msg[bds:bds + 3], 'big')
+        ref = _ibm_float(msg[bds + 6:bds + 10])
+        bin_sc = _sint(msg[bds + 4:bds + 6], 2)
+        dec_sc = _sint(msg[pds + 26:pds + 28], 2)
+        nbits = msg[bds + 10]
+        data = msg[bds + 11:bds + bds_len]
+
+    else:
+        secs = _grib2_sections(msg)
+        grid = _grib2_grid(msg, secs[3])
+        unit = 1000
+        sec5, sec6, sec7 = secs[5], secs[6], secs[7]
+        bitmap = msg[sec6 + 6:sec7] if msg[sec6 + 5] == 0 else None
+        ref = struct.unpack('>f', msg[sec5 + 11:sec5 + 15])[0]
+        bin_sc = _sint(msg[sec5 + 15:sec5 + 17], 2)
+        dec_sc = _sint(msg[sec5 + 17:sec5 + 19], 2)
+        nbits = msg[sec5 + 19]
+        data = msg[sec7 + 5:sec7 + int.from_bytes(msg[sec7:sec7 + 4], 'big')]
+
+    sgn = 1 if grid['scan'] & 0x40 else -1
+    ni = grid['ni']
+    mask = (1 << nbits) - 1
+    vals = {}
+    for j in range(grid['nj']):
+        lat = (grid['la1'] + sgn * j * grid['dj']) // unit
+        ranges = _ranges(ni, [j], [(0, ni - 1)], bitmap)
+        row, unused = _copy_bits(data, nbits, ranges)
+        packed = int.from_bytes(row, 'big') >> unused
+        present = (1 << ni) - 1
+        if bitmap is not None:
+            present = _bits(bitmap, j * ni, ni)
+
+        left = ranges[0][1]
+        for i in range(ni):
+            lon = ((grid['lo1'] + i * grid['di']) // unit) % 360000
+            if not present >> (ni - 1 - i) & 1:
+                vals[(lat, lon)] = None
+                continue
+
+            left -= 1
+            x = (packed >> (left * nbits)) & mask
+            vals[(lat, lon)] = (ref + x * 2.0**bin_sc) / 10.0**dec_sc
+
+    return vals
+
+def crop_file(src, dst, south, north, west, east):
+    """ Crops all messages of the GRIB file src to the box into dst
+
+    The box may be given as strings, as passed by the stage specification of
+    grib_stages.py.  Messages are read, cropped and written one at a time.
+    Returns the number of bytes of src and of dst."""
+
+    box = [float(val) for val in [south, north, west, east]]
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        for offset, length, valid in scan(src):
+            fin.seek(offset)
+            fout.write(crop_message(fin.read(length), box))
+
+    n_src, n_dst = os.path.getsize(src), os.path.getsize(dst)
+    print('Cropped %s to %s, %s of %s bytes, %.1f%% saved'%(
+          os.path.basename(src), box, n_dst, n_src,
+          100 * (1 - n_dst / max(n_src, 1))))
+    return n_src, n_dst
+
+##################################################################################
+# Crop file
+##################################################################################
+if __name__ == '__main__':
+    crop_file(sys.argv[2], sys.argv[3], *sys.argv[1].split(','))
+
+##################################################################################
+# end
@@ -0,0 +1,229 @@
+##################################################################################
+# Description
+##################################################################################
+# This module contains utilities for subsetting remote GRIB2 files by byte range,
+# using the wgrib2 style .idx inventory sidecar files published alongside the
+# GEFS pgrb2a / pgrb2b objects.  Each line of an inventory has the form
+#
+#     NUM:START_BYTE:d=YYYYMMDDHH:VAR:LEVEL:FORECAST:...
+#
+# where START_BYTE is the offset of the message in the GRIB2 file.  Records are
+# selected by variable / level, either from the GRIB2 columns of an ungrib
+# Vtable or from an explicit list of 'VAR:LEVEL' strings, where LEVEL is a
+# regular expression and may be omitted to select all levels of VAR.  Adjacent
+# byte ranges are merged, and the selected messages are concatenated into a
+# valid GRIB2 file with HTTP Range requests.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import re
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# GRIB2 discipline / category / parameter of the Vtable to inventory names
+GRIB2_VARS = {
+              (0, 0, 0)  : 'TMP',
+              (0, 1, 1)  : 'RH',
+              (0, 1, 13) : 'WEASD',
+              (0, 2, 2)  : 'UGRD',
+              (0, 2, 3)  : 'VGRD',
+              (0, 3, 0)  : 'PRES',
+              (0, 3, 1)  : 'PRMSL',
+              (0, 3, 5)  : 'HGT',
+              (2, 0, 0)  : 'LAND',
+              (2, 0, 2)  : 'TSOIL',
+              (2, 0, 192): 'SOILW',
+              (10, 2, 0) : 'ICEC',
+             }
+
+def level_regex(lev_type, lev1, lev2):
+    """ Generates a regular expression for inventory levels of a Vtable row
+
+    lev_type is the GRIB2 level type and lev1 / lev2 are the level values in
+    the GRIB1 columns of the Vtable, where '*' denotes all levels.  Returns
+    None for level types that are not supported."""
+
+    if lev_type == 1:
+        return 'surface'
+
+    elif lev_type == 100:
+        # all isobaric levels, the Vtable wildcard is always used
+        return r'[0-9.]+ mb'
+
+    elif lev_type == 101:
+        return 'mean sea level'
+
+    elif lev_type == 103:
+        if lev1 == '*':
+            return r'[0-9.]+ m above ground'
+
+        return re.escape(lev1) + ' m above ground'
+
+    elif lev_type == 106:
+        # soil layers are given in cm in the Vtable and in m in the inventory
+        top = '%g'%(int(lev1) / 100)
+        bot = '%g'%(int(lev2) / 100)
+        return re.escape(top + '-' + bot) + ' m below ground'
+
+    return None
+
+def vtable_fields(vtable):
+    """ Reads the inventory variable / level pairs used by an ungrib Vtable
+
+    Returns a list of (VAR, LEVEL) tuples where LEVEL is a regular expression,
+    for each row of the Vtable with a GRIB2 parameter in GRIB2_VARS."""
+
+    fields = []
+    with open(vtable, 'r') as f:
+        for line in f:
+            cols = [col.strip() for col in line.split('|')]
+            if len(cols) < 12 or not cols[7].isdigit():
+                # skip headers, separators and comments
+                continue
+
+            key = (int(cols[7]), int(cols[8]), int(cols[9]))
+            if key not in GRIB2_VARS:
+                print('Skipping unknown GRIB2 parameter %s in %s'%(key, vtable))
+                continue
+
+            lev = level_regex(int(cols[10]), cols[2], cols[3])
+            if lev is None:
+                print('Skipping unknown GRIB2 level type %s in %s'%(cols[10],
+                                                                 vtable))
+                continue
+
+            field = (GRIB2_VARS[key], lev)
+            if field not in fields:
+                fields.append(field)
+
+    return fields
+
+def list_fields(names):
+    """ Converts explicit 'VAR:LEVEL' / 'VAR' strings to (VAR, LEVEL) tuples """
+
+    fields = []
+    for name in names:
+        var, _, lev = name.partition(':')
+        fields.append((var, lev if lev else '.*'))
+
+    return fields
+
+def parse_idx(text, size=None):
+    """ Parses a GRIB2 .idx inventory into a list of records
+
+    Each record is a dictionary with the message number, 'start' and 'end'
+    byte offsets (inclusive), 'var' and 'level'.  The end of the last message
+    is size - 1 if the file size is known, else None for an open range."""
+
+    recs = []
+    for line in text.splitlines():
+        cols = line.split(':')
+        if len(cols) < 5:
+            continue
+
+        recs.append({
+                     'num'  : cols[0],
+                     'start': int(cols[1]),
+                     'end'  : None,
+                     'var'  : cols[3],
+                     'level': cols[4],
+                    })
+
+    # sub-messages, e.g., '1.1' / '1.2', share the offset of their message
+    end = None if size is None else size - 1
+    start = None
+    for rec in reversed(recs):
+        if start is not None and rec['start'] < start:
+            end = start - 1
+
+        rec['end'] = end
+        start = rec['start']
+
+    return recs
+
+def select(recs, fields):
+    """ Selects inventory records matching any of the (VAR, LEVEL) fields """
+
+    pats = [(var, re.compile(lev)) for var, lev in fields]
+    sel = []
+    for rec in recs:
+        for var, lev in pats:
+            if rec['var'] == var and lev.fullmatch(rec['level']):
+                sel.append(rec)
+                break
+
+    return sel
+
+def merge_ranges(recs):
+    """ Merges the byte ranges of adjacent records
+
+    Returns a list of [start, end] ranges, with end None for an open range."""
+
+    ranges = []
+    for rec in recs:
+        if ranges and (ranges[-1][1] is None or\
+                       rec['start'] <= ranges[-1][1] + 1):
+            if ranges[-1][1] is not None and\
+                    (rec['end'] is None or rec['end'] > ranges[-1][1]):
+                ranges[-1][1] = rec['end']
+        else:
+            ranges.append([rec['start'], rec['end']])
+
+    return ranges
+
+def get_subset(client, key, path, fields, size=None):
+    """ Downloads the messages of key matching fields into path
+
+    The inventory key + '.idx' is read with the S3 client, the matching
+    records are merged into byte ranges and the ranges are concatenated into
+    path.  Returns the total number of bytes transferred, including the
+    inventory."""
+
+    idx = client.read_object(key + '.idx')
+    recs = select(parse_idx(idx.decode('ascii'), size), fields)
+    ranges = merge_ranges(recs)
+
+    return len(idx) + client.get_ranges(key, path, ranges)
+
+##################################################################################
+# end
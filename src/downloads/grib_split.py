@@ -0,0 +1,267 @@
+##################################################################################
+# Description
+##################################################################################
+# This module indexes the messages of multi-day GRIB files by valid time and
+# splits them into one file per cycle window, so that ungrib of a cycle only
+# reads the messages of its own valid times rather than scanning the full
+# download of every window for every cycle.
+#
+# Messages are scanned one at a time from their headers, reading only the
+# indicator section and the sections giving the reference and forecast time,
+# for GRIB1 and GRIB2.  The index of a file is written to the sidecar FILE.gidx
+# with a line per message of the form
+#
+#     NUM:OFFSET:LENGTH:vt=YYYYMMDDHHMM
+#
+# and reused while the file is unchanged.  The messages of each cycle window,
+# from the cycle point to FCST_HRS after it, are copied by byte range with
+# os.sendfile into OUT_ROOT/YYYYMMDDHH/FILE, written atomically, so that the
+# memory in use does not grow with the size of the files.  Each cycle directory
+# holds the slices of every file with messages of its window, to be linked by
+# link_grib.csh as a whole.  Run standalone as
+#
+#     python grib_split.py OUT_ROOT CYC_INC FCST_HRS FILE [FILE ...]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+from datetime import datetime as dt
+from datetime import timedelta
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# suffix of the message index of a GRIB file
+IDX_SUFFIX = '.gidx'
+
+# block size for searching the start of a message
+BLOCK = 64 * 1024
+
+# forecast time units of GRIB code tables 4 / 4.4 in hours
+UNITS = {0: 1 / 60, 1: 1, 2: 24, 10: 3, 11: 6, 12: 12, 13: 1 / 3600}
+
+def _find(f, pos):
+    # offset of the next 'GRIB' indicator at or after pos, None at the end
+    f.seek(pos)
+    if f.read(4) == b'GRIB':
+        return pos
+
+    f.seek(pos)
+    tail = b''
+    while True:
+        buf = f.read(BLOCK)
+        if not buf:
+            return None
+
+        i = (tail + buf).find(b'GRIB')
+        if i >= 0:
+            return pos - len(tail) + i
+
+        pos += len(buf)
+        tail = buf[-3:]
+
+def _valid_grib1(f, start):
+    # valid time of a GRIB1 message from its product definition section
+    f.seek(start + 8)
+    pds = f.read(28)
+    century = pds[24] if pds[24] else 21
+    ref = dt(100 * (century - 1) + pds[12], pds[13], pds[14], pds[15], pds[16])
+    unit, p1, p2, tri = pds[17], pds[18], pds[19], pds[20]
+    if tri == 10:
+        fcst = 256 * p1 + p2
+    elif tri in [2, 3, 4, 5]:
+        fcst = p2
+    else:
+        fcst = p1
+
+    return ref + timedelta(hours=fcst * UNITS.get(unit, 1))
+
+def _valid_grib2(f, start, length):
+    # valid time of a GRIB2 message from its sections 1 and 4
+    pos = start + 16
+    ref = None
+    while pos < start + length - 4:
+        f.seek(pos)
+        head = f.read(5)
+        size, num = int.from_bytes(head[:4], 'big'), head[4]
+        if num == 1:
+            sec = f.read(14)
+            ref = dt(int.from_bytes(sec[7:9], 'big'), *sec[9:14])
+
+        elif num == 4:
+            sec = f.read(17)
+            fcst = 0
+            if int.from_bytes(sec[2:4], 'big') in range(0, 16):
+                fcst = int.from_bytes(sec[13:17], 'big', signed=False) *\
+                        UNITS.get(sec[12], 1)
+
+            return ref + timedelta(hours=fcst)
+
+        pos += size
+
+    raise ValueError('GRIB2 message at %s has no product definition'%start)
+
+def scan(path):
+    """ Scans the messages of a GRIB1 / GRIB2 file one at a time
+
+    Yields (offset, length, valid time) of each message, reading only the
+    headers of the sections needed."""
+
+    with open(path, 'rb') as f:
+        pos = _find(f, 0)
+        while pos is not None:
+            f.seek(pos)
+            ind = f.read(16)
+            if len(ind) < 8:
+                break
+
+            if ind[7] == 2:
+                length = int.from_bytes(ind[8:16], 'big')
+                valid = _valid_grib2(f, pos, length)
+            elif ind[7] == 1:
+                length = int.from_bytes(ind[4:7], 'big')
+                if length & 0x800000:
+                    raise ValueError('large GRIB1 message at %s of %s is not '
+                                     'supported'%(pos, path))
+
+                valid = _valid_grib1(f, pos)
+            else:
+                raise ValueError('unknown GRIB edition %s at %s of %s'%(
+                                 ind[7], pos, path))
+
+            yield pos, length, valid
+            pos = _find(f, pos + length)
+
+def read_index(path):
+    """ Returns the message index of a GRIB file as a list of tuples
+
+    The index is read from the sidecar of path if it is newer than path, else
+    the file is scanned and the sidecar is written."""
+
+    idx = path + IDX_SUFFIX
+    if os.path.isfile(idx) and os.path.getmtime(idx) >= os.path.getmtime(path):
+        msgs = []
+        with open(idx, 'r') as f:
+            for line in f:
+                num, offset, length, vt = line.strip().split(':')
+                msgs.append((int(offset), int(length),
+                             dt.strptime(vt[3:], '%Y%m%d%H%M')))
+
+        return msgs
+
+    msgs = list(scan(path))
+    tmp = os.path.join(os.path.dirname(idx), '.' + os.path.basename(idx) +
+                       '.part')
+    with open(tmp, 'w') as f:
+        for i, (offset, length, valid) in enumerate(msgs):
+            f.write('%s:%s:%s:vt=%s\n'%(i + 1, offset, length,
+                                        valid.strftime('%Y%m%d%H%M')))
+
+    os.replace(tmp, idx)
+    return msgs
+
+def windows(msgs, cyc_inc, fcst_hrs=0):
+    """ Groups indexed messages into cycle windows
+
+    Cycle points are the valid times at multiples of cyc_inc hours of the day,
+    each window holds the messages valid from the cycle point to fcst_hrs
+    after it.  Returns a dictionary of the lists of messages by cycle point,
+    in file order."""
+
+    cycles = {}
+    span = timedelta(hours=fcst_hrs)
+    valids = sorted(set([valid for offset, length, valid in msgs]))
+    for cycle in valids:
+        if cycle.minute or (cycle.hour % cyc_inc):
+            continue
+
+        cycles[cycle] = [msg for msg in msgs if cycle <= msg[2] <= cycle + span]
+
+    return cycles
+
+def copy_ranges(src, dst, msgs):
+    # copy the byte ranges of msgs of src to dst atomically with sendfile
+    tmp = os.path.join(os.path.dirname(dst), '.' + os.path.basename(dst) +
+                       '.part')
+    with open(src, 'rb') as fin, open(tmp, 'wb') as fout:
+        for offset, length, valid in msgs:
+            sent = 0
+            while sent < length:
+                n = os.sendfile(fout.fileno(), fin.fileno(), offset + sent,
+                                length - sent)
+                if n == 0:
+                    raise IOError('%s ends within the message at %s'%(src,
+                                  offset))
+
+                sent += n
+
+    os.replace(tmp, dst)
+
+def split_file(path, out_root, cyc_inc, fcst_hrs=0):
+    """ Splits a GRIB file into the cycle windows of its messages
+
+    The messages of each window are written to out_root/YYYYMMDDHH under the
+    name of the file, so that windows spanning several files have a slice of
+    each.  Returns the list of files written."""
+
+    name = os.path.basename(path)
+    outs = []
+    for cycle, msgs in sorted(windows(read_index(path), cyc_inc,
+                                      fcst_hrs).items()):
+        out_dir = os.path.join(out_root, cycle.strftime('%Y%m%d%H'))
+        os.makedirs(out_dir, exist_ok=True)
+        outs.append(os.path.join(out_dir, name))
+        copy_ranges(path, outs[-1], msgs)
+
+    return outs
+
+##################################################################################
+# Split files
+##################################################################################
+if __name__ == '__main__':
+    out_root, cyc_inc, fcst_hrs = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+    for path in sys.argv[4:]:
+        outs = split_file(path, out_root, cyc_inc, fcst_hrs)
+        print('Split %s into %s cycle files'%(path, len(outs)))
+
+##################################################################################
+# end
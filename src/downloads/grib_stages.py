@@ -0,0 +1,231 @@
+##################################################################################
+# Description
+##################################################################################
+# This module runs per-file GRIB transforms as a pipeline stage of the download
+# scripts, so that each file is processed on a pool of processes as soon as it
+# is downloaded, instead of in a serial pass over the full data set afterwards.
+#
+# A stage is a function of a source and a destination path at module level, so
+# that it can be run in a worker process, registered by name in STAGES,
+#
+#     to_grib1  -- convert to GRIB1 without the PV array of the vertical
+#                  coordinate with eccodes, as in pre_process_ERA5.sh, needed
+#                  for ungrib of the model level data
+#     to_simple -- repack to simple packing with eccodes, e.g., the complex
+#                  packing of the GEFS files before crop
+#     crop      -- crop to a lat / lon box with grib_crop.py, given as
+#                  crop:SOUTH/NORTH/WEST/EAST
+#
+# Stages are given as NAME, or as NAME:ARG/... for stages taking further
+# arguments after the source and destination, e.g., crop:30/55/-150/-110.
+# A chain of stages is run on a file with each output written to a hidden
+# temporary file in the same directory, and the final output renamed over the
+# original, or to the original with the suffix '.1' if the original is kept,
+# so that the scratch space in use is about one extra file per worker.  The
+# stages can be run standalone over existing files as
+#
+#     python grib_stages.py STAGE[,STAGE...] FILE [FILE ...]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import time
+import subprocess
+import concurrent.futures
+from grib_crop import crop_file
+from telemetry import OFF
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# suffix of processed files when the original is kept
+SUFFIX = '.1'
+
+def grib_set(src, dst, keys):
+    # set the keys 'key=value,...' of all messages of src with eccodes
+    subprocess.run(['grib_set', '-s', keys, src, dst], check=True,
+                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+def to_grib1(src, dst):
+    # convert to GRIB1 without the PV array for ungrib as pre_process_ERA5.sh
+    grib_set(src, dst, 'deletePV=1,edition=1')
+
+def to_simple(src, dst):
+    # repack all messages to simple packing for crop
+    subprocess.run(['grib_set', '-r', '-s', 'packingType=grid_simple', src,
+                    dst], check=True, stdout=subprocess.PIPE,
+                   stderr=subprocess.STDOUT)
+
+# stages available by name
+STAGES = {
+          'to_grib1' : to_grib1,
+          'to_simple': to_simple,
+          'crop'     : crop_file,
+         }
+
+def parse_stage(spec):
+    # name and arguments of a stage given as NAME or NAME:ARG/...
+    name, sep, args = spec.partition(':')
+    if name not in STAGES:
+        raise ValueError('unknown GRIB stage ' + name)
+
+    return name, args.split('/') if sep else []
+
+def tmp_path(path, i, name):
+    # hidden temporary output of the i-th stage name of the chain for path
+    head, tail = os.path.split(path)
+    return os.path.join(head, '.%s.%s.%s.part'%(tail, i, name))
+
+def run_chain(path, names, keep=False, post=None):
+    """ Runs the chain of stages names on the file path
+
+    Each stage writes to a hidden temporary file, the intermediate output of
+    the previous stage is removed once the next stage is done.  The final
+    output replaces path, or is written to path + SUFFIX if keep is True.  If
+    post is given, post(output) is called on the final output, e.g., to split
+    it with grib_split.split_file.  Returns the path and size of the output."""
+
+    if not names:
+        if post is not None:
+            post(path)
+
+        return path, os.path.getsize(path)
+
+    src = path
+    dst = path
+    try:
+        for i, spec in enumerate(names):
+            name, args = parse_stage(spec)
+            dst = tmp_path(path, i, name)
+            STAGES[name](src, dst, *args)
+            if src != path:
+                os.remove(src)
+
+            src = dst
+
+    except BaseException:
+        # intermediate outputs, including the part written by a failed stage
+        for tmp in set([src, dst]) - set([path]):
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+
+        raise
+
+    out = path + SUFFIX if keep else path
+    os.replace(src, out)
+    if post is not None:
+        post(out)
+
+    return out, os.path.getsize(out)
+
+class StagePool:
+    """ Pool of processes running a chain of stages on downloaded files
+
+    names is the list of stages in STAGES, run in order with run_chain on
+    every file submitted, on up to n_procs processes.  done is called in the
+    submitting process with the path, output path and size of each file
+    processed, and failures are collected in failed.  post is passed to
+    run_chain and must be picklable, e.g., a functools.partial of a function
+    at module level.  Each file is recorded as a process event of telemetry,
+    timed from its submission, see telemetry.py."""
+
+    def __init__(self, names, n_procs=4, keep=False, done=None, post=None,
+                 telemetry=None):
+        for name in names:
+            parse_stage(name)
+
+        self.names = list(names)
+        self.keep = keep
+        self.post = post
+        self.done = done
+        self.telemetry = telemetry or OFF
+        self.failed = []
+        self.futures = []
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=n_procs)
+
+    def submit(self, path):
+        # queue a file for processing, safe to call from download threads
+        future = self.pool.submit(run_chain, path, self.names, self.keep,
+                                  self.post)
+        t0 = time.monotonic()
+        future.add_done_callback(lambda f: self._finish(path, f, t0))
+        self.futures.append(future)
+        return future
+
+    def _finish(self, path, future, t0):
+        secs = round(time.monotonic() - t0, 6)
+        err = future.exception()
+        if err is not None:
+            print('Processing %s failed: %s'%(path, err))
+            self.telemetry.event('process', path=path, process_s=secs,
+                                 status='failed', error=str(err))
+            self.failed.append((path, err))
+            return
+
+        out, size = future.result()
+        self.telemetry.event('process', path=path, out=out, bytes=size,
+                             process_s=secs)
+        print('Processed %s with %s'%(out, ','.join(self.names +
+                                                     (['post'] if self.post
+                                                      else []))))
+        if self.done is not None:
+            self.done(path, out, size)
+
+    def close(self):
+        # waits for all files submitted, returning the list of failures
+        self.pool.shutdown(wait=True)
+        return self.failed
+
+##################################################################################
+# Process files
+##################################################################################
+if __name__ == '__main__':
+    names = sys.argv[1].split(',')
+    pool = StagePool(names, keep=True)
+    for path in sys.argv[2:]:
+        pool.submit(path)
+
+    failed = pool.close()
+    sys.exit(1 if failed else 0)
+
+##################################################################################
+# end
@@ -0,0 +1,225 @@
+##################################################################################
+# Description
+##################################################################################
+# This module maintains a persistent manifest of the objects downloaded into a
+# date stamped directory, for incremental syncs of bucket data.  The manifest is
+# a JSON file MANIFEST in the download directory mapping each object key to
+#
+#     {'size': remote size, 'etag': remote ETag, 'path': local path}
+#
+# A fresh listing of the bucket is compared against the manifest, so that only
+# new or changed objects are downloaded.  Checking an object is a dictionary
+# lookup and a set lookup against a single read of the directory, so that the
+# cost of resuming does not grow with the number of files already on disk.
+#
+# Files are verified with check_file before they are recorded, and the size of
+# the file on disk is kept as 'local_size', which differs from the remote size
+# for subset files.  The verify_tree method audits the manifests of an existing
+# tree, checking many files concurrently, and reports files on disk without a
+# manifest entry.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import re
+import json
+import fcntl
+import hashlib
+import concurrent.futures
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# file name of the manifest in each download directory
+MANIFEST = '.manifest.json'
+
+def read_manifest(down_dir):
+    """ Reads the manifest of down_dir, returning an empty manifest if none """
+
+    path = os.path.join(down_dir, MANIFEST)
+    if not os.path.isfile(path):
+        return {}
+
+    with open(path, 'r') as f:
+        return json.load(f)['objects']
+
+def write_manifest(down_dir, manifest, replace=False):
+    """ Writes the manifest of down_dir atomically
+
+    Concurrent runs over the same directory are serialized with a lock file,
+    and entries written by other runs since the manifest was read are merged
+    with the entries of manifest, which take precedence.  If replace is True,
+    manifest replaces the manifest on disk, so that entries removed from it
+    stay removed."""
+
+    path = os.path.join(down_dir, MANIFEST)
+    with open(path + '.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        except OSError:
+            # file systems mounted without lock support
+            pass
+
+        merged = {} if replace else read_manifest(down_dir)
+        merged.update(manifest)
+        tmp = path + '.%s'%os.getpid()
+        with open(tmp, 'w') as f:
+            json.dump({'version': 1, 'objects': merged}, f, indent=1,
+                      sort_keys=True)
+
+        os.replace(tmp, path)
+
+def is_current(manifest, obj, local):
+    """ Determines if a listed object is already downloaded
+
+    obj is a listing entry with 'key', 'size' and 'etag', local is the set of
+    file names in the download directory.  The object is current if the
+    manifest entry has the same size and ETag and its file is present, a
+    symbolic link to an evicted cache entry counting as absent.  For keys
+    resolved without a listing, size and ETag are None and only the presence
+    of the file is checked."""
+
+    entry = manifest.get(obj['key'])
+    if entry is None or os.path.basename(entry['path']) not in local or\
+            not os.path.isfile(entry['path']):
+        return False
+
+    if obj['size'] is None:
+        return True
+
+    return entry['size'] == obj['size'] and entry['etag'] == obj['etag']
+
+def record(manifest, obj, path):
+    # add or update the manifest entry of a downloaded and verified object
+    manifest[obj['key']] = {
+                            'size'      : obj['size'],
+                            'etag'      : obj['etag'],
+                            'path'      : path,
+                            'local_size': os.path.getsize(path),
+                           }
+
+def check_file(path, size=None, etag=None, checksum=False):
+    """ Checks the integrity of a downloaded GRIB file
+
+    The file must exist, have size bytes if size is not None and end with the
+    GRIB end section '7777'.  If checksum is True and etag is the MD5 digest of
+    a single part upload, the MD5 of the file is compared against it.  Returns
+    None for a valid file, else a string describing the problem."""
+
+    if not os.path.isfile(path):
+        return 'missing'
+
+    local = os.path.getsize(path)
+    if size is not None and local != size:
+        return 'size %s, expected %s'%(local, size)
+
+    with open(path, 'rb') as f:
+        if local < 4:
+            return 'truncated'
+
+        f.seek(-4, 2)
+        if f.read(4) != b'7777':
+            return 'truncated GRIB message'
+
+        if checksum and etag and re.fullmatch('[0-9a-f]{32}', etag):
+            md5 = hashlib.md5()
+            f.seek(0)
+            for buf in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(buf)
+
+            if md5.hexdigest() != etag:
+                return 'MD5 does not match ETag'
+
+    return None
+
+def check_entry(entry, checksum=False):
+    # check the file of a manifest entry against its recorded size / ETag
+    size = entry.get('local_size', entry['size'])
+    full = size == entry['size']
+    return check_file(entry['path'], size, entry['etag'] if full else None,
+                      checksum=checksum)
+
+def verify_tree(data_root, n_workers=16, checksum=False):
+    """ Audits the manifests of all date directories under data_root
+
+    Files are checked concurrently with check_entry on a pool of n_workers
+    threads.  Entries of files failing the check are removed from their
+    manifest, so that they are downloaded again by the next incremental sync,
+    and files in a date directory without a manifest entry are reported as
+    untracked, hidden files such as the manifest itself excepted.  Returns a
+    dictionary of the failing and untracked paths and their problems."""
+
+    bad = {}
+    dirs = sorted([entry.path for entry in os.scandir(data_root)
+                   if entry.is_dir()])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for down_dir in dirs:
+            manifest = read_manifest(down_dir)
+            tracked = set([os.path.basename(entry['path'])
+                           for entry in manifest.values()])
+            futs = {pool.submit(check_entry, manifest[key], checksum): key
+                    for key in manifest}
+            n_bad = 0
+            for fut in concurrent.futures.as_completed(futs):
+                key = futs[fut]
+                if fut.result() is not None:
+                    bad[manifest[key]['path']] = fut.result()
+                    del manifest[key]
+                    n_bad += 1
+
+            if n_bad:
+                write_manifest(down_dir, manifest, replace=True)
+
+            untracked = [entry.path for entry in os.scandir(down_dir)
+                         if entry.is_file() and not entry.name.startswith('.')
+                         and entry.name not in tracked]
+            for path in untracked:
+                bad[path] = 'untracked, no manifest entry'
+
+            print(down_dir + ': %s files checked, %s failed, %s untracked'%(
+                  len(futs), n_bad, len(untracked)))
+
+    return bad
+
+##################################################################################
+# end
@@ -0,0 +1,199 @@
+##################################################################################
+# Description
+##################################################################################
+# This module reports the pre-flight estimate of a download run, the number of
+# objects and bytes planned, the part already present under DATA_ROOT, the
+# bytes left to transfer and the growth of the tree, and checks that the growth
+# fits on the file system.  The download scripts build the totals, from a
+# listing of each zero hour for GEFS or the size model of era5_plan.py for
+# ERA5, and the wall time is projected from the throughput of the earlier runs
+# recorded in the telemetry log of DATA_ROOT, see telemetry.py.  The throughput
+# of the runs in a log is printed with
+#
+#     python preflight.py LOG [EVENT]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import json
+import shutil
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# free space in GB to be left on the file system of DATA_ROOT after a run
+MIN_FREE_GB = 50
+
+def totals():
+    # empty totals of a plan, filled by the download scripts
+    return {
+            'objects'       : 0,
+            'bytes'         : 0,
+            'present'       : 0,
+            'present_bytes' : 0,
+            'transfer'      : 0,
+            'transfer_bytes': 0,
+            'growth_bytes'  : 0,
+            'missing'       : 0,
+           }
+
+def add(plan, size, present=False, transfer=True, resume=0, local=0):
+    """ Adds an object of size bytes to the totals of plan
+
+    present is True if the object is current under DATA_ROOT, and transfer
+    False if it is kept rather than downloaded again.  resume is the size of a
+    partial download to be resumed, and local the size of an existing file to
+    be replaced.  A size of None counts the object as missing from the
+    source."""
+
+    if size is None:
+        plan['missing'] += 1
+        return
+
+    plan['objects'] += 1
+    plan['bytes'] += size
+    if present:
+        plan['present'] += 1
+        plan['present_bytes'] += size
+
+    if transfer:
+        plan['transfer'] += 1
+        plan['transfer_bytes'] += size - resume
+        plan['growth_bytes'] += max(0, size - resume - local)
+
+def past_rate(log, event):
+    """ Throughput in bytes / s of the earlier runs recorded in log
+
+    The bytes of the events of name event are summed over the runs of the log
+    and divided by the wall time of the runs, from the summary event closing
+    each run or the span of the events of a run left without one.  Runs which
+    transferred nothing are skipped.  Returns the rate and the number of runs,
+    (None, 0) without a log or earlier transfers."""
+
+    if not log or not os.path.isfile(log):
+        return None, 0
+
+    runs = []
+    run = None
+    with open(log) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # line cut by an interrupted run
+                continue
+
+            if run is None:
+                run = {'bytes': 0, 'first': rec['ts'], 'last': rec['ts'],
+                       'wall': None}
+                runs.append(run)
+
+            run['last'] = rec['ts']
+            if rec['event'] == event and isinstance(rec.get('bytes'), int):
+                run['bytes'] += rec['bytes']
+            elif rec['event'] == 'summary':
+                run['wall'] = rec['wall_s']
+                run = None
+
+    runs = [run for run in runs if run['bytes']]
+    wall = sum([run['wall'] or run['last'] - run['first'] for run in runs])
+    if not runs or wall <= 0:
+        return None, 0
+
+    return sum([run['bytes'] for run in runs]) / wall, len(runs)
+
+def free_bytes(path):
+    # free bytes on the file system of path, or of its closest existing parent
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+
+    return shutil.disk_usage(path).free
+
+def report(plan, data_root, log=None, event='object', min_free_gb=MIN_FREE_GB):
+    """ Prints the estimate of plan and checks that it fits under data_root
+
+    The wall time is projected from the throughput of the events event of the
+    earlier runs in the telemetry log.  Returns True if the growth of the tree
+    leaves at least min_free_gb free, else False."""
+
+    rate, n_runs = past_rate(log, event)
+    free = free_bytes(data_root)
+    print('%-24s %10s %12s'%('', 'objects', 'size (GB)'))
+    for name, n_key, b_key in [('planned', 'objects', 'bytes'),
+                               ('present', 'present', 'present_bytes'),
+                               ('to transfer', 'transfer', 'transfer_bytes')]:
+        print('%-24s %10s %12.2f'%(name, plan[n_key], plan[b_key] / 1e9))
+
+    if plan['missing']:
+        print('%-24s %10s'%('missing from source', plan['missing']))
+
+    print('%-24s %23.2f'%('growth of DATA_ROOT', plan['growth_bytes'] / 1e9))
+    print('%-24s %23.2f'%('free space', free / 1e9))
+    if rate is None:
+        print('Projected wall time unknown, no earlier transfers in %s'%log)
+    else:
+        print('Projected wall time %.2f h at %.1f MB/s measured over %s '
+              'earlier runs'%(plan['transfer_bytes'] / rate / 3600, rate / 1e6,
+                              n_runs))
+
+    if free - plan['growth_bytes'] < min_free_gb * 1e9:
+        print('REFUSED: the run would leave %.2f GB free of the %.2f GB '
+              'required at %s'%((free - plan['growth_bytes']) / 1e9,
+                                min_free_gb, data_root))
+        return False
+
+    return True
+
+##################################################################################
+# Report throughput
+##################################################################################
+if __name__ == '__main__':
+    rate, n_runs = past_rate(sys.argv[1], sys.argv[2] if len(sys.argv) > 2
+                             else 'object')
+    if rate is None:
+        print('No transfers in ' + sys.argv[1])
+    else:
+        print('%.1f MB/s over %s runs'%(rate / 1e6, n_runs))
+
+##################################################################################
+# end
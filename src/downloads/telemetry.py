@@ -0,0 +1,346 @@
+##################################################################################
+# Description
+##################################################################################
+# This module records structured events of the transfers of the download
+# scripts, so that the time spent listing, queued at CDS, transferring and
+# processing can be measured instead of read off the printed messages.  Each
+# event is a single JSON line appended to a log, e.g., for a GEFS object
+#
+#     {"ts": 1611619200.0, "job": "gefs", "event": "object",
+#      "key": "gefs.20210126/00/...", "bytes": 52345678, "retries": 0,
+#      "queue_s": 0.01, "transfer_s": 2.31, "elapsed_s": 2.35,
+#      "bytes_per_s": 22660466.7, "status": "ok"}
+#
+# Numeric fields ending in _s other than the throughput bytes_per_s are
+# durations in seconds, summed by phase over all events of the same name
+# together with the bytes, retries and failures, and written as a final
+# summary event when the log is closed.  With a Prometheus textfile given, the
+# same totals are written atomically to it for the node exporter textfile
+# collector, at most every PROM_INT seconds while the download runs and once
+# when the log is closed.
+#
+# Credentials are never written: fields named like a secret are masked, and
+# CDS 'UID:KEY' credentials and Authorization headers within any string are
+# redacted to the UID as cds_api.redact.  The summary of an existing log can
+# be printed and written to a textfile as
+#
+#     python telemetry.py LOG [PROM_FILE]
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import re
+import json
+import time
+import threading
+import contextlib
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# minimum interval in seconds between writes of the Prometheus textfile
+PROM_INT = 30
+
+# prefix of the Prometheus metrics
+PROM_PREFIX = 'grib_download'
+
+# names of fields which are masked entirely
+SECRETS = ['auth', 'auths', 'authorization', 'credentials', 'password',
+           'secret', 'token']
+
+# CDS 'UID:KEY' credentials and Authorization header values within strings
+CREDENTIAL = re.compile(r'\b([\w.-]+):[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-'
+                        r'[0-9a-fA-F]{12}\b')
+AUTH_HEADER = re.compile(r'\b(Basic|Bearer)\s+[\w+/=.-]+')
+
+def scrub(val):
+    # redacts the credentials in a value of an event
+    if isinstance(val, bytes):
+        val = val.decode('ascii', 'replace')
+
+    if isinstance(val, str):
+        val = CREDENTIAL.sub(r'\1:****', val)
+        return AUTH_HEADER.sub(r'\1 ****', val)
+
+    if isinstance(val, (list, tuple)):
+        return [scrub(item) for item in val]
+
+    if isinstance(val, dict):
+        return dict([(key, '****' if key.lower() in SECRETS else scrub(item))
+                     for key, item in val.items()])
+
+    return val
+
+def _label(val):
+    # escapes a Prometheus label value
+    return str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n',
+                                                                      '\\n')
+
+class Telemetry:
+    """ Thread safe recorder of the transfer events of a download
+
+    Events are appended to the JSON lines log at path if given, and their
+    totals are written to the Prometheus textfile prom if given, labelled
+    with job.  A recorder with enabled False ignores all events, see OFF."""
+
+    def __init__(self, path=None, prom=None, job='download', enabled=True):
+        self.path = path
+        self.prom = prom
+        self.job = job
+        self.enabled = enabled
+        self.start = time.time()
+        self.totals = {}
+        self.written = 0
+        self.lock = threading.Lock()
+        self.log = None
+        if enabled and path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.log = open(path, 'a')
+
+    def event(self, name, **fields):
+        """ Records an event name with fields
+
+        Credentials are redacted from the fields with scrub.  Events with bytes
+        and transfer_s are given their throughput as bytes_per_s, and events
+        without a status are recorded as ok.  Returns the recorded event."""
+
+        if not self.enabled:
+            return fields
+
+        rec = {'ts': round(time.time(), 3), 'job': self.job, 'event': name}
+        rec.update(scrub(fields))
+        rec.setdefault('status', 'ok')
+        if rec.get('bytes') and rec.get('transfer_s'):
+            rec['bytes_per_s'] = round(rec['bytes'] / rec['transfer_s'], 1)
+
+        with self.lock:
+            self._add(rec)
+            if self.log is not None:
+                self.log.write(json.dumps(rec) + '\n')
+                self.log.flush()
+
+            if self.prom and time.time() - self.written > PROM_INT:
+                self.write_prom()
+
+        return rec
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        """ Records an event name timing the enclosed block
+
+        Yields the dictionary of fields, to which further fields are added in
+        the block.  The duration of the block is recorded as elapsed_s, and an
+        exception raised in the block as status failed with its message before
+        it is raised again."""
+
+        t0 = time.monotonic()
+        try:
+            yield fields
+
+        except BaseException as err:
+            fields['status'] = 'failed'
+            fields['error'] = str(err) or type(err).__name__
+            raise
+
+        finally:
+            fields['elapsed_s'] = round(time.monotonic() - t0, 6)
+            self.event(name, **fields)
+
+    def _add(self, rec):
+        # adds an event to the totals of its name
+        tot = self.totals.setdefault(rec['event'], {'count': 0, 'failed': 0,
+                                                    'bytes': 0, 'retries': 0,
+                                                    'seconds': {}})
+        tot['count'] += 1
+        tot['failed'] += rec['status'] != 'ok'
+        for field in ['bytes', 'retries']:
+            if isinstance(rec.get(field), (int, float)):
+                tot[field] += rec[field]
+
+        for field, val in rec.items():
+            if field.endswith('_s') and field != 'bytes_per_s' and\
+                    isinstance(val, (int, float)):
+                phase = field[:-2]
+                tot['seconds'][phase] = tot['seconds'].get(phase, 0) + val
+
+    def summary(self):
+        """ Totals of the events recorded so far by name
+
+        Each name has the count of events, failures, bytes, retries and the
+        seconds summed by phase, with the throughput over the transfer time as
+        bytes_per_s where both are recorded."""
+
+        summ = {}
+        for name, tot in self.totals.items():
+            summ[name] = dict(tot, seconds=dict(tot['seconds']))
+            if tot['bytes'] and tot['seconds'].get('transfer'):
+                summ[name]['bytes_per_s'] = round(tot['bytes'] /
+                                                  tot['seconds']['transfer'], 1)
+
+        return summ
+
+    def write_prom(self, path=None):
+        # writes the totals to a Prometheus textfile atomically
+        path = path or self.prom
+        job = 'job="%s"'%_label(self.job)
+        # metric, type, help and field of the totals of each event name
+        metrics = [
+                   ('events_total', 'counter', 'Events recorded by name',
+                    'count'),
+                   ('failed_total', 'counter', 'Failed events by name',
+                    'failed'),
+                   ('bytes_total', 'counter', 'Bytes transferred by event',
+                    'bytes'),
+                   ('retries_total', 'counter', 'Retries by event', 'retries'),
+                   ('seconds_total', 'counter', 'Seconds by event and phase',
+                    'seconds'),
+                   ('bytes_per_second', 'gauge',
+                    'Throughput over the transfer time by event',
+                    'bytes_per_s'),
+                  ]
+        summ = self.summary()
+        lines = []
+        for metric, kind, desc, field in metrics:
+            name = PROM_PREFIX + '_' + metric
+            lines += ['# HELP %s %s'%(name, desc), '# TYPE %s %s'%(name, kind)]
+            for event in sorted(summ):
+                lbl = job + ',event="%s"'%_label(event)
+                val = summ[event].get(field)
+                if field == 'seconds':
+                    for phase in sorted(val):
+                        lines.append('%s{%s,phase="%s"} %s'%(name, lbl,
+                                     _label(phase), val[phase]))
+                elif val is not None:
+                    lines.append('%s{%s} %s'%(name, lbl, val))
+
+        lines += ['# HELP %s_run_seconds Seconds since the download '
+                  'started'%PROM_PREFIX,
+                  '# TYPE %s_run_seconds gauge'%PROM_PREFIX,
+                  '%s_run_seconds{%s} %s'%(PROM_PREFIX, job,
+                                           round(time.time() - self.start, 3)),
+                  '# HELP %s_last_update_timestamp_seconds Time of the last '
+                  'update'%PROM_PREFIX,
+                  '# TYPE %s_last_update_timestamp_seconds gauge'%PROM_PREFIX,
+                  '%s_last_update_timestamp_seconds{%s} %s'%(
+                  PROM_PREFIX, job, round(time.time(), 3))]
+
+        head, tail = os.path.split(os.path.abspath(path))
+        tmp = os.path.join(head, '.' + tail + '.part')
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        os.replace(tmp, path)
+        self.written = time.time()
+
+    def close(self):
+        """ Writes the summary event and the Prometheus textfile
+
+        Returns the summary, with the wall time of the download as wall_s."""
+
+        if not self.enabled:
+            return {}
+
+        summ = self.summary()
+        with self.lock:
+            if self.log is not None:
+                self.log.write(json.dumps({'ts': round(time.time(), 3),
+                                           'job': self.job,
+                                           'event': 'summary',
+                                           'wall_s': round(time.time() -
+                                                           self.start, 3),
+                                           'events': summ}) + '\n')
+                self.log.close()
+                self.log = None
+
+            if self.prom:
+                self.write_prom()
+
+        return dict(summ, wall_s=round(time.time() - self.start, 3))
+
+    def report(self):
+        # prints the totals of each event name
+        print('%-10s %8s %8s %8s %12s %10s %s'%('event', 'count', 'failed',
+              'retries', 'MB', 'MB/s', 'seconds by phase'))
+        for name, tot in sorted(self.summary().items()):
+            print('%-10s %8s %8s %8s %12.1f %10s %s'%(name, tot['count'],
+                  tot['failed'], tot['retries'], tot['bytes'] / 1e6,
+                  '%.1f'%(tot['bytes_per_s'] / 1e6) if 'bytes_per_s' in tot
+                  else '-', ' '.join(['%s=%.1f'%(phase, secs) for phase, secs
+                                      in sorted(tot['seconds'].items())])))
+
+def load(path, prom=None):
+    # recorder with the totals of the last run in an existing log
+    tel = None
+    ended = True
+    with open(path) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # line cut by an interrupted run
+                continue
+
+            if ended:
+                # totals of the last run appended to the log
+                tel = Telemetry(prom=prom, job=rec.get('job', 'download'))
+                tel.start = rec['ts']
+
+            ended = rec['event'] == 'summary'
+            if not ended:
+                tel._add(rec)
+
+    return tel or Telemetry(prom=prom)
+
+# recorder ignoring all events, the default of the download functions
+OFF = Telemetry(enabled=False)
+
+##################################################################################
+# Report log
+##################################################################################
+if __name__ == '__main__':
+    tel = load(sys.argv[1], prom=sys.argv[2] if len(sys.argv) > 2 else None)
+    tel.report()
+    if tel.prom:
+        tel.write_prom()
+
+##################################################################################
+# end
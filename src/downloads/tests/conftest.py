@@ -0,0 +1,94 @@
+##################################################################################
+# Description
+##################################################################################
+# Shared fixtures of the tests of the download scripts.  The modules of the
+# scripts and the stand-in services of the benchmarks are put on the path, and
+# synthetic GEFS buckets are served by fake_s3.py.  Run the tests from the
+# downloads directory as
+#
+#     python -m pytest -q tests
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os, sys
+import contextlib
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TESTS, '..'))
+from fake_s3 import start_server, make_gefs_bucket
+
+##################################################################################
+# FIXTURES
+##################################################################################
+
+@pytest.fixture
+def quiet():
+    # call a function without its messages, returning its result
+    def call(func, *args, **kwargs):
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            return func(*args, **kwargs)
+
+    return call
+
+@pytest.fixture
+def gefs_bucket(tmp_path):
+    """ Serves synthetic GEFS buckets, shut down at the end of the test
+
+    Returns a function of the zero hours and forecast hours, with the keyword
+    arguments of make_gefs_bucket, returning the server and the member keys."""
+
+    servers = []
+    def serve(dates, fhrs, **kwargs):
+        root = os.path.join(str(tmp_path), 'bucket%s'%len(servers))
+        kwargs.setdefault('msg_size', 1024)
+        keys = make_gefs_bucket(root, dates, fhrs, **kwargs)
+        servers.append(start_server(root))
+        return servers[-1], keys
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+
+##################################################################################
+# end
@@ -0,0 +1,144 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the downloads of CDS results in cds_api.py against the local
+# stand-in of fake_cds.py.  Results must be written byte for byte over a
+# single connection and over concurrent byte ranges, with ranges cut half way
+# through retried from the last byte written, with a server which ignores
+# Range requests, and when a range is answered with other bytes than asked.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import hashlib
+
+import pytest
+
+import cds_api
+from cds_api import CDSClient
+from fake_cds import start_server
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def fetch(path, n_conns, **kwargs):
+    """ Downloads the result of a task over n_conns connections
+
+    Returns the number of bytes written, the MD5 of the result served and the
+    statistics of the server started with kwargs."""
+
+    server = start_server(queue_s=0, run_s=0, result_size=1024 * 1024,
+                          **kwargs)
+    try:
+        client = CDSClient('1000:secret', url=server.api)
+        reply = client.wait(client.submit('reanalysis-era5-complete', {}))
+        data = server.data(server.tasks[reply['request_id']])
+        nbytes = client.download(reply['location'], path, n_conns=n_conns,
+                                 range_size=128 * 1024)
+
+    finally:
+        server.shutdown()
+
+    return nbytes, hashlib.md5(data).hexdigest(), server.stats
+
+def md5(path):
+    # MD5 digest of a local file
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+class Response:
+    # stand-in of an http.client response with a Content-Range
+    def __init__(self, crange, body):
+        self.crange = crange
+        self.body = body
+
+    def getheader(self, name, default=None):
+        return self.crange
+
+    def read(self, size=-1):
+        size = len(self.body) if size < 0 else size
+        buf, self.body = self.body[:size], self.body[size:]
+        return buf
+
+##################################################################################
+# TESTS
+##################################################################################
+
+@pytest.mark.parametrize('n_conns, kwargs', [(1, {}), (4, {}),
+                                             (4, {'drops': 3}),
+                                             (4, {'ranges': False})])
+def test_download(n_conns, kwargs, tmp_path, quiet):
+    # whole results over ranges, retried ranges and a single stream
+    path = str(tmp_path / 'result.grib')
+    nbytes, digest, stats = quiet(fetch, path, n_conns, **kwargs)
+    assert nbytes == os.path.getsize(path) == 1024 * 1024
+    assert md5(path) == digest
+    assert stats['dropped'] == kwargs.get('drops', 0)
+
+def test_unexpected_range_retried(tmp_path, quiet, monkeypatch):
+    # a response for other bytes than requested is retried
+    monkeypatch.setattr(cds_api.time, 'sleep', lambda sec: None)
+    client = CDSClient('1000:secret', url='http://127.0.0.1:1')
+    ranges = []
+    def request(method, location, ok=None, headers=None):
+        ranges.append(headers['Range'])
+        if len(ranges) == 1:
+            return Response('bytes 5-9/10', b'56789')
+
+        return Response('bytes 0-9/10', b'0123456789')
+
+    monkeypatch.setattr(client, '_request', request)
+    monkeypatch.setattr(client, '_conn', lambda *args, **kwargs: None)
+    path = str(tmp_path / 'result.grib')
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    try:
+        assert quiet(client._get_range, 'http://127.0.0.1:1/r', fd, 0, 9) == 10
+
+    finally:
+        os.close(fd)
+
+    assert ranges == ['bytes=0-9', 'bytes=0-9']
+    with open(path, 'rb') as f:
+        assert f.read() == b'0123456789'
+
+##################################################################################
+# end
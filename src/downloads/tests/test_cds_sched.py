@@ -0,0 +1,148 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the multi-account scheduler of cds_sched.py against the CDS task
+# API of fake_cds.py, with stub jobs recording the account of each request.
+# Every request must be run without exceeding the slots of an account,
+# counting tasks submitted elsewhere, and a request throttled on one account
+# must be taken by another while the first is backed off.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import threading
+import time
+
+import cds_sched
+from cds_api import CDSError
+from fake_cds import start_server
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+AUTHS = ['1:secret', '2:secret']
+
+class Jobs:
+    # stub job recording the account and the jobs in flight of each account,
+    # throttling the first run of the requests in throttled
+    def __init__(self, run_s=0.05, throttled=()):
+        self.run_s = run_s
+        self.throttled = set(throttled)
+        self.lock = threading.Lock()
+        self.runs = []
+        self.inflight = {}
+        self.max_inflight = {}
+
+    def __call__(self, client, req):
+        with self.lock:
+            self.runs.append((client.uid, req))
+            n = self.inflight[client.uid] = self.inflight.get(client.uid,
+                                                              0) + 1
+            self.max_inflight[client.uid] = max(n, self.max_inflight.get(
+                                                client.uid, 0))
+            throttled = req in self.throttled
+            self.throttled.discard(req)
+
+        try:
+            if throttled:
+                raise CDSError(429, 'busy', 'url')
+
+            time.sleep(self.run_s)
+
+        finally:
+            with self.lock:
+                self.inflight[client.uid] -= 1
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_slots_of_accounts(quiet):
+    # every request is run without exceeding the slots of an account
+    server = start_server()
+    jobs = Jobs()
+    try:
+        done, failed = quiet(cds_sched.run_jobs, AUTHS, list(range(20)), jobs,
+                             max_jobs=3, url=server.api, poll_int=1)
+
+    finally:
+        server.shutdown()
+
+    assert sorted(done) == list(range(20)) and not failed
+    assert set(jobs.max_inflight) == {'1', '2'}
+    assert max(jobs.max_inflight.values()) <= 3
+
+def test_external_jobs(quiet):
+    # tasks submitted elsewhere take slots of their account
+    server = start_server(queue_s=30, run_s=30)
+    jobs = Jobs()
+    try:
+        ext = cds_sched.CDSClient(AUTHS[0], url=server.api)
+        for i in range(3):
+            ext.submit('external', {})
+
+        done, failed = quiet(cds_sched.run_jobs, AUTHS, list(range(6)), jobs,
+                             max_jobs=3, url=server.api, poll_int=1)
+
+    finally:
+        server.shutdown()
+
+    assert sorted(done) == list(range(6)) and not failed
+    assert set([uid for uid, req in jobs.runs]) == {'2'}
+
+def test_throttled_request_requeued(quiet):
+    # a throttled request is taken by the account which is not backed off
+    server = start_server()
+    jobs = Jobs(throttled=[0])
+    try:
+        done, failed = quiet(cds_sched.run_jobs, AUTHS, list(range(8)), jobs,
+                             max_jobs=2, url=server.api, poll_int=1,
+                             backoff_min=60)
+
+    finally:
+        server.shutdown()
+
+    assert sorted(done) == list(range(8)) and not failed
+    runs = [uid for uid, req in jobs.runs if req == 0]
+    assert len(runs) == 2 and runs[0] != runs[1]
+
+##################################################################################
+# end
@@ -0,0 +1,133 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of download_ERA5.py run through its main function against the CDS
+# task API of fake_cds.py.  Every daily request must be downloaded, and a
+# rerun after an interruption must reattach to the jobs recorded in the ledger
+# rather than submit them again.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+from datetime import date
+from datetime import timedelta
+
+import pytest
+
+import download_ERA5 as era5
+from cds_api import CDSClient
+from era5_ledger import Ledger
+import fake_cds
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+N_DAYS = 4
+
+def data_files(root):
+    # data files of root, without hidden files
+    return [fname for fname in os.listdir(root) if not fname.startswith('.')]
+
+def main(server, root, *extra):
+    # run the ERA5 script for N_DAYS daily requests against the stand-in
+    return era5.main(['surf_levels', '--start', '2019-02-01', '--stop',
+                      '2019-02-%02d'%N_DAYS, '--data-root', root, '--url',
+                      server.api] + list(extra))
+
+@pytest.fixture
+def server(monkeypatch):
+    # CDS stand-in with two accounts of the script
+    monkeypatch.setattr(era5, 'AUTHS',
+                        [b'1001:00000001-0000-0000-0000-000000000001',
+                         b'1002:00000002-0000-0000-0000-000000000002'])
+    monkeypatch.setattr(era5, 'DT_INT', 1)
+    monkeypatch.setattr(era5, 'N_CONNS', 2)
+    for name in ['CALL', 'DATA_ROOT', 'MAX_JOBS']:
+        monkeypatch.setattr(era5, name, getattr(era5, name))
+
+    server = fake_cds.start_server(queue_s=0.2, run_s=0.3,
+                                   result_size=256 * 1024)
+    yield server
+    server.shutdown()
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_download(server, tmp_path, quiet):
+    root = str(tmp_path / 'era5')
+    assert quiet(main, server, root) == 0
+    assert len(data_files(root)) == N_DAYS
+    assert server.stats['submit'] == N_DAYS
+
+def test_resume_reattaches(server, tmp_path, quiet):
+    # jobs left at CDS by an interrupted run are not submitted again
+    root = str(tmp_path / 'era5')
+    era5.CALL = 'surf_levels'
+    era5.DATA_ROOT = root + '/'
+    os.makedirs(root)
+    strt = date(2019, 2, 1)
+    reqs, sizes = era5.plan_reqs(strt, strt + timedelta(days=N_DAYS - 1),
+                                 era5.get_hours(),
+                                 len(era5.AUTHS) * era5.MAX_JOBS)
+    ledger = Ledger(os.path.join(root, era5.LEDGER))
+    ledger.plan(era5.CALL, reqs, sizes)
+    client = CDSClient(era5.AUTHS[0], url=server.api)
+    for req in reqs[::2]:
+        call = era5.get_call(era5.CALL, req[1], req[2], req[3])
+        name = [*call][0]
+        reply = client.submit(name, call[name])
+        ledger.update(req[4], state='submitted', request_id=reply['request_id'],
+                      account=client.uid)
+
+    ledger.close()
+    n_left = server.stats['submit']
+    server.reset()
+    assert quiet(main, server, root) == 0
+    assert len(data_files(root)) == N_DAYS
+    assert server.stats['submit'] == len(reqs) - n_left
+
+    # the pre-flight of the completed range is not refused
+    assert quiet(main, server, root, '--plan') == 0
+
+##################################################################################
+# end
@@ -0,0 +1,165 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of download_GEFS_AWS.py run through its main function against a
+# synthetic GEFS bucket served by fake_s3.py.  A rerun after an interruption
+# must transfer no more than the partial files, the pre-flight estimate must
+# match the bytes downloaded with and without listing and the files removed
+# from a tree, and a run short of free space must be refused.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import concurrent.futures
+from datetime import datetime as dt
+
+import pytest
+
+import download_GEFS_AWS as gefs
+import manifest as mfst
+import preflight
+from aws_s3 import S3Client
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+DATE = dt(2021, 1, 26, 0)
+
+def data_files(root):
+    # sizes of the data files under root, without hidden files
+    sizes = {}
+    for head, dirs, files in os.walk(root):
+        for fname in files:
+            if not fname.startswith('.'):
+                path = os.path.join(head, fname)
+                sizes[path] = os.path.getsize(path)
+
+    return sizes
+
+def main(server, root, *extra):
+    # run the GEFS script for the zero hour against the stand-in
+    return gefs.main(['--start', DATE.isoformat(), '--stop', DATE.isoformat(),
+                      '--data-root', root, '--endpoint-url', server.url,
+                      '--workers', '4'] + list(extra))
+
+def get_preflight(server, data_root):
+    # pre-flight estimate of the zero hour against data_root
+    client = S3Client(gefs.BUCKET, endpoint_url=server.url)
+    dates, fcsts = gefs.fcst_dt_hr(DATE, DATE, gefs.INIT_INT, gefs.FCST_MIN,
+                                   gefs.FCST_MAX, gefs.FCST_INT)
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        return gefs.get_preflight(client, pool, [(date, fcsts, None) for date
+                                                 in dates], data_root, False)
+
+@pytest.fixture
+def downloaded(tmp_path, gefs_bucket, quiet, monkeypatch):
+    # zero hour of a synthetic bucket downloaded into a root
+    monkeypatch.setattr(gefs, 'FCST_MAX', 6)
+    monkeypatch.setattr(gefs, 'PREFLIGHT', False)
+    server, keys = gefs_bucket([DATE], [0, 3, 6], msg_size=4096)
+    root = str(tmp_path / 'root')
+    assert quiet(main, server, root) == 0
+    sizes = data_files(root)
+    assert sizes and server.stats['bytes'] >= sum(sizes.values())
+    return server, root, sizes
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_resume_partial_files(downloaded, quiet):
+    # a rerun after an interruption resumes the partial files only
+    server, root, sizes = downloaded
+    paths = sorted(sizes)[::2]
+    cut = 0
+    for path in paths:
+        os.replace(path, gefs.part_path(path))
+        with open(gefs.part_path(path), 'r+b') as f:
+            f.truncate(sizes[path] // 2)
+
+        cut += sizes[path] - sizes[path] // 2
+
+    server.reset()
+    assert quiet(main, server, root, '--no-clob') == 0
+    assert data_files(root) == sizes
+    assert cut <= server.stats['bytes'] < sum([sizes[path] for path in paths])
+    assert quiet(mfst.verify_tree, root, 4, True) == {}
+
+def test_preflight_estimate(downloaded, tmp_path, quiet, monkeypatch):
+    # the estimate is the bytes of the tree, with and without listing
+    server, root, sizes = downloaded
+    empty = str(tmp_path / 'empty')
+    plan = quiet(get_preflight, server, empty)
+    assert (plan['transfer'], plan['transfer_bytes']) ==\
+            (len(sizes), sum(sizes.values()))
+
+    monkeypatch.setattr(gefs, 'IF_LIST', False)
+    server.reset()
+    plan = quiet(get_preflight, server, empty)
+    assert (plan['transfer'], plan['transfer_bytes']) ==\
+            (len(sizes), sum(sizes.values()))
+    assert not server.stats.get('list')
+
+    # a third of the files removed from the tree
+    paths = sorted(sizes)[::3]
+    for path in paths:
+        os.remove(path)
+
+    plan = quiet(get_preflight, server, root)
+    cut = sum([sizes[path] for path in paths])
+    assert plan['present'] == len(sizes) - len(paths)
+    assert plan['transfer_bytes'] == plan['growth_bytes'] == cut
+    assert preflight.past_rate(os.path.join(root, gefs.TELEMETRY),
+                               'object')[0]
+
+def test_refused_short_of_free_space(downloaded, quiet, monkeypatch):
+    server, root, sizes = downloaded
+    os.remove(sorted(sizes)[0])
+    monkeypatch.setattr(gefs, 'MIN_FREE_GB',
+                        preflight.free_bytes(root) / 1e9 + 1)
+    monkeypatch.setattr(gefs, 'PREFLIGHT', True)
+    server.reset()
+    assert quiet(main, server, root, '--no-clob') == 1
+    assert not server.stats.get('get')
+
+##################################################################################
+# end
@@ -0,0 +1,140 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the era-aware key resolver in gefs_keys.py.  The table ERA_CASES
+# covers each boundary of the bucket layout eras, and for a zero hour on each
+# side of every era boundary, download_GEFS_AWS.py must download the same
+# objects when listing the base path of the zero hour as when resolving the
+# keys directly.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import concurrent.futures
+from datetime import datetime as dt
+
+import pytest
+
+import download_GEFS_AWS as gefs
+import gefs_keys
+from aws_s3 import S3Client
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# (zero hour, member, forecast hour, stream, resolution, expected key / error)
+ERA_CASES = [
+    (dt(2016, 12, 31, 18), 1, 6, 'a', '1p00', ValueError),
+    (dt(2017, 1, 1, 0), 0, 6, 'a', '1p00',
+     'gefs.20170101/00/pgrb2a/gec00.t00z.pgrb2af06'),
+    (dt(2018, 7, 26, 18), 20, 120, 'b', '1p00',
+     'gefs.20180726/18/pgrb2b/gep20.t18z.pgrb2bf120'),
+    (dt(2018, 7, 26, 18), 1, 6, 'a', '0p50', ValueError),
+    (dt(2018, 7, 27, 0), 1, 6, 'a', '1p00',
+     'gefs.20180727/00/pgrb2a/gep01.t00z.pgrb2af06'),
+    (dt(2018, 7, 27, 0), 1, 6, 'a', '0p50',
+     'gefs.20180727/00/pgrb2ap5/gep01.t00z.pgrb2a.0p50.f006'),
+    (dt(2018, 7, 27, 0), 21, 6, 'a', '0p50', ValueError),
+    (dt(2017, 6, 1, 12), 3, 9, 'b', None,
+     'gefs.20170601/12/pgrb2b/gep03.t12z.pgrb2bf09'),
+    (dt(2018, 7, 27, 0), 1, 6, 'a', None,
+     'gefs.20180727/00/pgrb2ap5/gep01.t00z.pgrb2a.0p50.f006'),
+    (dt(2020, 9, 22, 18), 5, 384, 'b', '0p50',
+     'gefs.20200922/18/pgrb2bp5/gep05.t18z.pgrb2b.0p50.f384'),
+    (dt(2020, 9, 23, 0), 30, 3, 'b', '0p50',
+     'gefs.20200923/00/atmos/pgrb2bp5/gep30.t00z.pgrb2b.0p50.f003'),
+    (dt(2020, 9, 23, 0), 0, 0, 'a', '0p50',
+     'gefs.20200923/00/atmos/pgrb2ap5/gec00.t00z.pgrb2a.0p50.f000'),
+    (dt(2020, 9, 23, 0), 1, 3, 'a', '1p00', ValueError),
+    (dt(2020, 9, 23, 0), 31, 3, 'a', '0p50', ValueError),
+    (dt(2020, 9, 23, 0), 31, 3, 'a', None, ValueError),
+]
+
+# zero hours on each side of the era boundaries with the resolution of the
+# bucket, resolved with the default GEFS_RES
+BOUNDARIES = [
+    (dt(2018, 7, 26, 18), '1p00'),
+    (dt(2018, 7, 27, 0), '0p50'),
+    (dt(2020, 9, 22, 18), '0p50'),
+    (dt(2020, 9, 23, 0), '0p50'),
+]
+
+def get_keys(server, down_dir, date, fcsts, if_list):
+    # download one zero hour, returning the downloaded keys
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    manifest = {}
+    os.makedirs(down_dir)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        gefs.get_cycle(client, pool, date, fcsts, down_dir, manifest,
+                       if_clob=True, if_ctrl=True, if_pert=True,
+                       if_list=if_list)
+
+    return set(manifest)
+
+##################################################################################
+# TESTS
+##################################################################################
+
+@pytest.mark.parametrize('cycle, member, fhr, stream, res, expect', ERA_CASES)
+def test_era_cases(cycle, member, fhr, stream, res, expect):
+    if expect is ValueError:
+        with pytest.raises(ValueError):
+            gefs_keys.gefs_key(cycle, member, fhr, stream, res)
+
+    else:
+        assert gefs_keys.gefs_key(cycle, member, fhr, stream, res) == expect
+
+@pytest.mark.parametrize('date, res', BOUNDARIES)
+def test_listing_matches_resolver(date, res, tmp_path, gefs_bucket, quiet,
+                                  monkeypatch):
+    # the same objects are downloaded with and without listing the zero hour
+    monkeypatch.setattr(gefs, 'GEFS_RES', None)
+    n_pert = gefs_keys.gefs_layout(date)['n_pert']
+    server, keys = gefs_bucket([date], [0, 3], n_pert=n_pert, res=res)
+    listed = quiet(get_keys, server, str(tmp_path / 'list') + '/', date,
+                   ['0', '3'], True)
+    resolved = quiet(get_keys, server, str(tmp_path / 'resolve') + '/', date,
+                     ['0', '3'], False)
+    assert listed == resolved == set(keys)
+
+##################################################################################
+# end
@@ -0,0 +1,147 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the hedged reads of gefs_mirrors.py.  A zero hour of a synthetic
+# GEFS bucket is downloaded with download_GEFS_AWS.py over a primary, a mirror
+# and a local archive, and every file must pass the audit of its manifest
+# with a mirror event for each object.  Objects missing from a source must be
+# read from the next, and a partial file must be resumed from a mirror with
+# only its remaining bytes.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import json
+from datetime import datetime as dt
+
+import download_GEFS_AWS as gefs
+import manifest as mfst
+from aws_s3 import S3Client
+from gefs_mirrors import Mirrors, HTTPMirror, LocalArchive
+from fake_s3 import start_server
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+DATE = dt(2021, 1, 26, 0)
+
+def bucket_dir(server):
+    # directory of the objects of the bucket served
+    return os.path.join(server.root, 'noaa-gefs-pds')
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_mirrored_download(tmp_path, gefs_bucket, quiet, monkeypatch):
+    # files hedged over a mirror and an archive pass the manifest audit
+    primary, keys = gefs_bucket([DATE], [0, 3])
+    mirror = start_server(primary.root, latency=0.01)
+    monkeypatch.setattr(gefs, 'FCST_MAX', 3)
+    monkeypatch.setattr(gefs, 'MIRROR_STATS', str(tmp_path / 'mirrors.json'))
+    root = str(tmp_path / 'root')
+    try:
+        assert quiet(gefs.main, ['--start', DATE.isoformat(), '--stop',
+                                 DATE.isoformat(), '--data-root', root,
+                                 '--endpoint-url', primary.url, '--workers',
+                                 '4', '--mirror', mirror.url +
+                                 '/noaa-gefs-pds', '--mirror',
+                                 bucket_dir(mirror)]) == 0
+
+    finally:
+        mirror.shutdown()
+
+    assert quiet(mfst.verify_tree, root, 4, True) == {}
+
+    with open(os.path.join(root, gefs.TELEMETRY)) as f:
+        recs = [json.loads(line) for line in f]
+
+    n_files = len([fname for fname in os.listdir(os.path.join(root, '20210126'))
+                   if not fname.startswith('.')])
+    assert 0 < n_files == len([rec for rec in recs if rec['event'] ==
+                               'mirror'])
+
+def test_failover(tmp_path, gefs_bucket):
+    # objects are read from the primary after a source missing them
+    primary, keys = gefs_bucket([DATE], [0])
+    empty = str(tmp_path / 'empty')
+    os.makedirs(empty)
+    client = Mirrors([LocalArchive(empty), S3Client('noaa-gefs-pds',
+                      endpoint_url=primary.url)], hedge_s=60)
+    for i, key in enumerate(keys[:3]):
+        path = str(tmp_path / ('failover%s'%i))
+        meta = {'size': None, 'etag': None}
+        client.resume_object(key, path, meta)
+        with open(path, 'rb') as f, open(os.path.join(bucket_dir(primary),
+                                                      key), 'rb') as g:
+            assert f.read() == g.read()
+
+        assert meta['source'] == primary.url + '/noaa-gefs-pds'
+
+    client.close()
+    assert client.stats[LocalArchive(empty).name]['failures'] >= 1
+
+def test_resume_from_mirror(tmp_path, gefs_bucket):
+    # a partial file is resumed from the mirror with the remaining bytes only
+    mirror, keys = gefs_bucket([DATE], [0])
+    path = str(tmp_path / 'resume')
+    with open(os.path.join(bucket_dir(mirror), keys[0]), 'rb') as f:
+        body = f.read()
+
+    with open(path, 'wb') as f:
+        f.write(body[:len(body) // 2])
+
+    client = Mirrors([HTTPMirror(mirror.url + '/noaa-gefs-pds'),
+                      LocalArchive(bucket_dir(mirror))], hedge_s=60)
+    mirror.reset()
+    nbytes = client.resume_object(keys[0], path, {'size': len(body),
+                                                  'etag': None})
+    client.close()
+    with open(path, 'rb') as f:
+        assert f.read() == body
+
+    assert nbytes == len(body) - len(body) // 2 == mirror.stats['bytes']
+    assert not [fname for fname in os.listdir(str(tmp_path)) if
+                fname.startswith('resume.')]
+
+##################################################################################
+# end
@@ -0,0 +1,121 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the Cylc xtrigger of gefs_ready.py.  A zero hour of a synthetic GEFS
+# bucket is downloaded with download_GEFS_AWS.py, and the xtrigger must be
+# satisfied for a downloaded member only once all of its files are recorded
+# and whole, and return (False, {}) for corrupt manifests and zero hours
+# which are not available.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import concurrent.futures
+from datetime import datetime as dt
+
+import download_GEFS_AWS as gefs
+import manifest as mfst
+from aws_s3 import S3Client
+from gefs_ready import gefs_ready
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# zero hour of the background of the cycle point POINT with a lag of 6 hours
+DATE = dt(2021, 1, 26, 0)
+POINT = '20210126T0600Z'
+
+def get_plan(server, data_root):
+    # download the forecast hours 0 to 12 of the zero hour into data_root
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        return gefs.get_plan(client, pool, [(DATE, ['0', '3', '6', '9', '12'],
+                                             None)], data_root)
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_ready_after_download(tmp_path, gefs_bucket, quiet):
+    server, keys = gefs_bucket([DATE], list(range(0, 13, 3)))
+    root = str(tmp_path)
+    assert gefs_ready(POINT, 1, root, lag=6, fcst_hrs=12) == (False, {})
+
+    assert not quiet(get_plan, server, root)
+    ready, results = gefs_ready(POINT, 1, root, lag=6, fcst_hrs=12)
+    assert ready and results == {'bkg_dir': os.path.join(root, '20210126'),
+                                 'bkg_strt_dt': '2021012600'}
+
+    # members and forecast hours not downloaded
+    assert not gefs_ready(POINT, 3, root, lag=6, fcst_hrs=12)[0]
+    assert not gefs_ready(POINT, 1, root, lag=6, fcst_hrs=15)[0]
+
+def test_truncated_file_not_ready(tmp_path, gefs_bucket, quiet):
+    server, keys = gefs_bucket([DATE], list(range(0, 13, 3)))
+    root = str(tmp_path)
+    quiet(get_plan, server, root)
+    manifest = mfst.read_manifest(os.path.join(root, '20210126'))
+    path = [entry['path'] for key, entry in manifest.items() if
+            '/gep01.' in key][0]
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    assert not gefs_ready(POINT, 1, root, lag=6, fcst_hrs=12)[0]
+
+def test_corrupt_manifest(tmp_path, capsys):
+    down_dir = tmp_path / '20210126'
+    down_dir.mkdir()
+    (down_dir / mfst.MANIFEST).write_text('{"version": 1, "obj')
+    assert gefs_ready(POINT, 1, str(tmp_path), lag=6) == (False, {})
+    assert 'gefs_ready: ' in capsys.readouterr().out
+
+def test_unavailable_cycle(tmp_path, capsys):
+    # zero hours before the first layout era of the bucket
+    down_dir = tmp_path / '20161231'
+    down_dir.mkdir()
+    mfst.write_manifest(str(down_dir), {'key': {'size': 1, 'etag': None,
+                                                'path': 'x'}})
+    assert gefs_ready('20161231T1800Z', 1, str(tmp_path)) == (False, {})
+    assert 'gefs_ready: ' in capsys.readouterr().out
+
+##################################################################################
+# end
@@ -0,0 +1,166 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the shared GRIB cache of grib_cache.py.  Zero hours served from the
+# cache must hold the files of a plain download, files linked to evicted cache
+# entries must be downloaded again, eviction must bring the cache under its
+# quota, and processes adding the same object must not race on the link.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import concurrent.futures
+import filecmp
+import multiprocessing
+from datetime import datetime as dt
+
+import pytest
+
+import download_GEFS_AWS as gefs
+from aws_s3 import S3Client
+from grib_cache import Cache
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+DATE = dt(2021, 1, 26, 0)
+
+def data_files(root):
+    # relative paths of the data files under root, without manifests
+    paths = []
+    for head, dirs, files in os.walk(root):
+        for fname in files:
+            if not fname.startswith('.'):
+                paths.append(os.path.relpath(os.path.join(head, fname), root))
+
+    return sorted(paths)
+
+def get_cycle(server, root, manifest=None, **kwargs):
+    # download the zero hour into root
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    os.makedirs(root, exist_ok=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        gefs.get_cycle(client, pool, DATE, ['0', '3'], root,
+                       {} if manifest is None else manifest, if_ctrl=True,
+                       if_pert=True, **kwargs)
+
+def put_many(root, src, key):
+    # put the same object into a shared cache many times
+    cache = Cache(root)
+    for i in range(50):
+        cache.put(key, src)
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_cached_downloads_match(tmp_path, gefs_bucket, quiet):
+    # experiments served from the cache hold the files of a plain download
+    server, keys = gefs_bucket([DATE], [0, 3])
+    cache = Cache(str(tmp_path / 'cache'))
+    plain = str(tmp_path / 'plain') + '/'
+    quiet(get_cycle, server, plain, if_clob=True)
+    paths = data_files(plain)
+    assert paths
+
+    n_bytes = []
+    for i in range(2):
+        server.reset()
+        root = str(tmp_path / ('exp%s'%i)) + '/'
+        quiet(get_cycle, server, root, if_clob=True, cache=cache)
+        n_bytes.append(server.stats['bytes'])
+        assert data_files(root) == paths
+        match, mismatch, errors = filecmp.cmpfiles(plain, root, paths,
+                                                   shallow=False)
+        assert not mismatch and not errors
+
+    # the second experiment is served without transferring the objects
+    assert n_bytes[1] < n_bytes[0] / 10
+
+@pytest.mark.parametrize('if_list', [True, False])
+def test_dangling_link_downloaded_again(if_list, tmp_path, gefs_bucket, quiet):
+    # a file linked to an evicted cache entry is downloaded again
+    server, keys = gefs_bucket([DATE], [0, 3])
+    root = str(tmp_path / 'root') + '/'
+    manifest = {}
+    quiet(get_cycle, server, root, manifest, if_clob=False)
+    path = os.path.join(root, data_files(root)[0])
+    os.remove(path)
+    os.symlink(str(tmp_path / 'cache' / 'evicted'), path)
+    quiet(get_cycle, server, root, manifest, if_clob=False, if_list=if_list)
+    assert os.path.isfile(path)
+
+def test_evict_to_quota(tmp_path):
+    cache = Cache(str(tmp_path / 'cache'))
+    for i in range(8):
+        src = str(tmp_path / ('src%s'%i))
+        with open(src, 'wb') as f:
+            f.write(os.urandom(1024))
+
+        assert cache.put('%02d'%i * 32, src)
+
+    n_entries, size = cache.usage()
+    assert n_entries == 8
+    cache.evict(size / 2)
+    assert cache.usage()[1] <= size / 2
+
+def test_concurrent_put(tmp_path):
+    # processes putting the same object leave one object and no side files
+    src = str(tmp_path / 'src')
+    with open(src, 'wb') as f:
+        f.write(os.urandom(1024))
+
+    root = str(tmp_path / 'cache')
+    Cache(root)
+    procs = [multiprocessing.Process(target=put_many, args=(root, src,
+             'ab' * 32)) for i in range(4)]
+    for proc in procs:
+        proc.start()
+
+    for proc in procs:
+        proc.join()
+
+    assert [proc.exitcode for proc in procs] == [0] * 4
+    assert os.listdir(os.path.join(root, 'objects', 'ab')) == ['ab' * 32]
+
+##################################################################################
+# end
@@ -0,0 +1,91 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the catalog of grib_catalog.py.  A synthetic tree of GEFS files in
+# the layout of download_GEFS_AWS.py is crawled into the catalog, which must
+# read only new or changed files when refreshed, agree with the file system on
+# the files missing from each cycle, and keep the resolutions apart.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+from datetime import datetime as dt
+from datetime import timedelta
+
+from grib_catalog import Catalog
+from bench_grib_catalog import write_tree, fs_missing
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_rebuild_and_missing(tmp_path):
+    cycles = [dt(2021, 1, 26, 0) + timedelta(hours=6 * i) for i in range(4)]
+    members, fhrs = [1, 2, 3], [0, 3, 6]
+    data_root = str(tmp_path / 'GEFS')
+    paths = write_tree(data_root, cycles, members, fhrs, 2, 256)
+
+    catalog = Catalog(str(tmp_path / 'catalog.sqlite'))
+    n_read, n_same, n_gone = catalog.rebuild(data_root, 4)
+    assert (n_read, n_same, n_gone) == (len(paths), 0, 0)
+
+    # unchanged files are not read again
+    n_read, n_same, n_gone = catalog.rebuild(data_root, 4)
+    assert (n_read, n_same, n_gone) == (0, len(paths), 0)
+
+    # a removed file is picked up by the crawl and reported missing
+    os.remove(paths[len(paths) // 2])
+    assert catalog.rebuild(data_root, 4)[2] == 1
+    cat = [catalog.missing(cycle.strftime('%Y%m%d%H'), members, fhrs)
+           for cycle in cycles]
+    assert cat == [fs_missing(data_root, cycle, members, fhrs) for cycle in
+                   cycles]
+    assert sum([len(miss) for miss in cat]) == 1
+
+    # the 0.5 degree files do not complete a cycle at 1 degree
+    assert len(catalog.missing(cycles[0].strftime('%Y%m%d%H'), members, fhrs,
+                               res='1p00')) == 2 * len(members) * len(fhrs)
+
+    assert catalog.summary()[0][3] == (len(paths) - 1) * 2
+    catalog.close()
+
+##################################################################################
+# end
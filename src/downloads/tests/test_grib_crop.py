@@ -0,0 +1,121 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the regional crop of grib_crop.py.  Synthetic global fields on
+# regular lat-lon grids with simple packing, with and without a bitmap, are
+# written as GRIB2 and GRIB1 files with random values of 12 and 16 bits and
+# north to south and south to north scanning.  The files are cropped to a West
+# Coast box plus a margin and to a box across the Greenwich meridian, and the
+# decoded values of every cropped message must agree with the original at
+# every grid point inside the box.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import random
+from datetime import datetime as dt
+
+import pytest
+
+import grib_split
+from grib_crop import crop_file, crop_spec, grid_values
+from bench_grib_crop import grib1_field, grib2_field
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# West Coast box and margin in degrees, and a box across the seam of the grids
+BOXES = [
+         ((25, 55, -150, -110), 2),
+         ((35, 60, -15, 20), 0),
+        ]
+
+# GRIB edition, bits per value and scanning mode of the synthetic fields
+KINDS = [(2, 16, 0x00), (2, 12, 0x40), (1, 16, 0x00), (1, 12, 0x40)]
+
+def write_file(path, edition, nbits, scan):
+    # file of a field without and a field with a bitmap on a 2.5 degree grid
+    with open(path, 'wb') as f:
+        for bitmap in [False, True]:
+            if edition == 2:
+                f.write(grib2_field(dt(2021, 1, 26), 144, 73, 2500000, nbits,
+                                    scan, bitmap=bitmap))
+            else:
+                f.write(grib1_field(dt(2019, 2, 8), 144, 73, 2500, nbits,
+                                    scan, bitmap=bitmap))
+
+def messages(path):
+    # bytes of the messages of a GRIB file
+    with open(path, 'rb') as f:
+        for offset, length, valid in grib_split.scan(path):
+            f.seek(offset)
+            yield f.read(length)
+
+##################################################################################
+# TESTS
+##################################################################################
+
+@pytest.mark.parametrize('edition, nbits, scan', KINDS)
+@pytest.mark.parametrize('box, margin', BOXES)
+def test_crop_agrees_inside_box(edition, nbits, scan, box, margin, tmp_path,
+                                quiet):
+    # the cropped values are the values of the original inside the box
+    random.seed(1)
+    src, dst = str(tmp_path / 'full.grib'), str(tmp_path / 'crop.grib')
+    write_file(src, edition, nbits, scan)
+    crop_box = [float(val) for val in crop_spec(box, margin)[5:].split('/')]
+    quiet(crop_file, src, dst, *crop_box)
+
+    south, north, west, east = [1000 * val for val in crop_box]
+    full, crop = list(messages(src)), list(messages(dst))
+    assert len(crop) == len(full)
+    for msg, cropped in zip(full, crop):
+        vals = grid_values(cropped)
+        inside = dict([(key, val) for key, val in grid_values(msg).items() if
+                       south <= key[0] <= north and
+                       (key[1] - west) % 360000 <= east - west])
+        assert vals and vals == inside
+
+    assert os.path.getsize(dst) < os.path.getsize(src)
+
+##################################################################################
+# end
@@ -0,0 +1,80 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the cycle split of grib_split.py.  Synthetic GRIB1 and GRIB2 files
+# with hourly messages over two days are split into six hourly cycle windows,
+# and each cycle file must hold exactly the messages valid at its cycle point.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+from datetime import datetime as dt
+from datetime import timedelta
+
+import pytest
+
+import grib_split
+from bench_grib_split import write_file
+
+##################################################################################
+# TESTS
+##################################################################################
+
+@pytest.mark.parametrize('edition', [1, 2])
+def test_split_cycles(edition, tmp_path):
+    # each cycle file holds the messages valid at its cycle point
+    strt = dt(2019, 2, 8)
+    path = str(tmp_path / ('2019-02-08--2019-02-09_ed%s.grib'%edition))
+    write_file(path, strt, 2, 3, 256, edition)
+    outs = grib_split.split_file(path, str(tmp_path / 'cycles'), 6)
+    assert len(outs) == 8
+
+    cycles = []
+    for out in outs:
+        cycle = dt.strptime(os.path.basename(os.path.dirname(out)), '%Y%m%d%H')
+        msgs = list(grib_split.scan(out))
+        assert len(msgs) == 3 and set([msg[2] for msg in msgs]) == {cycle}
+        cycles.append(cycle)
+
+    assert sorted(cycles) == [strt + timedelta(hours=6 * i) for i in range(8)]
+
+##################################################################################
+# end
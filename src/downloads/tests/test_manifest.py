@@ -0,0 +1,107 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the manifest of manifest.py.  Manifests written by several runs
+# must be merged unless replaced, and the audit of a tree must drop the
+# entries of files failing their check from the manifest and report the files
+# on disk without an entry.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+
+import manifest as mfst
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+def write_grib(path, body=b'GRIB' + bytes(8) + b'7777'):
+    # whole GRIB file for the checks of manifest.py
+    with open(path, 'wb') as f:
+        f.write(body)
+
+def record(manifest, down_dir, name):
+    # write a file and record it under the key name
+    path = os.path.join(down_dir, name)
+    write_grib(path)
+    mfst.record(manifest, {'key': name, 'size': 16, 'etag': None}, path)
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_write_merges(tmp_path):
+    # entries written by other runs are kept unless replaced
+    down_dir = str(tmp_path)
+    first, second = {}, {}
+    record(first, down_dir, 'a')
+    record(second, down_dir, 'b')
+    mfst.write_manifest(down_dir, first)
+    mfst.write_manifest(down_dir, second)
+    assert sorted(mfst.read_manifest(down_dir)) == ['a', 'b']
+
+    mfst.write_manifest(down_dir, second, replace=True)
+    assert sorted(mfst.read_manifest(down_dir)) == ['b']
+    assert os.listdir(down_dir).count(mfst.MANIFEST) == 1
+
+def test_verify_tree(tmp_path, quiet):
+    # failing entries are dropped and files without an entry are reported
+    down_dir = tmp_path / '20210126'
+    down_dir.mkdir()
+    manifest = {}
+    for name in ['a', 'b', 'c']:
+        record(manifest, str(down_dir), name)
+
+    mfst.write_manifest(str(down_dir), manifest)
+    write_grib(str(down_dir / 'b'), b'GRIB' + bytes(8))
+    os.remove(str(down_dir / 'c'))
+    write_grib(str(down_dir / 'stray'))
+
+    bad = quiet(mfst.verify_tree, str(tmp_path), 4, True)
+    assert sorted(bad) == [str(down_dir / name) for name in ['b', 'c',
+                                                             'stray']]
+    assert bad[str(down_dir / 'c')] == 'missing'
+    assert bad[str(down_dir / 'stray')].startswith('untracked')
+    assert sorted(mfst.read_manifest(str(down_dir))) == ['a']
+
+##################################################################################
+# end
@@ -0,0 +1,148 @@
+##################################################################################
+# Description
+##################################################################################
+# Tests of the transfer telemetry of telemetry.py in both download scripts.  A
+# zero hour of a synthetic GEFS bucket is downloaded with a telemetry log, and
+# the object events must account for every file and byte written.  ERA5
+# requests are scheduled over CDS accounts with credentials of the real form
+# against fake_cds.py, with the first ranged transfers dropped, and the log
+# must hold a request event for every request, the retries of the dropped
+# ranges, the summary event and no credential, replay to the same summary,
+# and the Prometheus textfile must be well formed.
+#
+##################################################################################
+# License Statement:
+##################################################################################
+# This software is Copyright © 2024 The Regents of the University of California.
+# All Rights Reserved. Permission to copy, modify, and distribute this software
+# and its documentation for educational, research and non-profit purposes,
+# without fee, and without a written agreement is hereby granted, provided that
+# the above copyright notice, this paragraph and the following three paragraphs
+# appear in all copies. Permission to make commercial use of this software may
+# be obtained by contacting:
+#
+#     Office of Innovation and Commercialization
+#     9500 Gilman Drive, Mail Code 0910
+#     University of California
+#     La Jolla, CA 92093-0910
+#     innovation@ucsd.edu
+#
+# This software program and documentation are copyrighted by The Regents of the
+# University of California. The software program and documentation are supplied
+# "as is", without any accompanying services from The Regents. The Regents does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL THE UNIVERSITY OF CALIFORNIA BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF THE UNIVERSITY OF CALIFORNIA HAS BEEN ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE. THE UNIVERSITY OF CALIFORNIA SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN “AS IS” BASIS, AND THE UNIVERSITY OF CALIFORNIA HAS NO
+# OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+# 
+# 
+##################################################################################
+# Imports
+##################################################################################
+import os
+import concurrent.futures
+import json
+import re
+from datetime import date
+from datetime import datetime as dt
+
+import download_ERA5 as era5
+import download_GEFS_AWS as gefs
+import cds_sched
+import fake_cds
+from aws_s3 import S3Client
+from telemetry import Telemetry, load
+
+##################################################################################
+# UTILITY METHODS
+##################################################################################
+
+# Prometheus sample line of the textfile format
+SAMPLE = re.compile(r'^[a-z_]+\{([a-z_]+="[^"]*",?)+\} [0-9.e+-]+$')
+
+def events(path):
+    # events of a JSON lines log
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+##################################################################################
+# TESTS
+##################################################################################
+
+def test_gefs_objects(tmp_path, gefs_bucket, quiet):
+    # the object events account for every file and byte written
+    day = dt(2021, 1, 26, 0)
+    server, keys = gefs_bucket([day], [0, 3])
+    root = str(tmp_path / 'root') + '/'
+    os.makedirs(root)
+    log = str(tmp_path / 'gefs.jsonl')
+    tel = Telemetry(log, prom=str(tmp_path / 'gefs.prom'), job='gefs')
+    client = S3Client('noaa-gefs-pds', endpoint_url=server.url)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        quiet(gefs.get_cycle, client, pool, day, ['0', '3'], root, {},
+              if_clob=True, if_ctrl=True, if_pert=True, telemetry=tel)
+
+    summ = tel.close()
+    paths = [os.path.join(root, fname) for fname in os.listdir(root) if not
+             fname.startswith('.')]
+    assert len([rec for rec in events(log) if rec['event'] == 'object']) ==\
+            len(paths) == len(keys)
+    assert summ['object']['bytes'] == sum([os.path.getsize(path) for path in
+                                           paths])
+    assert summ['list']['count'] == 1
+    assert events(log)[-1]['event'] == 'summary'
+
+def test_era5_requests(tmp_path, quiet, monkeypatch):
+    # requests with dropped ranges over accounts with credentials of the real
+    # form, which must not be written to the log
+    secrets = ['%s:%08x-1234-5678-9abc-%012x'%(1000 + i, i, 7 * i)
+               for i in range(2)]
+    monkeypatch.setattr(era5, 'CALL', 'surf_levels')
+    monkeypatch.setattr(era5, 'DATA_ROOT', str(tmp_path / 'era5') + '/')
+    monkeypatch.setattr(era5, 'N_CONNS', 2)
+    os.makedirs(era5.DATA_ROOT)
+    reqs = era5.get_reqs(date(2019, 2, 1), date(2019, 2, 3), 1, '00:00:00')
+    log, prom = str(tmp_path / 'era5.jsonl'), str(tmp_path / 'era5.prom')
+    tel = Telemetry(log, prom=prom, job='era5_surf_levels')
+    server = fake_cds.start_server(queue_s=0.2, run_s=0.3,
+                                   result_size=1024 * 1024, drops=2)
+    try:
+        done, failed = quiet(cds_sched.run_jobs, [key.encode('ascii') for key
+                             in secrets], reqs, lambda client, req:
+                             era5.get_file(client, req, era5.CALL,
+                                           telemetry=tel),
+                             url=server.api, poll_int=1, backoff_min=0.1,
+                             telemetry=tel)
+
+    finally:
+        server.shutdown()
+
+    summ = tel.close()
+    assert len(done) == len(reqs) == 3 and not failed
+    with open(log) as f:
+        text = f.read()
+
+    assert not [key for key in secrets if key.split(':')[1] in text]
+    assert summ['request']['count'] == len(reqs)
+    assert summ['retry']['retries'] == 2
+    assert summ['request']['seconds'].get('queue', 0) > 0
+    with open(prom) as f:
+        lines = [line for line in f.read().splitlines() if
+                 not line.startswith('#')]
+
+    assert lines and all([SAMPLE.match(line) for line in lines])
+    assert load(log).summary() == tel.summary()
+
+##################################################################################
+# end